@@ -23,7 +23,7 @@ setup(
     keywords="DMD Vialux",
     url="https://github.com/wavefronthsaping/ALP4lib",
     package_dir={"": "src"},
-    py_modules=["ALP4"],
+    py_modules=["ALP4", "ALP4patterns", "ALP4server", "ALP4sim"],
     long_description=long_description,
     classifiers=[
         "Programming Language :: Python :: 2",
@@ -7,14 +7,25 @@ Created on Wed Oct 05 15:48:53 2016
 """
 
 import ctypes as ct
+import collections
+import hashlib
+import json
+import os
 import platform
+import struct
+import threading
+import time
 import numpy as np
 import six
 
-if six.PY3:
-    import winreg as _winreg
-else:
-    import _winreg
+try:
+    if six.PY3:
+        import winreg as _winreg
+    else:
+        import _winreg
+except ImportError:
+    # Not on Windows: only a stand-in library such as ALPSimulator can be used
+    _winreg = None
 
 # Standard parameter
 ALP_DEFAULT = 0
@@ -23,6 +34,14 @@ ALP_ENABLE = 1
 ## Return codes
 ALP_OK = 0x00000000  # Successfull execution
 ALP_NOT_ONLINE = 1001  # The specified ALP has not been found or is not ready.
+ALP_NOT_IDLE = 1002  # The ALP is not in idle state.
+ALP_NOT_AVAILABLE = 1003  # The specified ALP identifier is not valid.
+ALP_NOT_READY = 1004  # The specified ALP is already allocated.
+ALP_PARM_INVALID = 1005  # One of the parameters is invalid.
+ALP_MEMORY_FULL = 1007  # The requested memory is not available.
+ALP_SEQ_IN_USE = 1008  # The sequence specified is currently in use.
+ALP_ERROR_COMM = 1011  # Communication error.
+ALP_DEVICE_REMOVED = 1012  # The specified ALP has been removed.
 
 ##	parameters ##
 
@@ -235,6 +254,8 @@ ALP_PROJ_INVERSION = 2306  # Reverse dark into bright */
 ALP_PROJ_UPSIDE_DOWN = 2307  # Turn the pictures upside down */
 
 ALP_PROJ_STATE = 2400  # Inquire only */
+ALP_PROJ_ACTIVE = 1200  # ALP projection active */
+ALP_PROJ_IDLE = 1201  # no projection active */
 
 ALP_FLUT_MAX_ENTRIES9 = 2324  # Inquire FLUT size */
 # Transfer FLUT memory to ALP. Use AlpProjControlEx and pUserStructPtr of type tFlutWrite. */
@@ -388,9 +409,17 @@ ALP_ERRORS = {
 }
 
 
+def _errorMessage(error_code):
+    return ALP_ERRORS.get(error_code, "Unknown error code {0}.".format(error_code))
+
+
 class ALPError(Exception):
     def __init__(self, error_code):
-        super(ALPError, self).__init__(ALP_ERRORS[error_code])
+        super(ALPError, self).__init__(_errorMessage(error_code))
+        self.code = error_code
+
+    def __reduce__(self):
+        return (ALPError, (self.code,))
 
 
 def afficheur(bitPlane):
@@ -411,61 +440,2391 @@ def afficheur(bitPlane):
     return display
 
 
-def img_to_bitplane(imgArray):
-    """
-    Convert a binary image into a bitplane.
-    """
-    bitPlane = np.packbits(imgArray).tolist()
-    return bitPlane
+def img_to_bitplane(imgArray):
+    """
+    Convert a binary image into a bitplane.
+    """
+    bitPlane = np.packbits(imgArray).tolist()
+    return bitPlane
+
+
+def shear_offsets(nRows, angle, pivot=0):
+    """
+    Compute the per-row horizontal shifts shearing an image by a given angle.
+
+    Usage: shear_offsets(nRows, angle, pivot = 0)
+
+    PARAMETERS
+    ----------
+    nRows : int
+            Number of rows of the DMD.
+    angle : float
+            Shear angle in degrees, positive angles shift the rows below the pivot to the right.
+    pivot : int, optional
+            Row with no relative shift. By default, the top row.
+
+    RETURNS
+    -------
+    offsets : 1D ndarray
+              Shift of each row in pixels, between 0 and 511 (the smallest shift is 0).
+    """
+    rows = np.arange(nRows) - pivot
+    offsets = np.rint(np.tan(np.deg2rad(angle)) * rows).astype(np.int64)
+    offsets -= offsets.min()
+    if offsets.max() > 511:
+        raise ValueError("Shear too large: shifts must not exceed 511 pixels.")
+    return offsets
+
+
+def shear_table(offsets, rowOffset=0):
+    """
+    Create the tAlpShearTable structure for ALP_X_SHEAR from per-row shifts.
+
+    Usage: shear_table(offsets, rowOffset = 0)
+
+    PARAMETERS
+    ----------
+    offsets : 1D array
+              Shift of each row in pixels, between 0 and 511.
+    rowOffset : int, optional
+                First row of the table to write.
+
+    RETURNS
+    -------
+    table : tAlpShearTable
+    """
+    offsets = np.asarray(offsets)
+    if offsets.ndim != 1 or rowOffset + offsets.size > 2048:
+        raise ValueError(
+            "offsets must be a 1D array of at most 2048 - rowOffset values."
+        )
+    if offsets.size and (offsets.min() < 0 or offsets.max() > 511):
+        raise ValueError("Shifts must be between 0 and 511.")
+    table = tAlpShearTable()
+    table.nOffset = rowOffset
+    table.nSize = offsets.size
+    np.ctypeslib.as_array(table.nShiftDistance)[: offsets.size] = offsets
+    return table
+
+
+def synch_gate(mask=None, every=None, offset=0, polarity=1):
+    """
+    Create the tAlpDynSynchOutGate structure of a synch output (ALP_DEV_DYN_SYNCH_OUT[1..3]_GATE),
+    which pulses only on the frames enabled in a pattern repeated every Period frames.
+
+    Usage: synch_gate(mask = None, every = None, offset = 0, polarity = 1)
+
+    PARAMETERS
+    ----------
+    mask : sequence of bool, optional
+           Enable of each frame of the pattern, 1 to 16 frames.
+    every : int, optional
+            Decimation: pulse on one frame out of every (1 to 16), instead of mask.
+    offset : int, optional
+             Frame of the pattern pulsed with every.
+    polarity : int, optional
+               1: active pulse is high, 0: active pulse is low.
+
+    Without mask and every, the output is disabled (tri-state).
+
+    RETURNS
+    -------
+    gate : tAlpDynSynchOutGate
+    """
+    if mask is not None and every is not None:
+        raise ValueError("Give either mask or every.")
+    if polarity not in (0, 1):
+        raise ValueError("polarity must be 0 or 1.")
+    if every is not None:
+        if not 1 <= every <= 16:
+            raise ValueError("every must be between 1 and 16.")
+        if not 0 <= offset < every:
+            raise ValueError("offset must be between 0 and every - 1.")
+        mask = [k == offset for k in range(every)]
+    gate = tAlpDynSynchOutGate()
+    gate.Polarity = polarity
+    if mask is None:
+        gate.Period = 0
+        return gate
+    mask = [int(bool(enable)) for enable in mask]
+    if not 1 <= len(mask) <= 16:
+        raise ValueError("The gate pattern must have 1 to 16 frames.")
+    gate.Period = len(mask)
+    gate.Gate[: len(mask)] = mask
+    return gate
+
+
+def gate_frames(gate, nbFrames):
+    """
+    Indices of the frames among the first nbFrames on which a synch output gate pulses.
+
+    Usage: gate_frames(gate, nbFrames)
+    """
+    if gate.Period == 0:
+        return np.zeros(0, dtype=np.int64)
+    pattern = np.array(gate.Gate[: gate.Period], dtype=bool)
+    return np.flatnonzero(np.resize(pattern, nbFrames))
+
+
+def dmd_mask_bitmap(mask, blockHeight=16, reduce="any"):
+    """
+    Reduce a full resolution mask to the block bitmap of ALP_DMD_MASK_WRITE.
+    Each bit of the bitmap controls a block of 16 x blockHeight pixels (16 columns).
+    Rows of blocks are packed 8 blocks per byte, the leftmost block in bit 7.
+
+    Usage: dmd_mask_bitmap(mask, blockHeight = 16, reduce = 'any')
+
+    PARAMETERS
+    ----------
+    mask : 2D array
+           Boolean mask of the DMD size (nSizeY, nSizeX), True for the pixels to display.
+    blockHeight : int, optional
+                  16 (ALP_DMD_MASK_16X16) or 8 (ALP_DMD_MASK_16X8, XGA only).
+    reduce : string, optional
+             'any': a block is displayed if any of its pixels is True,
+             'all': a block is displayed only if all its pixels are True.
+
+    RETURNS
+    -------
+    bitmap : 2D ndarray of uint8
+             One row per row of blocks.
+    """
+    if blockHeight not in (8, 16):
+        raise ValueError("blockHeight must be 8 or 16.")
+    if reduce not in ("any", "all"):
+        raise ValueError('reduce must be one of "any" or "all"')
+    mask = np.asarray(mask, dtype=bool)
+    nRows = -(-mask.shape[0] // blockHeight)
+    nCols = -(-mask.shape[1] // 16)
+    # Incomplete blocks at the edges are padded with the neutral value of the reduction
+    padded = np.full((nRows * blockHeight, nCols * 16), reduce == "all", dtype=bool)
+    padded[: mask.shape[0], : mask.shape[1]] = mask
+    blocks = padded.reshape(nRows, blockHeight, nCols, 16)
+    if reduce == "any":
+        blocks = blocks.any(axis=(1, 3))
+    else:
+        blocks = blocks.all(axis=(1, 3))
+    return np.packbits(blocks, axis=1)
+
+
+def packed_row_bytes(nSizeX, DMDType=None):
+    """
+    Number of bytes of one pixel row in the packed binary data formats
+    (ALP_DATA_BINARY_TOPDOWN and ALP_DATA_BINARY_BOTTOMUP).
+
+    Usage: packed_row_bytes(nSizeX, DMDType = None)
+    """
+    if DMDType == ALP_DMDTYPE_SXGA_PLUS:
+        # One pixel row occupies 176 bytes, the first byte is ignored
+        return 176
+    if DMDType in (
+        ALP_DMDTYPE_1080P_095A,
+        ALP_DMDTYPE_WUXGA_096A,
+        ALP_DMDTYPE_DISCONNECT,
+    ):
+        # One pixel row occupies 256 bytes
+        return 256
+    return nSizeX // 8
+
+
+def pack_binary(imgArray, nSizeX, DMDType=None, bit=7):
+    """
+    Pack binary images into the ALP_DATA_BINARY_TOPDOWN format (bit 7 of a byte is the leftmost of 8 pixels).
+
+    Usage: pack_binary(imgArray, nSizeX, DMDType = None, bit = 7)
+
+    PARAMETERS
+    ----------
+    imgArray : array
+               Images of nSizeX columns, of any shape (e.g. 1D stream or (nbImg, nSizeY, nSizeX)).
+    nSizeX : int
+             Number of columns of the DMD.
+    DMDType : int, optional
+              Type of DMD, for the DMDs whose rows are padded (see packed_row_bytes).
+    bit : int, optional
+          Bit of the pixel values giving the binary value: 7 for MSB aligned data (default), 0 for LSB aligned data.
+
+    RETURNS
+    -------
+    packed : 2D ndarray of uint8
+             One packed row per row of the images.
+    """
+    rows = np.asarray(imgArray).reshape(-1, nSizeX)
+    if rows.dtype != np.bool_:
+        rows = np.bitwise_and(rows.astype(np.uint8, copy=False), 1 << bit)
+    return _padPacked(np.packbits(rows, axis=1), nSizeX, DMDType)
+
+
+def _padPacked(packed, nSizeX, DMDType):
+    # Place packed rows of nSizeX / 8 bytes in the row layout of the DMD (see packed_row_bytes)
+    rowBytes = packed_row_bytes(nSizeX, DMDType)
+    if rowBytes == packed.shape[1]:
+        return packed
+    padded = np.zeros((packed.shape[0], rowBytes), dtype=np.uint8)
+    if DMDType == ALP_DMDTYPE_SXGA_PLUS:
+        padded[:, 1 : 1 + packed.shape[1]] = packed
+    else:
+        padded[:, : packed.shape[1]] = packed
+    return padded
+
+
+def weighted_bitplanes(imgArray, bitDepth=8, dropBits=0):
+    """
+    Decompose gray-scale images into binary bit planes weighted by 2^k, most significant plane first.
+    Displaying each plane for a duration proportional to its weight reproduces the gray levels.
+
+    Usage: weighted_bitplanes(imgArray, bitDepth = 8, dropBits = 0)
+
+    PARAMETERS
+    ----------
+    imgArray : array
+               Images of integer values between 0 and 2^bitDepth - 1, shape (nbImg, nSizeY, nSizeX) or (nSizeY, nSizeX).
+    bitDepth : int, optional
+               Number of bits of the pixel values.
+    dropBits : int, optional
+               Number of low-order bit planes to drop, trading gray levels for speed.
+
+    RETURNS
+    -------
+    planes : 4D ndarray of uint8
+             Binary frames (0 or 255) of shape (nbImg, bitDepth - dropBits, nSizeY, nSizeX).
+    weights : 1D ndarray
+              Relative duration of each plane, 1 for the least significant plane kept.
+    """
+    if not 0 <= dropBits < bitDepth <= 16:
+        raise ValueError("Bit depths must satisfy 0 <= dropBits < bitDepth <= 16.")
+    imgArray = np.asarray(imgArray)
+    if imgArray.ndim == 2:
+        imgArray = imgArray[np.newaxis]
+    bits = np.arange(bitDepth - 1, dropBits - 1, -1)
+    planes = np.right_shift(
+        imgArray[:, np.newaxis].astype(np.uint16, copy=False),
+        bits[np.newaxis, :, np.newaxis, np.newaxis].astype(np.uint16),
+    )
+    planes = np.bitwise_and(planes, 1).astype(np.uint8)
+    np.multiply(planes, 255, out=planes)
+    return planes, 2 ** (bits - dropBits)
+
+
+# Directory where the device profiles (upload tuning, capabilities) are stored, one file per device serial number
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".ALP4lib")
+
+
+def _profilePath(kind, serial):
+    return os.path.join(PROFILE_DIR, "{0}_{1}.json".format(kind, serial))
+
+
+def _loadProfile(kind, serial):
+    """
+    Load a device profile saved with _saveProfile, return None if it does not exist or cannot be read.
+    """
+    try:
+        with open(_profilePath(kind, serial)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _saveProfile(kind, serial, profile):
+    """
+    Save a device profile, printing a warning instead of raising if PROFILE_DIR is not writable
+    (the profile is only a cache).
+    """
+    try:
+        if not os.path.isdir(PROFILE_DIR):
+            os.makedirs(PROFILE_DIR)
+        with open(_profilePath(kind, serial), "w") as f:
+            json.dump(profile, f, indent=1, sort_keys=True)
+    except (IOError, OSError) as error:
+        print(
+            "Cannot save the {0} profile in {1}.\n{2}".format(kind, PROFILE_DIR, error)
+        )
+        return False
+    return True
+
+
+def _timingKey(bitDepth, binMode):
+    # Key of the timing limits in the capabilities profile, the binary mode only matters for binary display
+    if bitDepth > 1:
+        return str(bitDepth)
+    return "1:{0}".format(binMode)
+
+
+# High resolution clock used for instrumentation (time.perf_counter is not available in Python 2)
+_clock = getattr(time, "perf_counter", time.time)
+
+# Dll functions whose second argument is a SequenceId
+_SEQUENCE_FUNCTIONS = (
+    "AlpSeqFree",
+    "AlpSeqPut",
+    "AlpSeqPutEx",
+    "AlpSeqTiming",
+    "AlpSeqControl",
+    "AlpSeqInquire",
+    "AlpProjStart",
+    "AlpProjStartCont",
+)
+
+
+def _argValue(arg):
+    """
+    Return the integer value of a ctypes or Python argument, -1 if it has none.
+    """
+    value = getattr(arg, "value", arg)
+    if isinstance(value, six.integer_types):
+        return value
+    return -1
+
+
+def _structCopy(pointer):
+    """
+    Return a copy of the structure passed to a *ControlEx function (by reference, as a pointer or directly),
+    None if it cannot be read.
+    """
+    obj = getattr(pointer, "_obj", None)
+    if obj is None:
+        obj = getattr(pointer, "contents", pointer)
+    if not isinstance(obj, ct.Structure):
+        return None
+    return type(obj).from_buffer_copy(obj)
+
+
+class ALPTracer(object):
+    """
+    Record the calls made to the ALP dll by an ALP4 object.
+
+    Each call is stored in a preallocated ring buffer (numpy structured array) with its start and end
+    time stamps, thread, SequenceId, number of pictures (PicLoad, or nbImg for AlpSeqAlloc),
+    number of bytes transferred and return code.
+    When the buffer is full, the oldest calls are overwritten.
+
+    Usage:
+    tracer = DMD.EnableTrace(capacity = 65536)
+    ...
+    tracer.ToChromeTrace('trace.json')
+    hist = tracer.Histograms()
+
+    PARAMETERS
+    ----------
+    capacity : int
+               Number of calls that can be stored in the buffer.
+    """
+
+    dtype = np.dtype(
+        [
+            ("func", np.int16),
+            ("thread", np.int64),
+            ("start", np.float64),
+            ("end", np.float64),
+            ("SequenceId", np.int64),
+            ("PicLoad", np.int64),
+            ("nbytes", np.int64),
+            ("ret", np.int32),
+        ]
+    )
+
+    def __init__(self, capacity=65536):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=self.dtype)
+        # Names of the dll functions, indexed by the 'func' field of the buffer
+        self.functions = []
+        self._funcIndex = {}
+        # Total number of calls recorded (including overwritten ones)
+        self.count = 0
+        # Number of bytes of the next data transfer of each thread, set by SeqPut and SeqPutEx
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.t0 = _clock()
+
+    @property
+    def nbytes(self):
+        return getattr(self._local, "nbytes", 0)
+
+    @nbytes.setter
+    def nbytes(self, value):
+        self._local.nbytes = value
+
+    def _index(self, name):
+        index = self._funcIndex.get(name)
+        if index is None:
+            index = len(self.functions)
+            self.functions.append(name)
+            self._funcIndex[name] = index
+        return index
+
+    def Record(self, name, start, end, args, ret):
+        """
+        Store one dll call in the buffer.
+
+        Usage: Record(name, start, end, args, ret)
+        """
+        SequenceId = PicLoad = -1
+        nbytes = 0
+        if name in _SEQUENCE_FUNCTIONS:
+            SequenceId = _argValue(args[1])
+            if name == "AlpSeqPut":
+                PicLoad = _argValue(args[3])
+            elif name == "AlpSeqPutEx":
+                PicLoad = args[2].PicLoad
+            if name in ("AlpSeqPut", "AlpSeqPutEx"):
+                nbytes = self.nbytes
+                self.nbytes = 0
+        elif name == "AlpSeqAlloc":
+            # SequenceId is returned by reference
+            SequenceId = _argValue(getattr(args[3], "_obj", None))
+            PicLoad = _argValue(args[2])
+        with self._lock:
+            self.buffer[self.count % self.capacity] = (
+                self._index(name),
+                threading.current_thread().ident or 0,
+                start,
+                end,
+                SequenceId,
+                PicLoad,
+                nbytes,
+                _argValue(ret),
+            )
+            self.count += 1
+
+    def Calls(self):
+        """
+        Return the recorded calls in chronological order.
+
+        RETURNS
+        -------
+        calls : numpy structured array
+                Array of dtype ALPTracer.dtype.
+        """
+        with self._lock:
+            if self.count <= self.capacity:
+                return self.buffer[: self.count].copy()
+            head = self.count % self.capacity
+            return np.concatenate([self.buffer[head:], self.buffer[:head]])
+
+    def Clear(self):
+        """
+        Discard all recorded calls.
+        """
+        with self._lock:
+            self.count = 0
+        self.nbytes = 0
+
+    def ToChromeTrace(self, filename=None):
+        """
+        Export the recorded calls in the Chrome trace-event format
+        (can be opened with chrome://tracing or https://ui.perfetto.dev).
+
+        Usage: ToChromeTrace(filename = None)
+
+        PARAMETERS
+        ----------
+        filename : string, optional
+                   If specified, the trace is written to this file as JSON.
+
+        RETURNS
+        -------
+        trace : dict
+                Trace-event dictionary.
+        """
+        calls = self.Calls()
+        events = []
+        for call in calls:
+            events.append(
+                {
+                    "name": self.functions[call["func"]],
+                    "cat": "ALP",
+                    "ph": "X",
+                    "ts": float(call["start"] - self.t0) * 1e6,
+                    "dur": float(call["end"] - call["start"]) * 1e6,
+                    "pid": 0,
+                    "tid": int(call["thread"]),
+                    "args": {
+                        "SequenceId": int(call["SequenceId"]),
+                        "PicLoad": int(call["PicLoad"]),
+                        "bytes": int(call["nbytes"]),
+                        "ret": int(call["ret"]),
+                    },
+                }
+            )
+        trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if filename is not None:
+            with open(filename, "w") as f:
+                json.dump(trace, f)
+        return trace
+
+    def Histograms(self, bins=None):
+        """
+        Compute the latency histogram of each dll function.
+
+        Usage: Histograms(bins = None)
+
+        PARAMETERS
+        ----------
+        bins : int or 1D array, optional
+               Bins in microseconds, passed to numpy.histogram.
+               By default, 50 logarithmic bins from 1 microsecond to 10 seconds.
+
+        RETURNS
+        -------
+        histograms : dict
+                     For each function name, a tuple (counts, bin_edges) with bin edges in microseconds.
+        """
+        if bins is None:
+            bins = np.logspace(0, 7, 51)
+        calls = self.Calls()
+        latency = (calls["end"] - calls["start"]) * 1e6
+        histograms = {}
+        for index, name in enumerate(self.functions):
+            selected = latency[calls["func"] == index]
+            if selected.size:
+                histograms[name] = np.histogram(selected, bins=bins)
+        return histograms
+
+    def Summary(self):
+        """
+        Summarize the latency of each dll function.
+
+        RETURNS
+        -------
+        summary : dict
+                  For each function name, a dict with the number of calls, the total, mean, median
+                  and 99th percentile latency in microseconds, and the number of bytes transferred.
+        """
+        calls = self.Calls()
+        latency = (calls["end"] - calls["start"]) * 1e6
+        summary = {}
+        for index, name in enumerate(self.functions):
+            mask = calls["func"] == index
+            selected = latency[mask]
+            if selected.size:
+                summary[name] = {
+                    "calls": int(selected.size),
+                    "total": float(selected.sum()),
+                    "mean": float(selected.mean()),
+                    "median": float(np.median(selected)),
+                    "p99": float(np.percentile(selected, 99)),
+                    "bytes": int(calls["nbytes"][mask].sum()),
+                }
+        return summary
+
+
+class _TracedALPLib(object):
+    """
+    Wrap the ALP dll so that every function call is recorded by an ALPTracer.
+    """
+
+    def __init__(self, lib, tracer):
+        self._lib = lib
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        func = getattr(self._lib, name)
+        tracer = self._tracer
+
+        def traced(*args):
+            start = _clock()
+            ret = func(*args)
+            tracer.Record(name, start, _clock(), args, ret)
+            return ret
+
+        traced.__name__ = name
+        # Cache the wrapper, __getattr__ is only called once per function
+        setattr(self, name, traced)
+        return traced
+
+
+class _RecoveringALPLib(object):
+    """
+    Wrap the ALP dll so that a call failing with a communication error (ALP_ERROR_COMM, ALP_DEVICE_REMOVED)
+    triggers ALP4.Recover and is then retried once.
+    """
+
+    def __init__(self, lib, alp):
+        self._lib = lib
+        self._alp = alp
+
+    def __getattr__(self, name):
+        func = getattr(self._lib, name)
+        alp = self._alp
+
+        def recovering(*args):
+            # Size of the data of an upload, used by the first attempt and by the uploads of the recovery
+            nbytes = alp._transferSize()
+            ret = func(*args)
+            if (
+                _argValue(ret) in (ALP_ERROR_COMM, ALP_DEVICE_REMOVED)
+                and not alp._recovering
+            ):
+                # The ALP_ID and the SequenceId arguments are updated in place by the recovery
+                alp.Recover(_argValue(ret))
+                alp._transferHint(nbytes)
+                ret = func(*args)
+            return ret
+
+        recovering.__name__ = name
+        setattr(self, name, recovering)
+        return recovering
+
+
+# Kinds of the arguments stored by CallRecorder
+(
+    _ARG_NONE,
+    _ARG_INT,
+    _ARG_FLOAT,
+    _ARG_SIMPLE,
+    _ARG_SIMPLE_FLOAT,
+    _ARG_STRUCT,
+    _ARG_REF,
+    _ARG_DATA,
+) = range(8)
+# Records of the call files: name of a function or of a ctypes type, dll call
+_RECORD_NAME, _RECORD_CALL = 1, 2
+_CALL_FILE_MAGIC = b"ALP4CALL"
+_CALL_FILE_VERSION = 1
+
+
+class CallRecorder(object):
+    """
+    Record the dll calls made through ALP4 to a compact binary file, to replay them later with CallReplayer.
+
+    For each call, the file holds the function, the arguments (values, content of the structures and of the
+    variables passed by reference after the call), the return code, the start time and the duration.
+    The image data passed to AlpSeqPut and AlpSeqPutEx is stored as its size and SHA-1 hash,
+    and optionally in full.
+
+    Usage:
+    CallRecorder(path, payloads = False)
+
+    PARAMETERS
+    ----------
+    path : string
+           File to write.
+    payloads : bool, optional
+               Store the image data, so that the replay uploads the same content.
+    """
+
+    def __init__(self, path, payloads=False):
+        self.path = path
+        self.payloads = payloads
+        # Number of calls recorded
+        self.count = 0
+        self._names = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        self._file.write(_CALL_FILE_MAGIC + struct.pack("<H", _CALL_FILE_VERSION))
+        self.t0 = _clock()
+
+    @property
+    def nbytes(self):
+        # Number of bytes of the next data transfer of the thread, set by SeqPut and SeqPutEx
+        return getattr(self._local, "nbytes", 0)
+
+    @nbytes.setter
+    def nbytes(self, value):
+        self._local.nbytes = value
+
+    def _name(self, name):
+        index = self._names.get(name)
+        if index is None:
+            index = self._names[name] = len(self._names)
+            encoded = name.encode("ascii")
+            self._file.write(
+                struct.pack("<BHH", _RECORD_NAME, index, len(encoded)) + encoded
+            )
+        return index
+
+    def _encode(self, arg, nbytes):
+        if arg is None:
+            return struct.pack("<B", _ARG_NONE)
+        if isinstance(arg, float):
+            return struct.pack("<Bd", _ARG_FLOAT, arg)
+        if isinstance(arg, six.integer_types):
+            return struct.pack("<Bq", _ARG_INT, arg)
+        if isinstance(arg, ct.c_void_p):
+            # Image data
+            data = ct.string_at(arg.value, nbytes) if (arg.value and nbytes) else b""
+            encoded = (
+                struct.pack("<BQ", _ARG_DATA, len(data)) + hashlib.sha1(data).digest()
+            )
+            if self.payloads:
+                return encoded + struct.pack("<B", 1) + data
+            return encoded + struct.pack("<B", 0)
+        if isinstance(arg, ct._SimpleCData):
+            typeIndex = self._name(type(arg).__name__)
+            if isinstance(arg.value, float):
+                return struct.pack("<BHd", _ARG_SIMPLE_FLOAT, typeIndex, arg.value)
+            return struct.pack("<BHq", _ARG_SIMPLE, typeIndex, arg.value)
+        obj = getattr(arg, "_obj", None)
+        if obj is not None:
+            # Passed by reference (ctypes.byref)
+            kind = _ARG_REF
+        else:
+            kind, obj = _ARG_STRUCT, arg
+        raw = ct.string_at(ct.addressof(obj), ct.sizeof(obj))
+        return struct.pack("<BHI", kind, self._name(type(obj).__name__), len(raw)) + raw
+
+    def Record(self, name, start, end, args, ret):
+        """
+        Write one dll call to the file.
+
+        Usage: Record(name, start, end, args, ret)
+        """
+        nbytes = 0
+        if name in ("AlpSeqPut", "AlpSeqPutEx"):
+            nbytes = self.nbytes
+            self.nbytes = 0
+        with self._lock:
+            encoded = b"".join(self._encode(arg, nbytes) for arg in args)
+            self._file.write(
+                struct.pack(
+                    "<BHddqB",
+                    _RECORD_CALL,
+                    self._name(name),
+                    start - self.t0,
+                    end - start,
+                    _argValue(ret),
+                    len(args),
+                )
+                + encoded
+            )
+            self.count += 1
+
+    def Close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _RecordingALPLib(object):
+    """
+    Wrap the ALP dll so that every function call is written by a CallRecorder.
+    """
+
+    def __init__(self, lib, recorder):
+        self._lib = lib
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        func = getattr(self._lib, name)
+        recorder = self._recorder
+
+        def recorded(*args):
+            start = _clock()
+            ret = func(*args)
+            recorder.Record(name, start, _clock(), args, ret)
+            return ret
+
+        recorded.__name__ = name
+        setattr(self, name, recorded)
+        return recorded
+
+
+class CallReplayer(object):
+    """
+    Replay the dll calls of a file written by CallRecorder against a library (ALPSimulator or the ALP dll),
+    and compare the latency of each function and the upload throughput with the recording.
+
+    The device and sequence identifiers returned by AlpDevAlloc and AlpSeqAlloc during the replay
+    replace the recorded ones in the following calls. Image data which was not stored is replaced by zeros.
+
+    Usage:
+    CallReplayer(path)
+
+    ATTRIBUTES
+    ----------
+    calls : list
+            Recorded calls (name, start, duration, return code, arguments).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = []
+        self._read()
+
+    def _read(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if data[: len(_CALL_FILE_MAGIC)] != _CALL_FILE_MAGIC:
+            raise ValueError("{0} is not a call recording.".format(self.path))
+        names = {}
+        pos = len(_CALL_FILE_MAGIC) + 2
+
+        def unpack(fmt):
+            values = struct.unpack_from(fmt, data, pos)
+            return values, pos + struct.calcsize(fmt)
+
+        while pos < len(data):
+            (record,), pos = unpack("<B")
+            if record == _RECORD_NAME:
+                (index, length), pos = unpack("<HH")
+                names[index] = data[pos : pos + length].decode("ascii")
+                pos += length
+                continue
+            (func, start, duration, ret, nArgs), pos = unpack("<HddqB")
+            args = []
+            for _ in range(nArgs):
+                (kind,), pos = unpack("<B")
+                if kind == _ARG_NONE:
+                    args.append((kind,))
+                elif kind == _ARG_INT:
+                    (value,), pos = unpack("<q")
+                    args.append((kind, value))
+                elif kind == _ARG_FLOAT:
+                    (value,), pos = unpack("<d")
+                    args.append((kind, value))
+                elif kind in (_ARG_SIMPLE, _ARG_SIMPLE_FLOAT):
+                    (typeIndex, value), pos = unpack(
+                        "<Hq" if kind == _ARG_SIMPLE else "<Hd"
+                    )
+                    args.append((_ARG_SIMPLE, names[typeIndex], value))
+                elif kind in (_ARG_STRUCT, _ARG_REF):
+                    (typeIndex, length), pos = unpack("<HI")
+                    args.append((kind, names[typeIndex], data[pos : pos + length]))
+                    pos += length
+                elif kind == _ARG_DATA:
+                    (nbytes,), pos = unpack("<Q")
+                    digest = data[pos : pos + 20]
+                    pos += 20
+                    (stored,), pos = unpack("<B")
+                    payload = None
+                    if stored:
+                        payload = data[pos : pos + nbytes]
+                        pos += nbytes
+                    args.append((kind, nbytes, digest, payload))
+                else:
+                    raise ValueError("Corrupted call recording.")
+            self.calls.append((names[func], start, duration, ret, args))
+
+    @staticmethod
+    def _ctype(name):
+        ctype = getattr(ct, name, None)
+        if ctype is None:
+            ctype = globals().get(name)
+        return ctype
+
+    def _build(self, arg, buffers):
+        kind = arg[0]
+        if kind == _ARG_NONE:
+            return None
+        if kind in (_ARG_INT, _ARG_FLOAT):
+            return arg[1]
+        if kind == _ARG_SIMPLE:
+            return (self._ctype(arg[1]) or ct.c_long)(arg[2])
+        if kind in (_ARG_STRUCT, _ARG_REF):
+            ctype = self._ctype(arg[1])
+            if ctype is not None:
+                obj = ctype.from_buffer_copy(arg[2])
+            else:
+                # Unknown type (e.g. array): pass a copy of the same memory
+                obj = ct.create_string_buffer(arg[2], len(arg[2]))
+            return ct.byref(obj) if kind == _ARG_REF else obj
+        _, nbytes, _, payload = arg
+        if payload is not None:
+            buffer = ct.create_string_buffer(payload, nbytes)
+        else:
+            buffer = buffers.get(nbytes)
+            if buffer is None:
+                buffer = buffers[nbytes] = ct.create_string_buffer(max(nbytes, 1))
+        return ct.cast(buffer, ct.c_void_p)
+
+    @staticmethod
+    def _value(arg):
+        # Integer value of a recorded argument (e.g. an identifier returned by reference)
+        if arg[0] in (_ARG_INT, _ARG_SIMPLE):
+            return arg[-1]
+        if arg[0] == _ARG_REF:
+            return struct.unpack_from("<q" if len(arg[2]) >= 8 else "<i", arg[2])[0]
+        return None
+
+    def Recorded(self):
+        """
+        Return the recorded calls as an ALPTracer, to use its analysis functions (Summary, ToChromeTrace...).
+        """
+        tracer = ALPTracer(max(len(self.calls), 1))
+        for name, start, duration, ret, args in self.calls:
+            for arg in args:
+                if arg[0] == _ARG_DATA:
+                    tracer.nbytes = arg[1]
+            tracer.Record(name, start, start + duration, self._traceArgs(args), ret)
+        return tracer
+
+    def _traceArgs(self, args):
+        # Arguments with the values read by ALPTracer.Record
+        traced = []
+        for arg in args:
+            if arg[0] == _ARG_REF and len(arg[2]) in (4, 8):
+                traced.append(ct.byref(ct.c_long(self._value(arg))))
+            elif arg[0] == _ARG_STRUCT and arg[1] == "tAlpLinePut":
+                traced.append(tAlpLinePut.from_buffer_copy(arg[2]))
+            elif arg[0] in (_ARG_INT, _ARG_SIMPLE):
+                traced.append(arg[-1])
+            else:
+                traced.append(None)
+        return traced
+
+    def Replay(self, library, pace=False):
+        """
+        Call the recorded functions of library with the recorded arguments.
+
+        Usage: Replay(library, pace = False)
+
+        PARAMETERS
+        ----------
+        library : object
+                  ALPSimulator, or the ALP dll (ctypes.CDLL).
+        pace : bool, optional
+               Keep the recorded time between the start of the calls (e.g. to reproduce waits on the display).
+
+        RETURNS
+        -------
+        report : dict
+                 'functions': for each function, the number of calls and the recorded and replayed
+                 mean latency in microseconds and their ratio,
+                 'recorded', 'replayed': total duration, time spent in the dll, bytes uploaded
+                 and upload throughput (bytes per second in AlpSeqPut and AlpSeqPutEx),
+                 'mismatches': number of calls whose return code differs from the recording,
+                 'tracer': ALPTracer of the replayed calls.
+        """
+        tracer = ALPTracer(max(len(self.calls), 1))
+        devices = {}
+        sequences = {}
+        buffers = {}
+        mismatches = 0
+        t0 = _clock()
+        for name, start, duration, ret, args in self.calls:
+            args = list(args)
+            # Use the identifiers of the replay
+            if name != "AlpDevAlloc" and args and self._value(args[0]) in devices:
+                args[0] = args[0][:-1] + (devices[self._value(args[0])],)
+            if name in _SEQUENCE_FUNCTIONS and self._value(args[1]) in sequences:
+                args[1] = args[1][:-1] + (sequences[self._value(args[1])],)
+            callArgs = [self._build(arg, buffers) for arg in args]
+            for arg in args:
+                if arg[0] == _ARG_DATA:
+                    tracer.nbytes = arg[1]
+
+            if pace:
+                delay = t0 + start - _clock()
+                if delay > 0:
+                    time.sleep(delay)
+            callStart = _clock()
+            replayed = getattr(library, name)(*callArgs)
+            tracer.Record(name, callStart, _clock(), callArgs, replayed)
+
+            if _argValue(replayed) != ret:
+                mismatches += 1
+            if name == "AlpDevAlloc":
+                devices[self._value(args[2])] = callArgs[2]._obj.value
+            elif name == "AlpSeqAlloc":
+                sequences[self._value(args[3])] = callArgs[3]._obj.value
+
+        recorded = self.Recorded()
+        report = {
+            "functions": {},
+            "recorded": self._totals(
+                recorded, self.calls[-1][1] + self.calls[-1][2] if self.calls else 0.0
+            ),
+            "replayed": self._totals(tracer, _clock() - t0),
+            "mismatches": mismatches,
+            "tracer": tracer,
+        }
+        replayedSummary = tracer.Summary()
+        for name, summary in recorded.Summary().items():
+            mean = replayedSummary[name]["mean"]
+            report["functions"][name] = {
+                "calls": summary["calls"],
+                "recorded": summary["mean"],
+                "replayed": mean,
+                "ratio": mean / summary["mean"] if summary["mean"] else float("inf"),
+            }
+        return report
+
+    @staticmethod
+    def _totals(tracer, duration):
+        summary = tracer.Summary()
+        uploads = [
+            summary[name] for name in ("AlpSeqPut", "AlpSeqPutEx") if name in summary
+        ]
+        nbytes = sum(upload["bytes"] for upload in uploads)
+        uploadTime = sum(upload["total"] for upload in uploads) * 1e-6
+        return {
+            "duration": duration,
+            "busy": sum(function["total"] for function in summary.values()) * 1e-6,
+            "bytes": nbytes,
+            "throughput": nbytes / uploadTime if uploadTime > 0 else 0.0,
+        }
+
+
+class _NoLock(object):
+    """
+    Context manager doing nothing, used in place of the locks when thread safety is not enabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+_NO_LOCK = _NoLock()
+
+
+def _seqKey(SequenceId):
+    """
+    Return the integer identifier of a sequence given as a ctypes c_long or an int.
+    """
+    return getattr(SequenceId, "value", SequenceId)
+
+
+class SequenceInfo(object):
+    """
+    Description of a sequence allocated in the ALP memory.
+
+    ATTRIBUTES
+    ----------
+    SequenceId : ctypes c_long
+                 Sequence identifier.
+    nbImg : int
+            Number of images requested for the sequence.
+    capacity : int
+               Number of images allocated in the ALP memory (>= nbImg when the sequence comes from a SequencePool).
+    bitDepth : int
+               Bit depth of the images.
+    controls : dict
+               Values set with SeqControl, by control type.
+    timing : tuple or None
+             Last arguments of SetTiming (illuminationTime, pictureTime, synchDelay, synchPulseWidth, triggerInDelay).
+    dataAlign : int
+                Alignment of unpacked data (ALP_DATA_MSB_ALIGN or ALP_DATA_LSB_ALIGN), used when SeqPut packs binary data.
+    uploads : list
+              Host copies of the data loaded with SeqPut, (PicOffset, nbImg, data), kept by ALP4.EnableRecovery.
+    source : callable or string or None
+             Source of the content of the sequence used by ALP4.Recover instead of the host copies,
+             see ALP4.SetSequenceSource.
+    """
+
+    __slots__ = (
+        "SequenceId",
+        "nbImg",
+        "capacity",
+        "bitDepth",
+        "controls",
+        "timing",
+        "dataAlign",
+        "uploads",
+        "source",
+    )
+
+    def __init__(self, SequenceId, nbImg, bitDepth):
+        self.SequenceId = SequenceId
+        self.nbImg = nbImg
+        self.capacity = nbImg
+        self.bitDepth = bitDepth
+        self.controls = {}
+        self.timing = None
+        self.dataAlign = ALP_DATA_MSB_ALIGN
+        self.uploads = []
+        self.source = None
+
+    def Retain(self, PicOffset, nbImg, data):
+        """
+        Keep a host copy of uploaded data, dropping the older copies it overwrites entirely.
+        """
+        end = PicOffset + nbImg
+        self.uploads = [
+            upload
+            for upload in self.uploads
+            if not (PicOffset <= upload[0] and upload[0] + upload[1] <= end)
+        ]
+        self.uploads.append((PicOffset, nbImg, data))
+
+    @property
+    def footprint(self):
+        """
+        ALP memory used by the sequence, in binary pictures (same unit as ALP_AVAIL_MEMORY).
+        """
+        return self.capacity * self.bitDepth
+
+    def __repr__(self):
+        return "SequenceInfo(SequenceId={0}, nbImg={1}, capacity={2}, bitDepth={3})".format(
+            _seqKey(self.SequenceId), self.nbImg, self.capacity, self.bitDepth
+        )
+
+
+# Values restored by SequencePool when a released sequence is reused
+_SEQ_CONTROL_DEFAULTS = {
+    ALP_SEQ_REPEAT: 1,
+    ALP_BIN_MODE: ALP_BIN_NORMAL,
+    ALP_DATA_FORMAT: ALP_DATA_MSB_ALIGN,
+}
+
+
+class SequencePool(object):
+    """
+    Keep released sequences allocated in the ALP memory to reuse them for later allocations,
+    avoiding the AlpSeqFree/AlpSeqAlloc round-trip when sequences of identical shape are allocated repeatedly.
+
+    A released sequence is reused for a request with the same bit depth and at most the same number of images,
+    the smallest compatible sequence being chosen (best fit). When it is larger than requested,
+    ALP_FIRSTFRAME and ALP_LASTFRAME restrict the display to the requested images.
+    The sequence controls changed by SeqControl are restored to their default values before reuse,
+    and the host copies or the source kept to restore its content after a recovery are dropped.
+    The timing has to be set again with SetTiming.
+
+    The pool is used by ALP4.SeqAlloc and ALP4.FreeSeq once enabled with ALP4.EnablePool.
+
+    PARAMETERS
+    ----------
+    alp : ALP4
+          Device controller.
+    maxMemory : int, optional
+                High-water mark of the memory used by the sequences allocated through the pool (in use and idle),
+                in binary pictures. Idle sequences are freed, oldest first, to stay below it.
+                By default, idle sequences are only freed when the ALP memory is full.
+    """
+
+    def __init__(self, alp, maxMemory=None):
+        self._alp = alp
+        self.maxMemory = maxMemory
+        # Idle sequences, oldest released first
+        self.idle = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def memory(self):
+        """
+        Memory used by all allocated sequences (in use and idle), in binary pictures.
+        """
+        inUse = sum(info.footprint for info in self._alp._seqInfo.values())
+        return inUse + sum(info.footprint for info in self.idle)
+
+    def _evict(self, info):
+        self.idle.remove(info)
+        self.evictions += 1
+        self._alp._freeSeq(info.SequenceId)
+
+    def _makeRoom(self, footprint):
+        if self.maxMemory is None:
+            return
+        memory = self.memory
+        while self.idle and memory + footprint > self.maxMemory:
+            info = self.idle[0]
+            memory -= info.footprint
+            self._evict(info)
+
+    def Acquire(self, nbImg, bitDepth):
+        """
+        Return a sequence for nbImg images of bit depth bitDepth, reusing an idle sequence if possible.
+
+        Usage: Acquire(nbImg, bitDepth)
+
+        RETURNS
+        -------
+        info : SequenceInfo
+               Description of the sequence.
+        """
+        best = None
+        for info in self.idle:
+            if (
+                info.bitDepth == bitDepth
+                and info.capacity >= nbImg
+                and (best is None or info.capacity < best.capacity)
+            ):
+                best = info
+        if best is not None:
+            self.idle.remove(best)
+            self.hits += 1
+            self._reset(best, nbImg)
+            return best
+
+        self.misses += 1
+        self._makeRoom(nbImg * bitDepth)
+        try:
+            return self._alp._allocSeq(nbImg, bitDepth)
+        except ALPError as e:
+            # Memory full: free the idle sequences and try again
+            if e.code != ALP_MEMORY_FULL or not self.idle:
+                raise
+            self.Clear()
+            return self._alp._allocSeq(nbImg, bitDepth)
+
+    def _reset(self, info, nbImg):
+        alp = self._alp
+        controls = info.controls
+        info.controls = {}
+        info.timing = None
+        info.dataAlign = ALP_DATA_MSB_ALIGN
+        # The content belongs to the previous owner
+        info.uploads = []
+        info.source = None
+        for controlType in controls:
+            if controlType in (ALP_FIRSTFRAME, ALP_LASTFRAME):
+                continue
+            if controlType == ALP_BITNUM:
+                value = info.bitDepth
+            else:
+                value = _SEQ_CONTROL_DEFAULTS.get(controlType, ALP_DEFAULT)
+            alp._seqControl(info.SequenceId, controlType, value)
+        if (
+            nbImg != info.nbImg
+            or ALP_FIRSTFRAME in controls
+            or ALP_LASTFRAME in controls
+        ):
+            alp._seqControl(info.SequenceId, ALP_FIRSTFRAME, 0)
+            alp._seqControl(info.SequenceId, ALP_LASTFRAME, nbImg - 1)
+            if nbImg != info.capacity:
+                info.controls[ALP_FIRSTFRAME] = 0
+                info.controls[ALP_LASTFRAME] = nbImg - 1
+        info.nbImg = nbImg
+
+    def Release(self, info):
+        """
+        Put a sequence that is no longer used in the pool.
+
+        Usage: Release(info)
+        """
+        self.idle.append(info)
+        if self.maxMemory is not None and self.memory > self.maxMemory:
+            self._makeRoom(0)
+
+    def Clear(self):
+        """
+        Free all the idle sequences.
+
+        Usage: Clear()
+        """
+        while self.idle:
+            self._evict(self.idle[0])
+
+
+class ClosedLoopRunner(object):
+    """
+    Run an iterative optimization loop (display a candidate, read the detector, update)
+    with the upload of the next candidate overlapped with the display of the current one.
+
+    Two sequences are used alternatively: while the candidate of iteration i is displayed from one sequence,
+    the candidate of iteration i+1 is generated and uploaded into the other one.
+    As a consequence, the candidate of iteration i+1 is generated before the measurement of iteration i is read,
+    the generator has to tolerate this one-iteration lag.
+
+    Usage:
+    runner = ClosedLoopRunner(DMD, generate, readout, pictureTime = 1000)
+    measurements = runner.Run(nIter = 1000)
+    print(runner.stats)
+
+    PARAMETERS
+    ----------
+    alp : ALP4
+          Initialized device controller.
+    generate : callable
+               generate(iteration) returns the image data of the candidate (same format as for SeqPut).
+    readout : callable
+              readout(iteration) returns the detector measurement for the candidate displayed at this iteration.
+              It is called after the display is started and the next candidate is uploaded.
+    nbImg : int, optional
+            Number of images of each candidate. By default, 1.
+    bitDepth : int, optional
+               Bit depth of the candidates. By default, 1.
+    illuminationTime, pictureTime : int, optional
+                                    Timing of the candidates in microseconds, see ALP4.SetTiming.
+    trigger : int, optional
+              If specified (ALP_LEVEL_HIGH, ALP_LEVEL_LOW, ALP_EDGE_RISING or ALP_EDGE_FALLING), frames are
+              advanced by the trigger input using ALP_PROJ_STEP instead of the master timing.
+
+    ATTRIBUTES
+    ----------
+    stats : dict
+            Statistics of the last run: number of iterations, total time (s), iterations per second,
+            time spent generating, uploading, reading out and waiting for the device,
+            and host idle fraction (time waiting for the device / total time).
+    """
+
+    def __init__(
+        self,
+        alp,
+        generate,
+        readout,
+        nbImg=1,
+        bitDepth=1,
+        illuminationTime=None,
+        pictureTime=None,
+        trigger=None,
+    ):
+        self.alp = alp
+        self.generate = generate
+        self.readout = readout
+        self.nbImg = nbImg
+        self.bitDepth = bitDepth
+        self.illuminationTime = illuminationTime
+        self.pictureTime = pictureTime
+        self.trigger = trigger
+        self.stats = {}
+
+    def Run(self, nIter):
+        """
+        Run nIter iterations of the loop.
+
+        Usage: Run(nIter)
+
+        RETURNS
+        -------
+        measurements : list
+                       Values returned by readout for each iteration.
+        """
+        alp = self.alp
+        seqs = []
+        measurements = []
+        tGenerate = tUpload = tReadout = tWait = 0.0
+
+        start = _clock()
+        try:
+            for _ in range(2):
+                SequenceId = alp.SeqAlloc(nbImg=self.nbImg, bitDepth=self.bitDepth)
+                seqs.append(SequenceId)
+                alp.SetTiming(
+                    SequenceId,
+                    illuminationTime=self.illuminationTime,
+                    pictureTime=self.pictureTime,
+                )
+            if self.trigger is not None:
+                alp.ProjControl(ALP_PROJ_STEP, self.trigger)
+
+            if nIter > 0:
+                t0 = _clock()
+                imgData = self.generate(0)
+                t1 = _clock()
+                alp.SeqPut(imgData, SequenceId=seqs[0], autoPack=True)
+                tGenerate += t1 - t0
+                tUpload += _clock() - t1
+
+            for iteration in range(nIter):
+                alp.Run(seqs[iteration % 2], loop=False)
+                if iteration + 1 < nIter:
+                    # Prepare the next candidate while the current one is displayed
+                    t0 = _clock()
+                    imgData = self.generate(iteration + 1)
+                    t1 = _clock()
+                    alp.SeqPut(
+                        imgData, SequenceId=seqs[(iteration + 1) % 2], autoPack=True
+                    )
+                    tGenerate += t1 - t0
+                    tUpload += _clock() - t1
+                t0 = _clock()
+                measurements.append(self.readout(iteration))
+                t1 = _clock()
+                alp.Wait()
+                tReadout += t1 - t0
+                tWait += _clock() - t1
+        except Exception:
+            alp.Halt()
+            raise
+        finally:
+            if self.trigger is not None:
+                alp.ProjControl(ALP_PROJ_STEP, ALP_DEFAULT)
+            for SequenceId in seqs:
+                alp.FreeSeq(SequenceId)
+
+        total = _clock() - start
+        self.stats = {
+            "iterations": nIter,
+            "time": total,
+            "iterationsPerSecond": nIter / total if total > 0 else float("inf"),
+            "generateTime": tGenerate,
+            "uploadTime": tUpload,
+            "readoutTime": tReadout,
+            "waitTime": tWait,
+            "hostIdleFraction": tWait / total if total > 0 else 0.0,
+        }
+        return measurements
+
+
+class SchedulePlan(object):
+    """
+    Sequences and queue entries displaying a list of (pattern, duration), see compile_schedule.
+
+    ATTRIBUTES
+    ----------
+    bitDepth : int
+               Bit depth of the sequences.
+    sequences : list of tuple
+                (pictureTime, patterns) of each sequence: the frames of a sequence share the same picture time
+                and are only uploaded once.
+    steps : list of list
+            Queue entries [sequence index, first frame, last frame, repeat], played with
+            ALP_FIRSTFRAME, ALP_LASTFRAME and ALP_SEQ_REPEAT.
+    SequenceIds : list
+                  Allocated sequences, set by ALP4.LoadSchedule.
+    binMode : int
+              ALP_BIN_MODE of the binary sequences (ALP_BIN_NORMAL or ALP_BIN_UNINTERRUPTED).
+    """
+
+    def __init__(self, bitDepth, sequences, steps, binMode=ALP_BIN_NORMAL):
+        self.bitDepth = bitDepth
+        self.sequences = sequences
+        self.steps = steps
+        self.binMode = binMode
+        self.SequenceIds = None
+
+    @property
+    def nbFrames(self):
+        """
+        Number of frames to upload.
+        """
+        return sum(len(patterns) for _, patterns in self.sequences)
+
+    @property
+    def duration(self):
+        """
+        Total display time in microseconds.
+        """
+        return sum(
+            self.sequences[seq][0] * (last - first + 1) * repeat
+            for seq, first, last, repeat in self.steps
+        )
+
+    def __repr__(self):
+        return "SchedulePlan({0} sequences, {1} frames, {2} steps)".format(
+            len(self.sequences), self.nbFrames, len(self.steps)
+        )
+
+
+def compile_schedule(items, bitDepth=1, minPictureTime=None, maxPictureTime=None):
+    """
+    Compile a list of patterns with individual display durations into a minimal set of sequences and queue entries.
+
+    Frames with the same duration share a sequence, identical patterns are stored once,
+    consecutive frames of a sequence are played as one sub-range (ALP_FIRSTFRAME, ALP_LASTFRAME)
+    and consecutive repetitions of a sub-range use ALP_SEQ_REPEAT.
+
+    Usage: compile_schedule(items, bitDepth = 1, minPictureTime = None, maxPictureTime = None)
+
+    PARAMETERS
+    ----------
+    items : iterable of (pattern, duration)
+            Patterns (arrays of one DMD frame) and display durations in microseconds.
+    bitDepth : int, optional
+               Bit depth of the sequences.
+    minPictureTime, maxPictureTime : int, optional
+                                     Limits of the picture time (ALP_MIN_PICTURE_TIME, ALP_MAX_PICTURE_TIME),
+                                     a ValueError is raised for durations outside these limits.
+
+    RETURNS
+    -------
+    plan : SchedulePlan
+    """
+    # picture time -> (sequence index, patterns, frame index by pattern hash)
+    groups = collections.OrderedDict()
+    steps = []
+    for item, (pattern, duration) in enumerate(items):
+        duration = int(round(duration))
+        if (minPictureTime is not None and duration < minPictureTime) or (
+            maxPictureTime is not None and duration > maxPictureTime
+        ):
+            raise ValueError(
+                "Duration of item {0} ({1} us) is outside the picture time limits [{2}, {3}].".format(
+                    item, duration, minPictureTime, maxPictureTime
+                )
+            )
+        if duration not in groups:
+            groups[duration] = (len(groups), [], {})
+        seq, patterns, index = groups[duration]
+        pattern = np.ascontiguousarray(pattern)
+        key = hashlib.sha1(pattern.tobytes()).hexdigest()
+        frame = index.get(key)
+        if frame is None:
+            frame = index[key] = len(patterns)
+            patterns.append(pattern)
+        last = steps[-1] if steps else None
+        if last is not None and last[0] == seq and frame == last[2] + 1:
+            last[2] = frame
+        else:
+            steps.append([seq, frame, frame, 1])
+
+    merged = []
+    for step in steps:
+        if merged and merged[-1][:3] == step[:3]:
+            merged[-1][3] += 1
+        else:
+            merged.append(step)
+
+    sequences = [(duration, patterns) for duration, (_, patterns, _) in groups.items()]
+    return SchedulePlan(bitDepth, sequences, merged)
+
+
+class CameraRemap(object):
+    """
+    Precomputed warp of images from camera coordinates to DMD mirror coordinates.
+
+    The source pixels of every DMD pixel are computed once from the calibration transform, so that warping a stack
+    of images is a single gather (nearest neighbour) or a weighted sum of four gathers (bilinear),
+    optionally fused with thresholding and packing into the ALP_DATA_BINARY_TOPDOWN layout.
+
+    Usage:
+    CameraRemap(transform, cameraShape, dmdShape, interpolation = 'nearest')
+
+    PARAMETERS
+    ----------
+    transform : array
+                Affine (2 x 3) or homography (3 x 3) matrix mapping camera coordinates (x, y, 1) to DMD coordinates.
+    cameraShape : tuple
+                  (nRows, nColumns) of the camera images.
+    dmdShape : tuple
+               (nSizeY, nSizeX) of the DMD.
+    interpolation : string, optional
+                    'nearest' or 'bilinear'.
+    """
+
+    def __init__(self, transform, cameraShape, dmdShape, interpolation="nearest"):
+        if interpolation not in ("nearest", "bilinear"):
+            raise ValueError('interpolation must be one of "nearest" or "bilinear"')
+        matrix = np.asarray(transform, dtype=np.float64)
+        if matrix.shape == (2, 3):
+            matrix = np.vstack([matrix, [0.0, 0.0, 1.0]])
+        if matrix.shape != (3, 3):
+            raise ValueError("transform must be a 2 x 3 or 3 x 3 matrix.")
+        self.transform = matrix
+        self.cameraShape = tuple(int(n) for n in cameraShape)
+        self.dmdShape = tuple(int(n) for n in dmdShape)
+        self.interpolation = interpolation
+        self.index = None
+        self.weights = None
+
+    @property
+    def key(self):
+        """
+        Hash identifying the transform, the resolutions and the interpolation, used to name the cache file.
+        """
+        digest = hashlib.sha1(self.transform.tobytes())
+        digest.update(
+            "{0}{1}{2}".format(
+                self.cameraShape, self.dmdShape, self.interpolation
+            ).encode()
+        )
+        return digest.hexdigest()
+
+    def Compute(self):
+        """
+        Compute the source indices (and bilinear weights) of all DMD pixels.
+        Pixels outside of the camera image point to an extra fill pixel.
+        """
+        camY, camX = self.cameraShape
+        nSizeY, nSizeX = self.dmdShape
+        y, x = np.mgrid[0:nSizeY, 0:nSizeX]
+        points = np.linalg.inv(self.transform).dot(
+            np.stack([x.ravel(), y.ravel(), np.ones(x.size)])
+        )
+        srcX = points[0] / points[2]
+        srcY = points[1] / points[2]
+        fill = camY * camX
+
+        if self.interpolation == "nearest":
+            corners = [(np.rint(srcX), np.rint(srcY))]
+            self.weights = None
+        else:
+            x0 = np.floor(srcX)
+            y0 = np.floor(srcY)
+            fx = srcX - x0
+            fy = srcY - y0
+            corners = [(x0, y0), (x0 + 1, y0), (x0, y0 + 1), (x0 + 1, y0 + 1)]
+            self.weights = np.stack(
+                [(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy]
+            ).astype(np.float32)
+
+        self.index = np.empty((len(corners), x.size), dtype=np.int32)
+        for k, (cx, cy) in enumerate(corners):
+            valid = (cx >= 0) & (cx < camX) & (cy >= 0) & (cy < camY)
+            self.index[k] = np.where(valid, cy * camX + cx, fill)
+        return self
+
+    def Apply(self, imgArray, threshold=None, fill=0, pack=False, DMDType=None):
+        """
+        Warp camera images to the DMD.
+
+        Usage: Apply(imgArray, threshold = None, fill = 0, pack = False, DMDType = None)
+
+        PARAMETERS
+        ----------
+        imgArray : array
+                   Camera images, shape (nbImg, nRows, nColumns) or (nRows, nColumns).
+        threshold : float, optional
+                    If given, return binary frames (pixels above the threshold).
+        fill : scalar, optional
+               Value of the DMD pixels outside of the camera image.
+        pack : bool, optional
+               Pack the binary frames into the ALP_DATA_BINARY_TOPDOWN layout (load with SeqPutAuto).
+               The frames are binarized with threshold, or by bit 7 if threshold is not given.
+        DMDType : int, optional
+                  Type of DMD, for the DMDs whose packed rows are padded (see packed_row_bytes).
+
+        RETURNS
+        -------
+        frames : ndarray
+                 Shape (nbImg, nSizeY, nSizeX), or (nbImg, nSizeY, row bytes) if packed,
+                 of the image dtype (bool if thresholded).
+        """
+        if self.index is None:
+            self.Compute()
+        imgArray = np.asarray(imgArray)
+        if imgArray.shape[-2:] != self.cameraShape:
+            raise ValueError("Images must be of shape {0}.".format(self.cameraShape))
+        stack = imgArray.reshape(-1, self.cameraShape[0] * self.cameraShape[1])
+        # The extra column holds the fill value gathered by the pixels outside of the camera image
+        source = np.empty((stack.shape[0], stack.shape[1] + 1), dtype=stack.dtype)
+        source[:, :-1] = stack
+        source[:, -1] = fill
+
+        if self.weights is None:
+            frames = np.take(source, self.index[0], axis=1)
+        else:
+            frames = np.take(source, self.index[0], axis=1) * self.weights[0]
+            for k in range(1, 4):
+                frames += np.take(source, self.index[k], axis=1) * self.weights[k]
+            if threshold is None and not pack:
+                if np.issubdtype(imgArray.dtype, np.integer):
+                    np.rint(frames, out=frames)
+                frames = frames.astype(imgArray.dtype)
+
+        if threshold is not None:
+            frames = frames > threshold
+        nSizeY, nSizeX = self.dmdShape
+        if pack:
+            packed = pack_binary(frames, nSizeX, DMDType)
+            return packed.reshape(-1, nSizeY, packed.shape[1])
+        return frames.reshape(-1, nSizeY, nSizeX)
+
+    def Save(self, path):
+        """
+        Save the transform and the precomputed map to a .npz file.
+        """
+        if self.index is None:
+            self.Compute()
+        arrays = dict(
+            transform=self.transform,
+            cameraShape=self.cameraShape,
+            dmdShape=self.dmdShape,
+            interpolation=self.interpolation,
+            index=self.index,
+        )
+        if self.weights is not None:
+            arrays["weights"] = self.weights
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def Load(cls, path):
+        """
+        Load a map saved with Save.
+        """
+        with np.load(path) as data:
+            remap = cls(
+                data["transform"],
+                data["cameraShape"],
+                data["dmdShape"],
+                str(data["interpolation"]),
+            )
+            remap.index = data["index"]
+            if "weights" in data:
+                remap.weights = data["weights"]
+        return remap
+
+    @classmethod
+    def Cached(cls, transform, cameraShape, dmdShape, interpolation="nearest"):
+        """
+        Load the map from the cache in PROFILE_DIR, or compute it and add it to the cache.
+        """
+        remap = cls(transform, cameraShape, dmdShape, interpolation)
+        path = os.path.join(PROFILE_DIR, "remap_{0}.npz".format(remap.key))
+        if os.path.exists(path):
+            try:
+                return cls.Load(path)
+            except (IOError, OSError, ValueError, KeyError):
+                pass
+        remap.Compute()
+        try:
+            if not os.path.isdir(PROFILE_DIR):
+                os.makedirs(PROFILE_DIR)
+            remap.Save(path)
+        except (IOError, OSError):
+            pass
+        return remap
+
+
+class PatternBank(object):
+    """
+    Large sequence resident in the ALP memory holding named sets of patterns.
+    Each set occupies a contiguous range of frames, played with ALP_FIRSTFRAME, ALP_LASTFRAME and ALP_SEQ_REPEAT
+    without any data transfer.
+
+    Usage:
+    PatternBank(alp, nbImg, bitDepth = 1)
+
+    PARAMETERS
+    ----------
+    alp : ALP4
+          Initialized device.
+    nbImg : int
+            Number of frames of the bank.
+    bitDepth : int, optional
+               Bit depth of the frames.
+    """
+
+    def __init__(self, alp, nbImg, bitDepth=1):
+        self.alp = alp
+        self.nbImg = nbImg
+        self.bitDepth = bitDepth
+        self.SequenceId = alp.SeqAlloc(nbImg=nbImg, bitDepth=bitDepth)
+        # name -> (first frame, last frame), in the order of addition
+        self.index = collections.OrderedDict()
+        # Number of frames used
+        self.size = 0
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def available(self):
+        """
+        Number of frames still free.
+        """
+        return self.nbImg - self.size
+
+    def Add(self, name, imgData):
+        """
+        Upload a set of patterns after the last set of the bank.
+
+        Usage: Add(name, imgData)
+
+        PARAMETERS
+        ----------
+        name : hashable
+               Name of the set.
+        imgData : array
+                  Frames of shape (nbFrames, nSizeY, nSizeX) or a single frame (nSizeY, nSizeX).
+                  Binary banks also accept packed frames (last dimension of nSizeX / 8 bytes).
+
+        RETURNS
+        -------
+        window : tuple
+                 (first frame, last frame) of the set in the bank.
+        """
+        if name in self.index:
+            raise ValueError("The bank already holds a set named {0!r}.".format(name))
+        imgArray = np.asarray(imgData)
+        nbFrames = imgArray.shape[0] if imgArray.ndim == 3 else 1
+        if nbFrames > self.available:
+            raise ValueError(
+                "{0} frames do not fit in the bank ({1} available).".format(
+                    nbFrames, self.available
+                )
+            )
+        info = self.alp.SeqInfo(self.SequenceId)
+        if (
+            self.bitDepth == 1
+            and imgArray.shape[-1] == self.alp._packedRowBytes()
+            and imgArray.shape[-1] != self.alp.nSizeX
+            and info.controls.get(ALP_DATA_FORMAT) != ALP_DATA_BINARY_TOPDOWN
+        ):
+            self.alp.SeqControl(
+                ALP_DATA_FORMAT, ALP_DATA_BINARY_TOPDOWN, self.SequenceId
+            )
+        self.alp.SeqPut(
+            imgArray, SequenceId=self.SequenceId, PicOffset=self.size, PicLoad=nbFrames
+        )
+        window = (self.size, self.size + nbFrames - 1)
+        self.index[name] = window
+        self.size += nbFrames
+        return window
+
+    def Window(self, *names):
+        """
+        Return the (first frame, last frame) range covering consecutive sets.
+
+        Usage: Window(name, ...)
+        """
+        windows = [self.index[name] for name in names]
+        for previous, window in zip(windows, windows[1:]):
+            if window[0] != previous[1] + 1:
+                raise ValueError(
+                    "The sets {0} are not contiguous in the bank.".format(names)
+                )
+        return windows[0][0], windows[-1][1]
+
+    def Play(self, *names, **kwargs):
+        """
+        Display one set, or consecutive sets, of the bank by selecting their frames in the resident sequence.
+
+        Usage: Play(name, ..., repeat = 1, loop = False, first = None, last = None)
+
+        PARAMETERS
+        ----------
+        names : hashable
+                Names of the sets to display, in the order of the bank.
+        repeat : int, optional
+                 Number of repetitions of the window (ALP_SEQ_REPEAT), when loop is False.
+        loop : bool, optional
+               Display the window continuously.
+        first, last : int, optional
+                      Frame range to display instead of named sets.
+        """
+        repeat = kwargs.pop("repeat", 1)
+        loop = kwargs.pop("loop", False)
+        first = kwargs.pop("first", None)
+        last = kwargs.pop("last", None)
+        if kwargs:
+            raise TypeError("Unexpected arguments {0}".format(list(kwargs)))
+        if names:
+            first, last = self.Window(*names)
+        if first is None or last is None or not 0 <= first <= last < self.size:
+            raise ValueError("Invalid frame range ({0}, {1}).".format(first, last))
+
+        with self.alp._seqLock(self.SequenceId):
+            self.alp._setFrameWindow(
+                self.SequenceId, first, last, None if loop else repeat
+            )
+        self.alp.Run(self.SequenceId, loop=loop)
+
+    def Free(self):
+        """
+        Free the sequence of the bank.
+        """
+        self.alp.FreeSeq(self.SequenceId)
+        self.index.clear()
+        self.size = 0
+
+
+class HotSwap(object):
+    """
+    Replace frames of a sequence while it is displayed (e.g. looping with ALP4.Run), without halting the projection.
+
+    With a single slot, the memory lock of the sequence is released (ALP_SEQ_PUT_LOCK) and each write is scheduled,
+    from the projection progress (ALP_PROJ_PROGRESS), when the frames written are at least margin frames
+    plus the expected upload time away from the frame displayed. The frames can still tear if the upload
+    is slower than expected.
+
+    With double slots, the frames are held by two sequences of the same content. The updates are written to
+    the sequence not displayed, which is then started and replaces the displayed one at the end of its current
+    iteration: the swaps never tear, the new content is displayed from the next iteration.
+    The updates are written again to the other slot before its next use.
+
+    Usage:
+    HotSwap(alp, SequenceId = None, doubleSlot = False, imgData = None, margin = 1, timeout = 5.)
+
+    PARAMETERS
+    ----------
+    alp : ALP4
+          Initialized device.
+    SequenceId : ctypes c_long, optional
+                 Sequence whose frames are replaced. If not specified, use the last sequence allocated.
+    doubleSlot : bool, optional
+                 Allocate a second sequence for tear-free swaps.
+    imgData : array, optional
+              Content of the sequence, required with doubleSlot to load the second sequence
+              (the ALP memory cannot be read back).
+    margin : int, optional
+             Minimum number of frames between the frame displayed and the frames written (single slot).
+    timeout : float, optional
+              Maximum time waiting for a safe position of the display, in seconds.
+    """
+
+    def __init__(
+        self,
+        alp,
+        SequenceId=None,
+        doubleSlot=False,
+        imgData=None,
+        margin=1,
+        timeout=5.0,
+    ):
+        self.alp = alp
+        self.margin = margin
+        self.timeout = timeout
+        # Measured upload time of one frame in seconds
+        self.uploadTime = 0.0
+        SequenceId = alp._sequence(SequenceId)
+        self.slots = [SequenceId]
+        # Updates not written yet to each slot, (PicOffset, data)
+        self._pending = [[]]
+        self._active = 0
+        if doubleSlot:
+            if imgData is None:
+                raise ValueError("imgData is required to load the second slot.")
+            info = alp.SeqInfo(SequenceId)
+            second = alp.SeqAlloc(nbImg=info.nbImg, bitDepth=info.bitDepth)
+            for controlType, value in info.controls.items():
+                alp.SeqControl(controlType, value, second)
+            if info.timing is not None:
+                (
+                    illuminationTime,
+                    pictureTime,
+                    synchDelay,
+                    synchPulseWidth,
+                    triggerInDelay,
+                ) = info.timing
+                alp.SetTiming(
+                    second,
+                    illuminationTime=illuminationTime,
+                    pictureTime=pictureTime,
+                    synchDelay=synchDelay,
+                    synchPulseWidth=synchPulseWidth,
+                    triggerInDelay=triggerInDelay,
+                )
+            alp.SeqPut(imgData, SequenceId=second)
+            self.slots.append(second)
+            self._pending.append([])
+        else:
+            # Any value but ALP_DEFAULT releases the lock
+            alp.SeqControl(ALP_SEQ_PUT_LOCK, ALP_ENABLE, SequenceId)
+
+    @property
+    def doubleSlot(self):
+        return len(self.slots) == 2
+
+    @property
+    def SequenceId(self):
+        """
+        Sequence holding the latest content, to display.
+        """
+        return self.slots[self._active]
+
+    def Run(self):
+        """
+        Display the sequence holding the latest content continuously.
+
+        Usage: Run()
+        """
+        self.alp.Run(self.SequenceId, loop=True)
+
+    def _displayed(self, SequenceId):
+        # Projection progress if the sequence is the one displayed, None otherwise
+        progress = self.alp.ProjInquireEx(ALP_PROJ_PROGRESS)
+        if progress.nFlagse & ALP_FLAG_QUEUE_IDLE.value or progress.SequenceId != (
+            _argValue(SequenceId) & 0xFFFFFFFF
+        ):
+            return None
+        return progress
+
+    def _write(self, slot, PicOffset, imgArray):
+        for offset, data in self._pending[slot]:
+            self.alp.SeqPut(
+                data,
+                SequenceId=self.slots[slot],
+                PicOffset=offset,
+                PicLoad=data.shape[0],
+            )
+        self._pending[slot] = []
+        start = _clock()
+        self.alp.SeqPut(
+            imgArray,
+            SequenceId=self.slots[slot],
+            PicOffset=PicOffset,
+            PicLoad=imgArray.shape[0],
+        )
+        frameTime = (_clock() - start) / imgArray.shape[0]
+        # Follow increases of the upload time at once, decreases slowly
+        self.uploadTime = max(frameTime, 0.8 * self.uploadTime + 0.2 * frameTime)
+        for other in range(len(self.slots)):
+            if other != slot:
+                self._pending[other].append((PicOffset, imgArray))
+
+    def Swap(self, PicOffset, imgData):
+        """
+        Replace frames of the sequence during the display.
+
+        Usage: Swap(PicOffset, imgData)
+
+        PARAMETERS
+        ----------
+        PicOffset : int
+                    Picture number of the first frame to replace.
+        imgData : array
+                  Frames of shape (nbFrames, nSizeY, nSizeX) or a single frame (nSizeY, nSizeX),
+                  in the format expected by SeqPut.
+
+        RETURNS
+        -------
+        report : dict
+                 'SequenceId': sequence written, 'waited': time waiting for the display in seconds,
+                 'upload': upload time in seconds.
+        """
+        imgArray = np.array(imgData, copy=True)
+        if imgArray.ndim == 2:
+            imgArray = imgArray[np.newaxis]
+        nbFrames = imgArray.shape[0]
+        info = self.alp.SeqInfo(self.SequenceId)
+        if PicOffset < 0 or PicOffset + nbFrames > info.nbImg:
+            raise ValueError(
+                "Frames {0} to {1} out of the sequence.".format(
+                    PicOffset, PicOffset + nbFrames - 1
+                )
+            )
+
+        start = _clock()
+        deadline = start + self.timeout
+        if self.doubleSlot:
+            # Wait until the previous swap took place, so that the other slot is not displayed anymore
+            while True:
+                slot = 1 - self._active
+                progress = self._displayed(self.slots[slot])
+                if progress is None:
+                    break
+                now = _clock()
+                if now >= deadline:
+                    raise ALPError(ALP_SEQ_IN_USE)
+                time.sleep(
+                    min(
+                        max(progress.nFrameCounter - 0.5, 0.5)
+                        * progress.nPictureTime
+                        * 1e-6,
+                        deadline - now,
+                    )
+                )
+            if self._displayed(self.SequenceId) is None:
+                # Nothing displayed: update the current slot
+                slot = self._active
+            waited = _clock() - start
+            uploadStart = _clock()
+            self._write(slot, PicOffset, imgArray)
+            upload = _clock() - uploadStart
+            if slot != self._active:
+                self._active = slot
+                self.Run()
+            return {"SequenceId": self.SequenceId, "waited": waited, "upload": upload}
+
+        while True:
+            progress = self._displayed(self.SequenceId)
+            if progress is None:
+                break
+            nbDisplayed = progress.nFramesPerSubSequence
+            # Position of the written frames and of the display in the displayed frames
+            first = max(PicOffset - info.controls.get(ALP_FIRSTFRAME, 0), 0)
+            last = min(
+                PicOffset + nbFrames - 1 - info.controls.get(ALP_FIRSTFRAME, 0),
+                nbDisplayed - 1,
+            )
+            if first > last:
+                # The frames are not displayed
+                break
+            position = (nbDisplayed - progress.nFrameCounter) % nbDisplayed
+            pictureTime = progress.nPictureTime * 1e-6
+            guard = self.margin + int(np.ceil(self.uploadTime * nbFrames / pictureTime))
+            if nbDisplayed - (last - first + 1) <= guard:
+                raise ValueError(
+                    "The sequence is too short to replace its frames during the display, use doubleSlot."
+                )
+            if (position - first) % nbDisplayed > last - first and (
+                first - position
+            ) % nbDisplayed > guard:
+                break
+            now = _clock()
+            if now >= deadline:
+                raise ALPError(ALP_SEQ_IN_USE)
+            # Wait until the display has passed the written frames
+            frames = (last + 1 - position) % nbDisplayed
+            time.sleep(min(max(frames - 1, 0.5) * pictureTime, deadline - now))
+        waited = _clock() - start
+        uploadStart = _clock()
+        self._write(0, PicOffset, imgArray)
+        return {
+            "SequenceId": self.SequenceId,
+            "waited": waited,
+            "upload": _clock() - uploadStart,
+        }
+
+    def Free(self):
+        """
+        Write the pending updates to the sequence given at creation, free the second slot and restore
+        the memory lock. The display has to be halted, else ALPError(ALP_SEQ_IN_USE) is raised.
+
+        Usage: Free()
+        """
+        progress = self.alp.ProjInquireEx(ALP_PROJ_PROGRESS)
+        if not progress.nFlagse & ALP_FLAG_QUEUE_IDLE.value:
+            raise ALPError(ALP_SEQ_IN_USE)
+        for offset, data in self._pending[0]:
+            self.alp.SeqPut(
+                data, SequenceId=self.slots[0], PicOffset=offset, PicLoad=data.shape[0]
+            )
+        self._pending[0] = []
+        if self.doubleSlot:
+            self.alp.FreeSeq(self.slots.pop())
+            self._pending.pop()
+        else:
+            self.alp.SeqControl(ALP_SEQ_PUT_LOCK, ALP_DEFAULT, self.slots[0])
+        self._active = 0
+
+
+class HealthSampler(object):
+    """
+    Background thread reading the temperatures of the device (ALP_DDC_FPGA_TEMPERATURE, ALP_APPS_FPGA_TEMPERATURE
+    and ALP_PCB_TEMPERATURE, 1/256 degrees C) into a ring buffer, and calling callbacks when thresholds are crossed.
+
+    With throttleTemperature set, the picture times set with ALP4.SetTiming are lengthened by pictureTimeScale,
+    which grows by throttleStep at each sample where the hottest sensor is above throttleTemperature
+    (up to maxScale), and shrinks back once it is hysteresis degrees below.
+    The sequences already running are not modified.
+
+    Usage:
+    HealthSampler(alp, interval = 1., capacity = 3600, throttleTemperature = None, throttleStep = 1.1,
+                  maxScale = 2., hysteresis = 2.)
+
+    PARAMETERS
+    ----------
+    alp : ALP4
+          Initialized device.
+    interval : float, optional
+               Time between two samples in seconds.
+    capacity : int, optional
+               Number of samples kept, the oldest ones are overwritten.
+    throttleTemperature : float, optional
+                          Temperature in degrees C above which the picture times are lengthened.
+    throttleStep : float, optional
+                   Factor applied to pictureTimeScale at each sample.
+    maxScale : float, optional
+               Maximum lengthening of the picture times.
+    hysteresis : float, optional
+                 Temperature drop in degrees C re-arming the thresholds and releasing the throttling.
+    """
+
+    # Name of the sample fields and inquiry of each sensor
+    sensors = (
+        ("ddcFpga", ALP_DDC_FPGA_TEMPERATURE),
+        ("appsFpga", ALP_APPS_FPGA_TEMPERATURE),
+        ("pcb", ALP_PCB_TEMPERATURE),
+    )
+    dtype = np.dtype(
+        [("time", np.float64)] + [(name, np.float32) for name, _ in sensors]
+    )
+
+    def __init__(
+        self,
+        alp,
+        interval=1.0,
+        capacity=3600,
+        throttleTemperature=None,
+        throttleStep=1.1,
+        maxScale=2.0,
+        hysteresis=2.0,
+    ):
+        self.alp = alp
+        self.interval = interval
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=self.dtype)
+        # Total number of samples (including overwritten ones)
+        self.count = 0
+        self.throttleTemperature = throttleTemperature
+        self.throttleStep = throttleStep
+        self.maxScale = maxScale
+        self.hysteresis = hysteresis
+        self.pictureTimeScale = 1.0
+        # [limit, callback, sensor, armed] of each threshold
+        self.thresholds = []
+        # Exception which stopped the thread
+        self.error = None
+        # Protects the buffer written by the sampler thread
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def AddThreshold(self, limit, callback, sensor=None):
+        """
+        Call callback(sensor, temperature, sample) from the sampler thread when a temperature rises above limit.
+        The threshold is re-armed when the temperature falls hysteresis degrees below the limit.
+
+        Usage: AddThreshold(limit, callback, sensor = None)
+
+        PARAMETERS
+        ----------
+        limit : float
+                Temperature in degrees C.
+        callback : callable
+        sensor : string, optional
+                 'ddcFpga', 'appsFpga' or 'pcb'. By default, all sensors.
+        """
+        if sensor is not None and sensor not in dict(self.sensors):
+            raise ValueError(
+                "sensor must be one of {0}".format([name for name, _ in self.sensors])
+            )
+        self.thresholds.append([limit, callback, sensor, True])
+
+    def Sample(self):
+        """
+        Read the temperatures once, store them and apply the thresholds and the throttling.
+
+        Usage: Sample()
+
+        RETURNS
+        -------
+        sample : numpy record
+                 Time (see time.time) and temperatures in degrees C.
+        """
+        # Serialized with the allocations and releases of the sequences made by the other threads
+        with self.alp._stateLock:
+            values = [
+                self.alp.DevInquire(inquireType) / 256.0
+                for _, inquireType in self.sensors
+            ]
+        with self._lock:
+            index = self.count % self.capacity
+            self.buffer[index] = tuple([time.time()] + values)
+            self.count += 1
+            sample = self.buffer[index].copy()
+
+        for threshold in self.thresholds:
+            limit, callback, sensor, armed = threshold
+            names = [sensor] if sensor is not None else [n for n, _ in self.sensors]
+            hottest = max(names, key=lambda name: sample[name])
+            if armed and sample[hottest] >= limit:
+                threshold[3] = False
+                callback(hottest, float(sample[hottest]), sample)
+            elif not armed and sample[hottest] < limit - self.hysteresis:
+                threshold[3] = True
+
+        if self.throttleTemperature is not None:
+            hottest = max(values)
+            if hottest >= self.throttleTemperature:
+                self.pictureTimeScale = min(
+                    self.pictureTimeScale * self.throttleStep, self.maxScale
+                )
+            elif hottest < self.throttleTemperature - self.hysteresis:
+                self.pictureTimeScale = max(
+                    self.pictureTimeScale / self.throttleStep, 1.0
+                )
+        return sample
+
+    def Samples(self):
+        """
+        Return the stored samples in chronological order.
+        """
+        with self._lock:
+            if self.count <= self.capacity:
+                return self.buffer[: self.count].copy()
+            head = self.count % self.capacity
+            return np.concatenate([self.buffer[head:], self.buffer[:head]])
+
+    def ThrottledPictureTime(self, pictureTime):
+        """
+        Return the picture time lengthened by the current throttling.
+        """
+        if self.pictureTimeScale == 1.0:
+            return pictureTime
+        return min(int(round(pictureTime * self.pictureTimeScale)), 10000000)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self.Sample()
+        except Exception as error:
+            self.error = error
+
+    def Start(self):
+        """
+        Start sampling in a daemon thread. The device must be thread-safe (ALP4(threadSafe = True)):
+        the inquiries of the thread hold the lock of the device state, so that they are serialized
+        with the allocations and releases of sequences made by the application.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not self.alp.threadSafe:
+            raise ValueError(
+                "The health sampler requires a thread-safe device, see ALP4(threadSafe = True)."
+            )
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="ALP4 health sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Stop(self):
+        """
+        Stop the sampling thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
 
 class ALP4(object):
     """
     This class controls a Vialux DMD board based on the Vialux ALP 4.X API.
-    """
 
-    def __init__(self, version="4.3", libDir=None):
-        os_type = platform.system()
-
-        if libDir is None:
-            try:
-                reg = _winreg.ConnectRegistry(None, _winreg.HKEY_LOCAL_MACHINE)
-                key = _winreg.OpenKey(reg, r"SOFTWARE\ViALUX\ALP-" + version)
-                libDir = (_winreg.QueryValueEx(key, "Path"))[
-                    0
-                ] + "/ALP-{0} high-speed API/".format(version)
-            except EnvironmentError:
-                raise ValueError(
-                    "Cannot auto detect libDir! Please specify it manually."
-                )
+    Usage:
+    ALP4(version = '4.3', libDir = None, library = None, threadSafe = False)
+
+    PARAMETERS
+    ----------
+    version : string
+              Version of the ALP API ('4.1', '4.2', '4.3' or '4.4').
+    libDir : string, optional
+             Directory of the ALP dll. If not specified, it is read from the Windows registry.
+    library : object, optional
+              Object used instead of the ALP dll, e.g. ALPSimulator to run without a device.
+    threadSafe : bool, optional
+                 Allow the object to be used from several threads. Uploads, controls and release of a sequence
+                 are serialized per sequence, changes of the projection and device settings are serialized together,
+                 and inquiries are not locked, so that the status can be read while a long SeqPut runs
+                 on another thread. Threads should pass explicit SequenceIds: the last allocated sequence
+                 used by default is shared by all threads.
+    """
 
-        if libDir.endswith("/"):
-            libPath = libDir
-        else:
-            libPath = libDir + "/"
-            ## Load the ALP dll
-        if os_type == "Windows":
-            if ct.sizeof(ct.c_voidp) == 8:  ## 64bit
-                libPath += "x64/"
-            elif not (ct.sizeof(ct.c_voidp) == 4):  ## 32bit
+    def __init__(self, version="4.3", libDir=None, library=None, threadSafe=False):
+        if library is None:
+            os_type = platform.system()
+
+            if libDir is None:
+                if _winreg is None:
+                    raise ValueError(
+                        "Cannot auto detect libDir! Please specify it manually."
+                    )
+                try:
+                    reg = _winreg.ConnectRegistry(None, _winreg.HKEY_LOCAL_MACHINE)
+                    key = _winreg.OpenKey(reg, r"SOFTWARE\ViALUX\ALP-" + version)
+                    libDir = (_winreg.QueryValueEx(key, "Path"))[
+                        0
+                    ] + "/ALP-{0} high-speed API/".format(version)
+                except EnvironmentError:
+                    raise ValueError(
+                        "Cannot auto detect libDir! Please specify it manually."
+                    )
+
+            if libDir.endswith("/"):
+                libPath = libDir
+            else:
+                libPath = libDir + "/"
+                ## Load the ALP dll
+            if os_type == "Windows":
+                if ct.sizeof(ct.c_voidp) == 8:  ## 64bit
+                    libPath += "x64/"
+                elif not (ct.sizeof(ct.c_voidp) == 4):  ## 32bit
+                    raise OSError("System not supported.")
+            else:
                 raise OSError("System not supported.")
-        else:
-            raise OSError("System not supported.")
-
-        if version == "4.1":
-            libPath += "alpD41.dll"
-        elif version == "4.2":
-            libPath += "alpV42.dll"
-        elif version == "4.3":
-            libPath += "alp4395.dll"
-        elif version == "4.4":
-            libPath += "Alp44.dll"
-        else:
-            raise ValueError("Version not supported.")
 
-        print("Loading library: " + libPath)
+            if version == "4.1":
+                libPath += "alpD41.dll"
+            elif version == "4.2":
+                libPath += "alpV42.dll"
+            elif version == "4.3":
+                libPath += "alp4395.dll"
+            elif version == "4.4":
+                libPath += "Alp44.dll"
+            else:
+                raise ValueError("Version not supported.")
+
+            print("Loading library: " + libPath)
 
-        self._ALPLib = ct.CDLL(libPath)
+            self._ALPLib = ct.CDLL(libPath)
+        else:
+            # Stand-in for the ALP dll (e.g. ALPSimulator)
+            self._ALPLib = library
+        # Library without the wrappers added by EnableTrace and EnableRecovery
+        self._lib = self._ALPLib
 
         ## Class parameters
         # ID of the current ALP device
@@ -474,28 +2833,533 @@ class ALP4(object):
         self.DMDType = ct.c_long(0)
         # Pointer to the last stored image sequence
         self._lastDDRseq = None
-        # List of all Sequences
-        self.Seqs = []
+        # Description of all allocated sequences, by SequenceId value (see Seqs)
+        self._seqInfo = collections.OrderedDict()
+        # Pool of released sequences, see EnablePool
+        self.pool = None
+        # Last block bitmap written with SetDmdMask
+        self._dmdMask = None
+        # Values set with ProjControl, by control type
+        self._projControls = {}
+        # Copies of the structures written with ProjControlEx (None if unreadable), by control type
+        self._projControlsEx = {}
+        # Values set with DevControl and copies of the structures written with DevControlEx, by control type
+        self._devControls = {}
+        # Serial number of the device, read by Initialize
+        self.serial = None
+        # Resolution, DMD type and timing limits of the device, see Initialize and TimingLimits
+        self.capabilities = None
+        self._capabilitiesChecked = True
+        self._saveCache = False
+        # Upload chunk sizes measured by TuneUpload, loaded by Initialize
+        self.uploadProfile = None
+        # Tracer recording the dll calls, see EnableTrace
+        self.tracer = None
+        # Recorder writing the dll calls to a file, see StartRecording
+        self.recorder = None
+        # Temperature sampler, see StartHealthMonitor
+        self.health = None
+        # Settings of the recovery from communication errors, see EnableRecovery
+        self._recovery = None
+        self._recovering = False
+        # Reports of the recoveries, see Recover
+        self.recoveries = []
+        # Sequences started and not known to be finished, to resume the display after a recovery:
+        # [SequenceId, loop, start time, first frame, last frame, repeat]
+        self._display = []
+        # Settings changed to resume a display, restored once it is finished:
+        # key -> (SequenceId, {control type: value})
+        self._restore = {}
+        self.threadSafe = threadSafe
+        # Protects the description of the sequences (_seqInfo, _lastDDRseq, pool)
+        self._stateLock = threading.RLock() if threadSafe else _NO_LOCK
+        # Serializes the changes of the projection and device settings
+        self._projLock = threading.RLock() if threadSafe else _NO_LOCK
+        # Lock of each allocated sequence, by SequenceId value
+        self._seqLocks = {}
+
+    def StartHealthMonitor(self, interval=1.0, capacity=3600, throttleTemperature=None):
+        """
+        Start sampling the temperatures of the device in a background thread (see HealthSampler).
+        If throttleTemperature is set, the picture times set by SetTiming (given, or implied by the illumination time)
+        are lengthened while the device is hot. The device must be created with threadSafe = True.
+
+        Usage: StartHealthMonitor(interval = 1., capacity = 3600, throttleTemperature = None)
+
+        RETURNS
+        -------
+        sampler : HealthSampler
+                  The sampler, also available as the health attribute, to add thresholds and read the samples.
+        """
+        self.StopHealthMonitor()
+        health = HealthSampler(
+            self, interval, capacity, throttleTemperature=throttleTemperature
+        )
+        health.Start()
+        self.health = health
+        return health
+
+    def StopHealthMonitor(self):
+        """
+        Stop the temperature sampler and the throttling of the picture times.
+
+        Usage: StopHealthMonitor()
+        """
+        if self.health is not None:
+            self.health.Stop()
+            self.health = None
+
+    def EnableTrace(self, capacity=65536):
+        """
+        Record every call to the ALP dll (time stamps, arguments and return code).
+        When tracing is disabled (default), the dll is called directly without any overhead.
+
+        Usage: EnableTrace(capacity = 65536)
+
+        PARAMETERS
+        ----------
+        capacity : int, optional
+                   Number of calls kept in the preallocated buffer.
+
+        RETURNS
+        -------
+        tracer : ALPTracer
+                 Object holding the recorded calls, also available as the tracer attribute.
+        """
+        if self.tracer is None:
+            self.tracer = ALPTracer(capacity)
+            self._wrapLib()
+        return self.tracer
+
+    def DisableTrace(self):
+        """
+        Stop recording the calls to the ALP dll.
+
+        Usage: DisableTrace()
+
+        RETURNS
+        -------
+        tracer : ALPTracer
+                 The tracer holding the calls recorded so far (None if tracing was not enabled).
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            self.tracer = None
+            self._wrapLib()
+        return tracer
+
+    def StartRecording(self, path, payloads=False):
+        """
+        Write every call to the ALP dll to a compact binary file, to replay them later (see CallReplayer),
+        e.g. to compare the performance of the calls on another computer or driver version.
+        Start recording before Initialize to replay the allocation of the device as well.
+
+        Usage: StartRecording(path, payloads = False)
+
+        PARAMETERS
+        ----------
+        path : string
+               File to write.
+        payloads : bool, optional
+                   Store the image data uploaded by SeqPut and SeqPutEx (by default, only its size and hash).
+
+        RETURNS
+        -------
+        recorder : CallRecorder
+                   Object writing the calls, also available as the recorder attribute.
+        """
+        if self.recorder is not None:
+            self.StopRecording()
+        self.recorder = CallRecorder(path, payloads)
+        self._wrapLib()
+        return self.recorder
+
+    def StopRecording(self):
+        """
+        Stop recording the calls to the ALP dll and close the file.
+
+        Usage: StopRecording()
+
+        RETURNS
+        -------
+        count : int
+                Number of calls recorded (0 if recording was not started).
+        """
+        recorder = self.recorder
+        if recorder is None:
+            return 0
+        self.recorder = None
+        self._wrapLib()
+        recorder.Close()
+        return recorder.count
+
+    def _transferHint(self, nbytes):
+        # Size of the data of the next SeqPut/SeqPutEx call of the thread, for the tracer and the recorder
+        if self.tracer is not None:
+            self.tracer.nbytes = nbytes
+        if self.recorder is not None:
+            self.recorder.nbytes = nbytes
+
+    def _transferSize(self):
+        # Size set by _transferHint and not yet used by the recorder or the tracer
+        if self.recorder is not None:
+            return self.recorder.nbytes
+        if self.tracer is not None:
+            return self.tracer.nbytes
+        return 0
+
+    def _wrapLib(self):
+        # Recovery is the innermost wrapper, so that the retried calls are traced once,
+        # the recording sees every call made to the dll
+        lib = self._lib
+        if self.recorder is not None:
+            lib = _RecordingALPLib(lib, self.recorder)
+        if self._recovery is not None:
+            lib = _RecoveringALPLib(lib, self)
+        if self.tracer is not None:
+            lib = _TracedALPLib(lib, self.tracer)
+        self._ALPLib = lib
+
+    def EnableRecovery(
+        self, retainData=True, maxAttempts=5, retryDelay=1.0, onRecover=None
+    ):
+        """
+        Recover automatically from communication errors (ALP_ERROR_COMM, ALP_DEVICE_REMOVED, e.g. USB interruption):
+        the call failing is retried once after Recover has reconnected the device, re-created the sequences
+        and resumed the display.
+
+        The SequenceId objects returned by SeqAlloc keep identifying their sequence after a recovery
+        (their value is updated), sequences given as integers are not.
+
+        Usage: EnableRecovery(retainData = True, maxAttempts = 5, retryDelay = 1., onRecover = None)
+
+        PARAMETERS
+        ----------
+        retainData : bool, optional
+                     Keep host copies of the data loaded with SeqPut to restore the content of the sequences.
+                     Sequences with a source (see SetSequenceSource) are restored from it instead.
+        maxAttempts : int, optional
+                      Number of reconnection attempts before raising the communication error.
+        retryDelay : float, optional
+                     Time between two reconnection attempts in seconds.
+        onRecover : callable, optional
+                    Called with the report of each recovery (see Recover).
+        """
+        self._recovery = {
+            "retainData": retainData,
+            "maxAttempts": maxAttempts,
+            "retryDelay": retryDelay,
+            "onRecover": onRecover,
+        }
+        self._wrapLib()
+
+    def DisableRecovery(self):
+        """
+        Stop recovering from communication errors and release the host copies of the sequences.
+
+        Usage: DisableRecovery()
+        """
+        self._recovery = None
+        with self._stateLock:
+            for info in self._seqInfo.values():
+                info.uploads = []
+        self._display = []
+        self._restore = {}
+        self._wrapLib()
+
+    def SetSequenceSource(self, source, SequenceId=None):
+        """
+        Set where the content of a sequence is restored from after a recovery (see EnableRecovery),
+        instead of keeping host copies of the uploaded data.
+
+        Usage: SetSequenceSource(source, SequenceId = None)
+
+        PARAMETERS
+        ----------
+        source : callable or string
+                 Function returning the image data of the whole sequence (as given to SeqPut),
+                 or path of a .npy file holding it.
+        SequenceId : ctypes c_long, optional
+                     Identified of the sequence. If not specified, use the last sequence allocated in the DMD board memory
+        """
+        info = self._seqInfo[_seqKey(self._sequence(SequenceId))]
+        info.source = source
+        info.uploads = []
+
+    def Recover(self, error=ALP_ERROR_COMM):
+        """
+        Restore the device after a communication error: reconnect it with ALP_USB_CONNECTION, or allocate it again
+        if the connection cannot be restored and write again the settings of DevControl, DevControlEx, ProjControl
+        and ProjControlEx (the DMD mask of SetDmdMask in full); if its sequences were lost, re-create them
+        with their controls, timing and content; then resume the display of the sequences which were not finished.
+        Called automatically when EnableRecovery is used.
+
+        Usage: Recover(error = ALP_ERROR_COMM)
+
+        RETURNS
+        -------
+        report : dict
+                 'error': code of the error, 'method': 'usb' or 'reinitialize',
+                 'recreated': number of sequences re-created, 'restored': number of them whose content was restored,
+                 'resumed': number of displays resumed, 'notRestored': control types of the structures
+                 that could not be written again (not readable when they were set, or a DMD mask written
+                 directly with ProjControlEx), 'time': time to recover in seconds.
+                 The reports are also appended to the recoveries attribute.
+        """
+        start = _clock()
+        settings = self._recovery or {"maxAttempts": 1, "retryDelay": 0.0}
+        self._recovering = True
+        try:
+            with self._stateLock:
+                method = self._reconnect(error, settings)
+                notRestored = []
+                if method == "reinitialize":
+                    # The new allocation starts with the default settings
+                    notRestored = self._restoreDevice()
+                infos = list(self._seqInfo.values())
+                lost = any(not self._seqAlive(info) for info in infos)
+                restored = resumed = 0
+                if lost:
+                    # The display goes on if the device kept its state, it is only resumed after a reset
+                    restored = self._recreateSequences(infos)
+                    resumed = self._resumeDisplay(start)
+        finally:
+            self._recovering = False
+        report = {
+            "error": error,
+            "method": method,
+            "recreated": len(infos) if lost else 0,
+            "restored": restored,
+            "resumed": resumed,
+            "notRestored": notRestored,
+            "time": _clock() - start,
+        }
+        self.recoveries.append(report)
+        if settings.get("onRecover") is not None:
+            settings["onRecover"](report)
+        return report
+
+    def _reconnect(self, error, settings):
+        for attempt in range(settings["maxAttempts"]):
+            if attempt:
+                time.sleep(settings["retryDelay"])
+            returnValue = self._ALPLib.AlpDevControl(
+                self.ALP_ID, ALP_USB_CONNECTION, ct.c_long(ALP_DEFAULT)
+            )
+            if returnValue == ALP_OK:
+                return "usb"
+            # The device was reset or removed: release the old connection and allocate it again
+            self._ALPLib.AlpDevFree(self.ALP_ID)
+            returnValue = self._ALPLib.AlpDevAlloc(
+                ct.c_long(self.serial if self.serial else ALP_DEFAULT),
+                ALP_DEFAULT,
+                ct.byref(self.ALP_ID),
+            )
+            if returnValue == ALP_OK:
+                return "reinitialize"
+        raise ALPError(error)
+
+    def _seqAlive(self, info):
+        picNum = ct.c_long(0)
+        returnValue = self._ALPLib.AlpSeqInquire(
+            self.ALP_ID, info.SequenceId, ALP_PICNUM, ct.byref(picNum)
+        )
+        return returnValue == ALP_OK and picNum.value == info.capacity
+
+    def _restoreDevice(self):
+        # Write again the device and projection settings, return the control types that cannot be restored
+        notRestored = []
+        for controlType, value in self._devControls.items():
+            if value is None:
+                notRestored.append(controlType)
+            elif isinstance(value, ct.Structure):
+                self._checkError(
+                    self._ALPLib.AlpDevControlEx(
+                        self.ALP_ID, controlType, ct.byref(value)
+                    ),
+                    "Error sending request.",
+                )
+            else:
+                self._checkError(
+                    self._ALPLib.AlpDevControl(
+                        self.ALP_ID, controlType, ct.c_long(value)
+                    ),
+                    "Error sending request.",
+                )
+        for controlType, value in self._projControls.items():
+            self._checkError(
+                self._ALPLib.AlpProjControl(self.ALP_ID, controlType, ct.c_long(value)),
+                "Error sending request.",
+            )
+        for controlType, value in self._projControlsEx.items():
+            if controlType == ALP_DMD_MASK_WRITE:
+                # Each write holds only some rows of blocks: write the whole mask set by SetDmdMask
+                if self._dmdMask is None:
+                    notRestored.append(controlType)
+                else:
+                    bitmap = self._dmdMask[1]
+                    self._writeDmdMask(bitmap, [(0, bitmap.shape[0])])
+            elif value is None:
+                notRestored.append(controlType)
+            else:
+                self._checkError(
+                    self._ALPLib.AlpProjControlEx(
+                        self.ALP_ID, controlType, ct.byref(value)
+                    ),
+                    "Error sending request.",
+                )
+        return notRestored
+
+    def _recreateSequences(self, infos):
+        # The idle sequences of the pool are lost with the others
+        if self.pool is not None:
+            del self.pool.idle[:]
+
+        restored = 0
+        self._seqInfo.clear()
+        self._seqLocks.clear()
+        for info in infos:
+            SequenceId = ct.c_long(0)
+            self._checkError(
+                self._ALPLib.AlpSeqAlloc(
+                    self.ALP_ID,
+                    ct.c_long(info.bitDepth),
+                    ct.c_long(info.capacity),
+                    ct.byref(SequenceId),
+                ),
+                "Cannot allocate image sequence.",
+            )
+            # Keep the SequenceId object held by the user valid
+            info.SequenceId.value = SequenceId.value
+            self._seqInfo[_seqKey(info.SequenceId)] = info
+
+            for controlType, value in info.controls.items():
+                self._seqControl(info.SequenceId, controlType, value)
+            if info.timing is not None:
+                self._checkError(
+                    self._ALPLib.AlpSeqTiming(
+                        self.ALP_ID,
+                        info.SequenceId,
+                        *[ct.c_long(value) for value in info.timing]
+                    ),
+                    "Cannot set timing.",
+                )
+
+            if info.source is not None:
+                if callable(info.source):
+                    data = info.source()
+                else:
+                    data = np.load(info.source)
+                self.SeqPut(data, SequenceId=info.SequenceId)
+            else:
+                for PicOffset, nbImg, data in info.uploads:
+                    self._seqPut(
+                        info.SequenceId,
+                        PicOffset,
+                        nbImg,
+                        data.ctypes.data_as(ct.c_void_p),
+                        data.nbytes,
+                    )
+            if info.source is not None or info.uploads:
+                restored += 1
+        return restored
+
+    def _resumeDisplay(self, failure):
+        # Estimate which of the started displays were not finished at the time of the failure
+        remaining = []
+        end = None
+        for SequenceId, loop, start, first, last, repeat in self._display:
+            info = self._seqInfo.get(_seqKey(SequenceId))
+            if info is None:
+                continue
+            if loop:
+                remaining.append([SequenceId, loop, first, last, repeat])
+                break
+            pictureTime = self.SeqInquire(ALP_PICTURE_TIME, SequenceId) * 1e-6
+            nbFrames = last - first + 1
+            if end is not None:
+                start = max(start, end)
+            end = start + pictureTime * nbFrames * repeat
+            if end <= failure:
+                continue
+            if not remaining:
+                # Resume the interrupted display at the picture being displayed:
+                # end of the interrupted pass, then the remaining repetitions
+                done = int(max(failure - start, 0.0) // pictureTime)
+                repeatsDone, picture = divmod(done, nbFrames)
+                if picture:
+                    remaining.append([SequenceId, loop, first + picture, last, 1])
+                    repeatsDone += 1
+                repeat -= repeatsDone
+                if repeat < 1:
+                    continue
+            remaining.append([SequenceId, loop, first, last, repeat])
+
+        self._display = []
+        # Settings to restore, kept from an earlier resume not finished yet
+        restore, self._restore = self._restore, {}
+        for SequenceId, loop, first, last, repeat in remaining:
+            key = _seqKey(SequenceId)
+            info = self._seqInfo[key]
+            if key not in restore:
+                restore[key] = (
+                    SequenceId,
+                    {
+                        ALP_FIRSTFRAME: info.controls.get(ALP_FIRSTFRAME, 0),
+                        ALP_LASTFRAME: info.controls.get(ALP_LASTFRAME, info.nbImg - 1),
+                        ALP_SEQ_REPEAT: info.controls.get(ALP_SEQ_REPEAT, 1),
+                    },
+                )
+            self._setFrameWindow(SequenceId, first, last, repeat)
+            self.Run(SequenceId, loop)
+        # The settings of the sequences are restored for their next display once the resumed display is finished
+        self._restore = dict(
+            (key, value) for key, value in restore.items() if key in self._seqInfo
+        )
+        return len(remaining)
+
+    def _restoreSettings(self):
+        # Restore the settings changed to resume a display (see _resumeDisplay)
+        restore, self._restore = self._restore, {}
+        for key, (SequenceId, previous) in restore.items():
+            if key in self._seqInfo:
+                self._setFrameWindow(
+                    SequenceId,
+                    previous[ALP_FIRSTFRAME],
+                    previous[ALP_LASTFRAME],
+                    previous[ALP_SEQ_REPEAT],
+                )
 
     def _checkError(self, returnValue, errorString, warning=False):
         if not (returnValue == ALP_OK):
             if not warning:
                 raise ALPError(returnValue)
             else:
-                print(errorString + "\n" + ALP_ERRORS[returnValue])
+                print(errorString + "\n" + _errorMessage(returnValue))
 
-    def Initialize(self, DeviceNum=None):
+    def Initialize(self, DeviceNum=None, useCache=True, saveCache=False, verbose=True):
         """
         Initialize the communication with the DMD.
 
+        The device capabilities (resolution, DMD type and timing limits, see TimingLimits) can be saved in
+        PROFILE_DIR for each device serial number (saveCache, or ProbeCapabilities). When DeviceNum is given
+        and they were saved, they are read from this cache without inquiring the device; they are checked
+        against the device the first time they are used (SeqAlloc, TimingLimits).
+
         Usage:
-        Initialize(DeviceNum = None)
+        Initialize(DeviceNum = None, useCache = True, saveCache = False, verbose = True)
 
         PARAMETERS
         ----------
         DeviceNum : int
                     Serial number of the DMD to initialize, useful for multiple DMD control.
                     If not specify, open the first available DMD.
+        useCache : bool, optional
+                   Read the cached capabilities of the device.
+        saveCache : bool, optional
+                    Write the capabilities of the device to the cache when they are probed or updated.
+        verbose : bool, optional
+                  Print the resolution of the DMD found.
         """
         if DeviceNum is None:
             DeviceNum = ct.c_long(ALP_DEFAULT)
@@ -504,6 +3368,34 @@ class ALP4(object):
             self._ALPLib.AlpDevAlloc(DeviceNum, ALP_DEFAULT, ct.byref(self.ALP_ID)),
             "Cannot open DMD.",
         )
+
+        serial = _argValue(DeviceNum)
+        if serial <= 0:
+            serial = self.DevInquire(ALP_DEVICE_NUMBER)
+        self.serial = serial
+
+        capabilities = _loadProfile("capabilities", serial) if useCache else None
+        if capabilities is None:
+            capabilities = self._probeDevice()
+            if saveCache:
+                _saveProfile("capabilities", serial, capabilities)
+            self._capabilitiesChecked = True
+        else:
+            self._capabilitiesChecked = False
+        self._saveCache = saveCache
+        self._setCapabilities(capabilities)
+        self.uploadProfile = _loadProfile("upload", serial)
+
+        if verbose:
+            print(
+                "DMD found, resolution = "
+                + str(self.nSizeX)
+                + " x "
+                + str(self.nSizeY)
+                + "."
+            )
+
+    def _probeDevice(self):
         self._checkError(
             self._ALPLib.AlpDevInquire(
                 self.ALP_ID, ALP_DEV_DMDTYPE, ct.byref(self.DMDType)
@@ -518,7 +3410,6 @@ class ALP4(object):
             ),
             "Inquery ALP_DEV_DISPLAY_WIDTH fails.",
         )
-        self.nSizeX = nSizeX.value
 
         nSizeY = ct.c_long(0)
         self._checkError(
@@ -527,15 +3418,104 @@ class ALP4(object):
             ),
             "Inquery ALP_DEV_DISPLAY_HEIGHT fails.",
         )
-        self.nSizeY = nSizeY.value
 
-        print(
-            "DMD found, resolution = "
-            + str(self.nSizeX)
-            + " x "
-            + str(self.nSizeY)
-            + "."
-        )
+        return {
+            "serial": self.serial,
+            "DMDType": self.DMDType.value,
+            "nSizeX": nSizeX.value,
+            "nSizeY": nSizeY.value,
+            "timing": {},
+        }
+
+    def _setCapabilities(self, capabilities):
+        self.capabilities = capabilities
+        self.DMDType.value = capabilities["DMDType"]
+        self.nSizeX = capabilities["nSizeX"]
+        self.nSizeY = capabilities["nSizeY"]
+
+    def _checkCapabilities(self):
+        # Lazy revalidation of cached capabilities: probe the device again and
+        # drop the timing limits if it does not match
+        self._capabilitiesChecked = True
+        capabilities = self._probeDevice()
+        cached = self.capabilities
+        if all(
+            cached[key] == capabilities[key] for key in ("DMDType", "nSizeX", "nSizeY")
+        ):
+            return
+        self._setCapabilities(capabilities)
+        if self._saveCache:
+            _saveProfile("capabilities", self.serial, capabilities)
+
+    def TimingLimits(self, bitDepth=1, binMode=ALP_BIN_NORMAL):
+        """
+        Return the timing limits of a sequence of a given bit depth (or ALP_BITNUM),
+        i.e. the values of ALP_MIN_PICTURE_TIME, ALP_MIN_ILLUMINATE_TIME and ALP_MAX_PICTURE_TIME.
+        They are probed once using a temporary sequence (the device must be able to allocate it)
+        and cached with the device capabilities.
+
+        Usage: TimingLimits(bitDepth = 1, binMode = ALP_BIN_NORMAL)
+
+        PARAMETERS
+        ----------
+        bitDepth : int, optional
+                   Bit depth (1 to 8).
+        binMode : int, optional
+                  ALP_BIN_NORMAL or ALP_BIN_UNINTERRUPTED, only used for a bit depth of 1.
+
+        RETURNS
+        -------
+        limits : tuple
+                 (minPictureTime, minIlluminateTime, maxPictureTime) in microseconds.
+        """
+        if not self._capabilitiesChecked:
+            self._checkCapabilities()
+
+        key = _timingKey(bitDepth, binMode)
+        timing = self.capabilities["timing"]
+        if key not in timing:
+            info = self._allocSeq(1, bitDepth)
+            try:
+                if bitDepth == 1:
+                    self._seqControl(info.SequenceId, ALP_BIN_MODE, binMode)
+                timing[key] = [
+                    self.SeqInquire(inquireType, info.SequenceId)
+                    for inquireType in (
+                        ALP_MIN_PICTURE_TIME,
+                        ALP_MIN_ILLUMINATE_TIME,
+                        ALP_MAX_PICTURE_TIME,
+                    )
+                ]
+            finally:
+                self._freeSeq(info.SequenceId)
+            if self._saveCache:
+                _saveProfile("capabilities", self.serial, self.capabilities)
+        return tuple(timing[key])
+
+    def ProbeCapabilities(self, save=True):
+        """
+        Probe the timing limits of all bit depths and binary modes (see TimingLimits)
+        so that they are available from the cache in later sessions.
+
+        Usage: ProbeCapabilities(save = True)
+
+        PARAMETERS
+        ----------
+        save : bool, optional
+               Save the capabilities for this device.
+
+        RETURNS
+        -------
+        capabilities : dict
+                       Serial number, DMD type, resolution and timing limits of the device.
+        """
+        self.TimingLimits(1, ALP_BIN_NORMAL)
+        self.TimingLimits(1, ALP_BIN_UNINTERRUPTED)
+        for bitDepth in range(2, 9):
+            self.TimingLimits(bitDepth)
+        if save and self.serial is not None:
+            _saveProfile("capabilities", self.serial, self.capabilities)
+        return self.capabilities
 
     def SeqAlloc(self, nbImg=1, bitDepth=1):
         """
@@ -570,10 +3550,42 @@ class ALP4(object):
 
         """
 
+        if not self._capabilitiesChecked:
+            self._checkCapabilities()
+
+        with self._stateLock:
+            if self.pool is not None:
+                info = self.pool.Acquire(nbImg, bitDepth)
+            else:
+                info = self._allocSeq(nbImg, bitDepth)
+            self._seqInfo[_seqKey(info.SequenceId)] = info
+
+            self._lastDDRseq = info.SequenceId
+        return info.SequenceId
+
+    def _sequence(self, SequenceId):
+        """
+        Return SequenceId, or the last allocated sequence if it is None.
+        """
+        if SequenceId is None:
+            SequenceId = self._lastDDRseq
+        return SequenceId
+
+    def _seqLock(self, SequenceId):
+        """
+        Return the lock serializing the uploads, controls and release of a sequence.
+        """
+        if not self.threadSafe:
+            return _NO_LOCK
+        key = _seqKey(SequenceId)
+        with self._stateLock:
+            lock = self._seqLocks.get(key)
+            if lock is None:
+                lock = self._seqLocks[key] = threading.RLock()
+        return lock
+
+    def _allocSeq(self, nbImg, bitDepth):
         SequenceId = ct.c_long(0)
-        self.Seqs.append(
-            SequenceId
-        )  # Put SequenceId in list of all Sequences to keep track of them
         # Allocate memory on the DDR RAM for the sequence of image.
         self._checkError(
             self._ALPLib.AlpSeqAlloc(
@@ -581,9 +3593,73 @@ class ALP4(object):
             ),
             "Cannot allocate image sequence.",
         )
+        return SequenceInfo(SequenceId, nbImg, bitDepth)
 
-        self._lastDDRseq = SequenceId
-        return SequenceId
+    @property
+    def Seqs(self):
+        """
+        List of the SequenceId of all allocated sequences.
+        """
+        with self._stateLock:
+            return [info.SequenceId for info in self._seqInfo.values()]
+
+    def SeqInfo(self, SequenceId=None):
+        """
+        Return the description of an allocated sequence (number of images, bit depth, memory footprint,
+        controls and timing set).
+
+        Usage: SeqInfo(SequenceId = None)
+
+        PARAMETERS
+        ----------
+        SequenceId : ctypes c_long, optional
+                     Identified of the sequence. If not specified, use the last sequence allocated in the DMD board memory
+
+        RETURNS
+        -------
+        info : SequenceInfo
+               Description of the sequence, None if the sequence was not allocated by this object.
+        """
+        SequenceId = self._sequence(SequenceId)
+        return self._seqInfo.get(_seqKey(SequenceId))
+
+    def EnablePool(self, maxMemory=None):
+        """
+        Keep the sequences released by FreeSeq allocated to reuse them in later calls to SeqAlloc
+        with a compatible shape (same bit depth, at most the same number of images).
+
+        Usage: EnablePool(maxMemory = None)
+
+        PARAMETERS
+        ----------
+        maxMemory : int, optional
+                    High-water mark of the memory used by the sequences in binary pictures
+                    (nbImg * bitDepth, same unit as ALP_AVAIL_MEMORY).
+
+        RETURNS
+        -------
+        pool : SequencePool
+               The pool, also available as the pool attribute.
+
+        SEE ALSO
+        --------
+        See SequencePool.
+        """
+        if self.pool is None:
+            self.pool = SequencePool(self, maxMemory)
+        else:
+            self.pool.maxMemory = maxMemory
+        return self.pool
+
+    def DisablePool(self):
+        """
+        Free the idle sequences of the pool and go back to freeing sequences in FreeSeq.
+
+        Usage: DisablePool()
+        """
+        if self.pool is not None:
+            self.pool.Clear()
+            self.pool = None
 
     def SeqPutEx(
         self,
@@ -647,35 +3723,62 @@ class ALP4(object):
                  By default dataFormat = 'Python'
         """
 
-        if not SequenceId:
-            SequenceId = self._lastDDRseq
-
-        LinePutParam = tAlpLinePut(
-            ALP_PUT_LINES,
-            ct.c_long(PicOffset),
-            ct.c_long(PicLoad),
-            ct.c_long(LineOffset),
-            ct.c_long(LineLoad),
-        )
+        SequenceId = self._sequence(SequenceId)
+        with self._seqLock(SequenceId):
+            info = self._seqInfo.get(_seqKey(SequenceId))
+            if PicLoad == 0:
+                # A sequence reused from the pool may be larger than requested
+                if info is not None and info.capacity > info.nbImg:
+                    PicLoad = info.nbImg - PicOffset
 
-        if dataFormat not in ["Python", "C"]:
-            raise ValueError('dataFormat must be one of "Python" or "C"')
+            LinePutParam = tAlpLinePut(
+                ALP_PUT_LINES,
+                ct.c_long(PicOffset),
+                ct.c_long(PicLoad),
+                ct.c_long(LineOffset),
+                ct.c_long(LineLoad),
+            )
 
-        if dataFormat == "Python":
-            temp = imgData.astype(np.uint8)
-            pImageData = temp.ctypes.data_as(ct.c_void_p)
-            # keep the temp array in memory using a temporary variable
-            # See (https://github.com/wavefrontshaping/ALP4lib/issues/29)
-        elif dataFormat == "C":
-            pImageData = ct.cast(imgData, ct.c_void_p)
+            if dataFormat not in ["Python", "C"]:
+                raise ValueError('dataFormat must be one of "Python" or "C"')
+
+            if dataFormat == "Python":
+                temp = None
+                if info is not None:
+                    # Unpacked lines sent to a sequence of packed binary data
+                    temp = self._packBinary(
+                        imgData,
+                        info,
+                        PicLoad if PicLoad else info.nbImg - PicOffset,
+                        LineLoad if LineLoad else self.nSizeY - LineOffset,
+                    )
+                if temp is None:
+                    temp = np.ascontiguousarray(imgData, dtype=np.uint8)
+                pImageData = temp.ctypes.data_as(ct.c_void_p)
+                # keep the temp array in memory using a temporary variable
+                # See (https://github.com/wavefrontshaping/ALP4lib/issues/29)
+            elif dataFormat == "C":
+                pImageData = ct.cast(imgData, ct.c_void_p)
+
+            if dataFormat == "Python":
+                self._transferHint(temp.nbytes)
 
-        self._checkError(
-            self._ALPLib.AlpSeqPutEx(self.ALP_ID, SequenceId, LinePutParam, pImageData),
-            "Cannot send image sequence to device.",
-        )
+            self._checkError(
+                self._ALPLib.AlpSeqPutEx(
+                    self.ALP_ID, SequenceId, LinePutParam, pImageData
+                ),
+                "Cannot send image sequence to device.",
+            )
 
     def SeqPut(
-        self, imgData, SequenceId=None, PicOffset=0, PicLoad=0, dataFormat="Python"
+        self,
+        imgData,
+        SequenceId=None,
+        PicOffset=0,
+        PicLoad=0,
+        dataFormat="Python",
+        autoPack=False,
+        chunkSize=None,
     ):
         """
         This  function  allows  loading user  supplied  data  via  the  USB  connection  into  the  ALP  memory  of  a
@@ -715,6 +3818,16 @@ class ALP4(object):
                  Should be ' Python' or 'C'.
                  If the data is of Python format, it is converted into a C array before sending to the DMD via the dll.
                  By default dataFormat = 'Python'
+        autoPack : bool, optional
+                   If True, unpacked Python data loaded into a sequence of bit depth 1 is packed
+                   (one bit per pixel instead of one byte) and the data format of the sequence is set to
+                   ALP_DATA_BINARY_TOPDOWN, which divides the amount of data sent over USB by 8.
+                   Unpacked data loaded into a sequence already in a packed binary format is always packed.
+                   By default autoPack = False.
+        chunkSize : int, optional
+                    Number of pictures sent in each call to AlpSeqPut, 0 to send all of them at once.
+                    If not specified, use the best chunk size measured by TuneUpload for this device
+                    and bit depth (only for Python data in sequences allocated by SeqAlloc).
 
         SEE ALSO
         --------
@@ -722,29 +3835,300 @@ class ALP4(object):
         See ALPLib.AlpSeqPut in the ALP API description for more information.
         """
 
-        if not SequenceId:
-            SequenceId = self._lastDDRseq
-
-        if dataFormat == "Python":
-            temp = imgData.astype(np.uint8)
-            pImageData = temp.ctypes.data_as(ct.c_void_p)
-            # keep the temp array in memory using a temporary variable
-            # See (https://github.com/wavefrontshaping/ALP4lib/issues/29)
-        elif dataFormat == "C":
-            pImageData = ct.cast(imgData, ct.c_void_p)
-        else:
-            raise ValueError('dataFormat must be one of "Python" or "C"')
+        SequenceId = self._sequence(SequenceId)
+        with self._seqLock(SequenceId):
+            info = self._seqInfo.get(_seqKey(SequenceId))
+            if PicLoad == 0:
+                # A sequence reused from the pool may be larger than requested
+                if info is not None and info.capacity > info.nbImg:
+                    PicLoad = info.nbImg - PicOffset
+
+            if dataFormat == "Python":
+                temp = None
+                if info is not None:
+                    temp = self._packBinary(
+                        imgData,
+                        info,
+                        PicLoad if PicLoad else info.nbImg - PicOffset,
+                        autoPack=autoPack,
+                    )
+                if temp is None:
+                    temp = np.ascontiguousarray(imgData, dtype=np.uint8)
+                pImageData = temp.ctypes.data_as(ct.c_void_p)
+                nbytes = temp.nbytes
+                # keep the temp array in memory using a temporary variable
+                # See (https://github.com/wavefrontshaping/ALP4lib/issues/29)
+                if (
+                    self._recovery is not None
+                    and self._recovery["retainData"]
+                    and info is not None
+                    and info.source is None
+                ):
+                    if np.may_share_memory(temp, imgData):
+                        temp = temp.copy()
+                        pImageData = temp.ctypes.data_as(ct.c_void_p)
+                    info.Retain(
+                        PicOffset, PicLoad if PicLoad else info.nbImg - PicOffset, temp
+                    )
+            elif dataFormat == "C":
+                pImageData = ct.cast(imgData, ct.c_void_p)
+                nbytes = 0
+            else:
+                raise ValueError('dataFormat must be one of "Python" or "C"')
+
+            if dataFormat == "C" or info is None:
+                self._seqPut(SequenceId, PicOffset, PicLoad, pImageData, nbytes)
+                return
+
+            nbImg = PicLoad if PicLoad else info.nbImg - PicOffset
+            if chunkSize is None:
+                chunkSize = self._uploadChunkSize(info.bitDepth)
+            # Size of one picture in the ALP_DATA_FORMAT of the sequence, the data may hold more pictures than loaded
+            if info.controls.get(ALP_DATA_FORMAT) in (
+                ALP_DATA_BINARY_TOPDOWN,
+                ALP_DATA_BINARY_BOTTOMUP,
+            ):
+                frameBytes = self.nSizeY * self._packedRowBytes()
+            else:
+                frameBytes = self.nSizeY * self.nSizeX
+            if not chunkSize or nbImg <= chunkSize or nbytes < nbImg * frameBytes:
+                self._seqPut(SequenceId, PicOffset, PicLoad, pImageData, nbytes)
+                return
+
+            for first in range(0, nbImg, chunkSize):
+                load = min(chunkSize, nbImg - first)
+                self._seqPut(
+                    SequenceId,
+                    PicOffset + first,
+                    load,
+                    ct.c_void_p(temp.ctypes.data + first * frameBytes),
+                    load * frameBytes,
+                )
+
+    def _seqPut(self, SequenceId, PicOffset, PicLoad, pImageData, nbytes=0):
+        self._transferHint(nbytes)
+
+        self._checkError(
+            self._ALPLib.AlpSeqPut(
+                self.ALP_ID,
+                SequenceId,
+                ct.c_long(PicOffset),
+                ct.c_long(PicLoad),
+                pImageData,
+            ),
+            "Cannot send image sequence to device.",
+        )
+
+    def _uploadChunkSize(self, bitDepth):
+        if self.uploadProfile is None:
+            return 0
+        return self.uploadProfile["chunkSize"].get(str(bitDepth), 0)
+
+    def TuneUpload(
+        self,
+        bitDepths=(1, 8),
+        chunkSizes=(0, 1, 2, 4, 8, 16),
+        nbImg=32,
+        imgData=None,
+        repeat=3,
+        save=True,
+    ):
+        """
+        Measure the upload throughput of SeqPut for different numbers of pictures sent per call to AlpSeqPut
+        (chunk sizes) and bit depths, and select the fastest chunk size for each bit depth.
+        The result is used by SeqPut when no chunkSize is given, and saved in PROFILE_DIR
+        to be loaded by Initialize for this device (ALP_DEVICE_NUMBER) in later sessions.
+
+        The device must be idle; a temporary sequence of nbImg pictures is allocated for each bit depth.
+
+        Usage: TuneUpload(bitDepths = (1, 8), chunkSizes = (0, 1, 2, 4, 8, 16), nbImg = 32, imgData = None, repeat = 3, save = True)
+
+        PARAMETERS
+        ----------
+        bitDepths : sequence of int, optional
+                    Bit depths to tune.
+        chunkSizes : sequence of int, optional
+                     Candidate numbers of pictures per call, 0 meaning all pictures in one call.
+        nbImg : int, optional
+                Number of pictures uploaded in each measurement.
+        imgData : array, optional
+                  Representative data of nbImg pictures (compressibility affects the transfer rate).
+                  By default, random (incompressible) data is used.
+        repeat : int, optional
+                 Number of measurements for each candidate, the fastest one is kept.
+        save : bool, optional
+               Save the profile for this device.
+
+        RETURNS
+        -------
+        profile : dict
+                  'chunkSize': best chunk size by bit depth,
+                  'throughput': measured pictures per second by bit depth and chunk size.
+        """
+        if imgData is None:
+            imgData = np.random.randint(
+                0, 256, size=nbImg * self.nSizeX * self.nSizeY, dtype=np.uint8
+            )
+        profile = {
+            "serial": self.serial,
+            "chunkSize": {},
+            "throughput": {},
+        }
+        for bitDepth in bitDepths:
+            SequenceId = self.SeqAlloc(nbImg=nbImg, bitDepth=bitDepth)
+            throughput = {}
+            try:
+                for chunkSize in chunkSizes:
+                    if chunkSize > nbImg:
+                        continue
+                    best = float("inf")
+                    for _ in range(repeat):
+                        start = _clock()
+                        self.SeqPut(imgData, SequenceId, chunkSize=chunkSize)
+                        best = min(best, _clock() - start)
+                    throughput[str(chunkSize)] = nbImg / best if best > 0 else 0.0
+            finally:
+                self.FreeSeq(SequenceId)
+            profile["throughput"][str(bitDepth)] = throughput
+            profile["chunkSize"][str(bitDepth)] = int(
+                max(throughput, key=throughput.get)
+            )
+
+        self.uploadProfile = profile
+        if save and self.serial is not None:
+            _saveProfile("upload", self.serial, profile)
+        return profile
+
+    def _packBinary(self, imgData, info, nbImg, nbLines=None, autoPack=False):
+        # Pack unpacked binary data of nbImg frames of nbLines rows when the sequence expects packed data
+        # (ALP_DATA_BINARY_TOPDOWN or ALP_DATA_BINARY_BOTTOMUP), or with autoPack after switching the sequence
+        # to ALP_DATA_BINARY_TOPDOWN; return None if the data is sent as is
+        if info is None or info.bitDepth != 1:
+            return None
+        packedFormat = info.controls.get(ALP_DATA_FORMAT) in (
+            ALP_DATA_BINARY_TOPDOWN,
+            ALP_DATA_BINARY_BOTTOMUP,
+        )
+        if not (packedFormat or autoPack):
+            return None
+        if nbLines is None:
+            nbLines = self.nSizeY
+        imgArray = np.asarray(imgData)
+        if imgArray.size != nbImg * nbLines * self.nSizeX:
+            return None
+        bit = 0 if info.dataAlign == ALP_DATA_LSB_ALIGN else 7
+        packed = pack_binary(imgArray, self.nSizeX, self.DMDType.value, bit)
+        if not packedFormat:
+            self._seqControl(info.SequenceId, ALP_DATA_FORMAT, ALP_DATA_BINARY_TOPDOWN)
+        return packed
+
+    def SeqPutAuto(
+        self, imgData, SequenceId=None, PicOffset=0, PicLoad=0, lsb=False, invert=False
+    ):
+        """
+        Load image data like SeqPut, but select the data format of the sequence matching the layout
+        of the data instead of transforming it on the host:
+
+        - packed binary frames (last dimension of nSizeX / 8 bytes, bit depth 1) use ALP_DATA_BINARY_TOPDOWN,
+        - vertically flipped views (e.g. imgData[:, ::-1, :]) of packed frames use ALP_DATA_BINARY_BOTTOMUP,
+        - unpacked data using the bitDepth lowest bits (lsb = True) use ALP_DATA_LSB_ALIGN instead of a left shift,
+        - unpacked data of binary sequences is packed and sent as ALP_DATA_BINARY_TOPDOWN
+          (or ALP_DATA_BINARY_BOTTOMUP for flipped views).
+
+        Flipped views of unpacked gray-scale frames are copied, and invert = True inverts the data on the host:
+        ALP_PROJ_UPSIDE_DOWN and ALP_PROJ_INVERSION would also apply to the other sequences.
+
+        Usage: SeqPutAuto(imgData, SequenceId = None, PicOffset = 0, PicLoad = 0, lsb = False, invert = False)
+
+        PARAMETERS
+        ----------
+        imgData : ndarray
+                  Image data, of shape (nbImg, nSizeY, nSizeX) or (nSizeY, nSizeX) for unpacked data,
+                  (nbImg, nSizeY, nSizeX / 8) or (nSizeY, nSizeX / 8) for packed binary data,
+                  or 1D for unpacked data without flip detection.
+        SequenceId : ctypes c_long, optional
+                     Sequence identifier. If not specified, set the last sequence allocated in the DMD board memory
+        PicOffset, PicLoad : int, optional
+                             See SeqPut.
+        lsb : bool, optional
+              The unpacked values use the bitDepth lowest bits of each byte (0 to 2^bitDepth - 1),
+              instead of the highest ones.
+        invert : bool, optional
+                 Display the inverted images (dark into bright).
+
+        RETURNS
+        -------
+        report : dict
+                 'dataFormat': ALP_DATA_FORMAT value used,
+                 'avoided': list of the host transforms replaced by the device ('flip', 'shift'),
+                 'copied': True if the data still had to be converted to a contiguous uint8 array.
+        """
+        SequenceId = self._sequence(SequenceId)
+        with self._seqLock(SequenceId):
+            info = self._seqInfo.get(_seqKey(SequenceId))
+            if info is not None:
+                bitDepth = info.bitDepth
+            else:
+                bitDepth = self.SeqInquire(ALP_BITPLANES, SequenceId)
+
+            imgArray = np.asarray(imgData)
+            avoided = []
+            rowBytes = self._packedRowBytes()
+            packed = (
+                bitDepth == 1
+                and imgArray.ndim >= 2
+                and imgArray.shape[-1] == rowBytes
+                and imgArray.shape[-1] != self.nSizeX
+            )
+            # Only binary sequences have a bottom-up data format
+            flipped = bitDepth == 1 and imgArray.ndim >= 2 and imgArray.strides[-2] < 0
+            if flipped:
+                # Send the memory in its original order and let the device flip it
+                imgArray = imgArray[..., ::-1, :]
+                avoided.append("flip")
+
+            lsb = lsb and bitDepth < 8
+            if lsb and not packed:
+                avoided.append("shift")
+            if bitDepth == 1 and not packed:
+                # Binary sequence: send one bit per pixel
+                imgArray = pack_binary(
+                    imgArray, self.nSizeX, self.DMDType.value, 0 if lsb else 7
+                )
+                packed = True
+            if packed:
+                if flipped:
+                    dataFormat = ALP_DATA_BINARY_BOTTOMUP
+                else:
+                    dataFormat = ALP_DATA_BINARY_TOPDOWN
+            elif lsb:
+                dataFormat = ALP_DATA_LSB_ALIGN
+            else:
+                dataFormat = ALP_DATA_MSB_ALIGN
+
+            copied = invert or not (
+                imgArray.dtype == np.uint8 and imgArray.flags.c_contiguous
+            )
+            if invert:
+                imgArray = imgArray.astype(np.uint8, copy=False)
+                if packed or not lsb:
+                    imgArray = np.invert(imgArray)
+                else:
+                    imgArray = np.bitwise_xor(imgArray, 2**bitDepth - 1)
+
+            if info is None or info.controls.get(ALP_DATA_FORMAT) != dataFormat:
+                self.SeqControl(ALP_DATA_FORMAT, dataFormat, SequenceId)
+            self.SeqPut(
+                imgArray, SequenceId=SequenceId, PicOffset=PicOffset, PicLoad=PicLoad
+            )
+            return {
+                "dataFormat": dataFormat,
+                "avoided": avoided,
+                "copied": copied,
+            }
 
-        self._checkError(
-            self._ALPLib.AlpSeqPut(
-                self.ALP_ID,
-                SequenceId,
-                ct.c_long(PicOffset),
-                ct.c_long(PicLoad),
-                pImageData,
-            ),
-            "Cannot send image sequence to device.",
-        )
+    def _packedRowBytes(self):
+        return packed_row_bytes(self.nSizeX, self.DMDType.value)
 
     def ImgToBitPlane(self, imgArray, bitShift=0):
         """
@@ -821,24 +4205,36 @@ class ALP4(object):
         --------
         See ALPLib.AlpSeqAlloc in the ALP API description for more information.
         """
-        if (SequenceId is None) and (self._lastDDRseq):
-            SequenceId = self._lastDDRseq
+        SequenceId = self._sequence(SequenceId)
         if SequenceId is None:
             raise ValueError("No sequence to display.")
-
-        if synchDelay is None:
-            synchDelay = ALP_DEFAULT
-        if synchPulseWidth is None:
-            synchPulseWidth = ALP_DEFAULT
-        if triggerInDelay is None:
-            triggerInDelay = ALP_DEFAULT
-        if illuminationTime is None:
-            illuminationTime = ALP_DEFAULT
-        if pictureTime is None:
-            pictureTime = ALP_DEFAULT
-
-        self._checkError(
-            self._ALPLib.AlpSeqTiming(
+        with self._seqLock(SequenceId):
+            if self.health is not None and self.health.pictureTimeScale != 1.0:
+                # Slow down the sequences set up while the device is hot, keeping their illumination time
+                if pictureTime is None:
+                    if illuminationTime is None:
+                        # Default of the dll (30 Hz)
+                        pictureTime = 33334
+                    else:
+                        # Picture time chosen by the dll: shortest dark phase
+                        pictureTime = (
+                            illuminationTime
+                            + self.SeqInquire(ALP_MIN_PICTURE_TIME, SequenceId)
+                            - self.SeqInquire(ALP_MIN_ILLUMINATE_TIME, SequenceId)
+                        )
+                pictureTime = self.health.ThrottledPictureTime(pictureTime)
+            if synchDelay is None:
+                synchDelay = ALP_DEFAULT
+            if synchPulseWidth is None:
+                synchPulseWidth = ALP_DEFAULT
+            if triggerInDelay is None:
+                triggerInDelay = ALP_DEFAULT
+            if illuminationTime is None:
+                illuminationTime = ALP_DEFAULT
+            if pictureTime is None:
+                pictureTime = ALP_DEFAULT
+
+            returnValue = self._ALPLib.AlpSeqTiming(
                 self.ALP_ID,
                 SequenceId,
                 ct.c_long(illuminationTime),
@@ -846,9 +4242,28 @@ class ALP4(object):
                 ct.c_long(synchDelay),
                 ct.c_long(synchPulseWidth),
                 ct.c_long(triggerInDelay),
-            ),
-            "Cannot set timing.",
-        )
+            )
+            if returnValue == ALP_PARM_INVALID and self.capabilities is not None:
+                # The cached timing limits of this bit depth may be outdated, probe them again when needed
+                info = self._seqInfo.get(_seqKey(SequenceId))
+                if info is not None:
+                    bitNum = info.controls.get(ALP_BITNUM, info.bitDepth)
+                    binMode = info.controls.get(ALP_BIN_MODE, ALP_BIN_NORMAL)
+                else:
+                    bitNum = self.SeqInquire(ALP_BITNUM, SequenceId)
+                    binMode = self.SeqInquire(ALP_BIN_MODE, SequenceId)
+                self.capabilities["timing"].pop(_timingKey(bitNum, binMode), None)
+            self._checkError(returnValue, "Cannot set timing.")
+
+            info = self._seqInfo.get(_seqKey(SequenceId))
+            if info is not None:
+                info.timing = (
+                    illuminationTime,
+                    pictureTime,
+                    synchDelay,
+                    synchPulseWidth,
+                    triggerInDelay,
+                )
 
     def DevInquire(self, inquireType):
         """
@@ -912,8 +4327,7 @@ class ALP4(object):
         """
         ret = ct.c_long(0)
 
-        if (SequenceId is None) and (self._lastDDRseq):
-            SequenceId = self._lastDDRseq
+        SequenceId = self._sequence(SequenceId)
 
         self._checkError(
             self._ALPLib.AlpSeqInquire(
@@ -933,7 +4347,7 @@ class ALP4(object):
         request : ctypes c_ulong
                   Sepcifies the type of value to return.
         SequenceId : ctyles c_long, optional
-                     Identified of the sequence. If not specified, set the last sequence allocated in the DMD board memory
+                     Not used (AlpProjInquire does not take a sequence), kept for compatibility.
 
         RETURNS
         -------
@@ -948,50 +4362,45 @@ class ALP4(object):
         """
         ret = ct.c_long(0)
 
-        if (SequenceId is None) and (self._lastDDRseq):
-            SequenceId = self._lastDDRseq
-
         self._checkError(
-            self._ALPLib.AlpProjInquire(
-                self.ALP_ID, SequenceId, inquireType, ct.byref(ret)
-            ),
+            self._ALPLib.AlpProjInquire(self.ALP_ID, inquireType, ct.byref(ret)),
             "Error sending request.",
         )
         return ret.value
 
-    def ProjInquireEx(self, inquireType):
+    def ProjInquireEx(self, inquireType=ALP_PROJ_PROGRESS):
         """
         Data objects that do not fit into a simple 32-bit number can be inquired using this function.
         Meaning and layout of the data depend on the InquireType.
 
-        Usage: ProjInquireEx(self, inquireType, UserStructPtr)
+        Usage: ProjInquireEx(self, inquireType = ALP_PROJ_PROGRESS)
 
         PARAMETERS
         ----------
 
         inquireType : ctypes c_ulong
-                      Sepcifies the type of value to return.
+                      Sepcifies the type of value to return. Only ALP_PROJ_PROGRESS is defined by the API.
 
         RETURNS
         -------
 
-        UserStructPtr : ctypes POINTER
-                        Pointer to a data structure which shall be filled out by AlpSeqInquireEx.
+        UserStruct : tAlpProjProgress
+                     Data structure filled out by AlpProjInquireEx.
 
 
         SEE ALSO
         --------
         See AlpProjInquireEx in the ALP API description for request types.
         """
-        UserStructPtr = ct.c_double(0)
+        UserStruct = tAlpProjProgress()
 
         self._checkError(
-            self._ALPLib.AlpProjInquire(
-                self.ALP_ID, inquireType, ct.byref(UserStructPtr)
+            self._ALPLib.AlpProjInquireEx(
+                self.ALP_ID, inquireType, ct.byref(UserStruct)
             ),
             "Error sending request.",
         )
-        return UserStructPtr
+        return UserStruct
 
     def DevControl(self, controlType, value):
         """
@@ -1010,10 +4419,13 @@ class ALP4(object):
         --------
         See AlpDevControl in the ALP API description for control types.
         """
-        self._checkError(
-            self._ALPLib.AlpDevControl(self.ALP_ID, controlType, ct.c_long(value)),
-            "Error sending request.",
-        )
+        with self._projLock:
+            self._checkError(
+                self._ALPLib.AlpDevControl(self.ALP_ID, controlType, ct.c_long(value)),
+                "Error sending request.",
+            )
+            if controlType != ALP_USB_CONNECTION:
+                self._devControls[controlType] = value
 
     def DevControlEx(self, controlType, userStruct):
         """
@@ -1036,12 +4448,14 @@ class ALP4(object):
 
         See AlpDevControlEx in the ALP API description for control types.
         """
-        self._checkError(
-            self._ALPLib.AlpDevControlEx(
-                self.ALP_ID, controlType, ct.byref(userStruct)
-            ),
-            "Error sending request.",
-        )
+        with self._projLock:
+            self._checkError(
+                self._ALPLib.AlpDevControlEx(
+                    self.ALP_ID, controlType, ct.byref(userStruct)
+                ),
+                "Error sending request.",
+            )
+            self._devControls[controlType] = _structCopy(userStruct)
 
     def ProjControl(self, controlType, value):
         """
@@ -1066,10 +4480,12 @@ class ALP4(object):
 
         See AlpProjControl in the ALP API description for control types.
         """
-        self._checkError(
-            self._ALPLib.AlpProjControl(self.ALP_ID, controlType, ct.c_long(value)),
-            "Error sending request.",
-        )
+        with self._projLock:
+            self._checkError(
+                self._ALPLib.AlpProjControl(self.ALP_ID, controlType, ct.c_long(value)),
+                "Error sending request.",
+            )
+            self._projControls[controlType] = value
 
     def ProjControlEx(self, controlType, pointerToStruct):
         """
@@ -1093,10 +4509,14 @@ class ALP4(object):
         --------
         See AlpProjControlEx in the ALP API description for control types.
         """
-        self._checkError(
-            self._ALPLib.AlpProjControlEx(self.ALP_ID, controlType, pointerToStruct),
-            "Error sending request.",
-        )
+        with self._projLock:
+            self._checkError(
+                self._ALPLib.AlpProjControlEx(
+                    self.ALP_ID, controlType, pointerToStruct
+                ),
+                "Error sending request.",
+            )
+            self._projControlsEx[controlType] = _structCopy(pointerToStruct)
 
     def SeqControl(self, controlType, value, SequenceId=None):
         """
@@ -1126,20 +4546,55 @@ class ALP4(object):
         See AlpSeqControl in the ALP API description for control types.
         """
 
-        if (SequenceId is None) and (self._lastDDRseq):
-            SequenceId = self._lastDDRseq
+        SequenceId = self._sequence(SequenceId)
+        with self._seqLock(SequenceId):
+            self._seqControl(SequenceId, controlType, value)
 
+    def _seqControl(self, SequenceId, controlType, value):
         self._checkError(
             self._ALPLib.AlpSeqControl(
                 self.ALP_ID, SequenceId, controlType, ct.c_long(value)
             ),
             "Error sending request.",
         )
+        info = self._seqInfo.get(_seqKey(SequenceId))
+        if info is not None:
+            info.controls[controlType] = value
+            if controlType in (ALP_FIRSTFRAME, ALP_LASTFRAME, ALP_SEQ_REPEAT):
+                # Settings chosen by the user replace the ones to restore after a resume
+                self._restore.pop(_seqKey(SequenceId), None)
+            if controlType == ALP_DATA_FORMAT and value in (
+                ALP_DATA_MSB_ALIGN,
+                ALP_DATA_LSB_ALIGN,
+            ):
+                info.dataAlign = value
+
+    def _setFrameWindow(self, SequenceId, first, last, repeat=None):
+        # Set ALP_FIRSTFRAME and ALP_LASTFRAME (and ALP_SEQ_REPEAT) in the order keeping first <= last
+        # at each step: the dll rejects a first frame after the current last frame
+        self._restore.pop(_seqKey(SequenceId), None)
+        info = self._seqInfo.get(_seqKey(SequenceId))
+        if info is not None:
+            controls = info.controls
+            currentLast = controls.get(ALP_LASTFRAME, info.nbImg - 1)
+        else:
+            controls = {}
+            currentLast = self.SeqInquire(ALP_LASTFRAME, SequenceId)
+        settings = [(ALP_FIRSTFRAME, first), (ALP_LASTFRAME, last)]
+        if first > currentLast:
+            settings.reverse()
+        if repeat is not None:
+            settings.append((ALP_SEQ_REPEAT, repeat))
+        for controlType, value in settings:
+            if controls.get(controlType) != value:
+                self._seqControl(SequenceId, controlType, value)
 
     def FreeSeq(self, SequenceId=None):
         """
         Frees a previously allocated sequence. The ALP memory reserved for the specified sequence in the device DeviceId is released.
-
+        If the sequence pool is enabled (see EnablePool), the sequence is kept allocated to be reused by SeqAlloc,
+        unless other sequences wait in the queue: it is then freed by AlpSeqFree, which fails if it is one of them.
+        ALPError(ALP_SEQ_IN_USE) is raised for a sequence being displayed.
 
         Usage: FreeSeq(SequenceId = None)
 
@@ -1150,16 +4605,623 @@ class ALP4(object):
                      Identified of the sequence. If not specified, free the last sequence allocated in the DMD board memory
         """
 
-        if (SequenceId is None) and (self._lastDDRseq):
-            SequenceId = self._lastDDRseq
-
-        self.Seqs.remove(SequenceId)  # Removes the last SequenceId from sequence list
+        SequenceId = self._sequence(SequenceId)
+
+        # Wait for the uploads to the sequence running on other threads
+        with self._seqLock(SequenceId):
+            freed = False
+            if self.pool is not None:
+                progress = self.ProjInquireEx(ALP_PROJ_PROGRESS)
+                if not progress.nFlagse & ALP_FLAG_QUEUE_IDLE.value:
+                    # A sequence still displayed must not be reused
+                    if progress.SequenceId == _seqKey(SequenceId):
+                        raise ALPError(ALP_SEQ_IN_USE)
+                    if progress.nWaitingSequences:
+                        # The queued sequences are unknown: AlpSeqFree refuses to free one of them
+                        self._checkError(
+                            self._ALPLib.AlpSeqFree(self.ALP_ID, SequenceId),
+                            "Unable to free the image sequence.",
+                        )
+                        freed = True
+            with self._stateLock:
+                key = _seqKey(SequenceId)
+                info = self._seqInfo.pop(key, None)
+                self._seqLocks.pop(key, None)
+                # Forget the displays to resume, the sequence can be reused by another owner
+                self._restore.pop(key, None)
+                self._display = [
+                    entry for entry in self._display if _seqKey(entry[0]) != key
+                ]
+                if freed:
+                    return
+                if (self.pool is not None) and (info is not None):
+                    self.pool.Release(info)
+                    return
+            self._freeSeq(SequenceId)
+
+    def _freeSeq(self, SequenceId):
         self._checkError(
             self._ALPLib.AlpSeqFree(self.ALP_ID, SequenceId),
             "Unable to free the image sequence.",
             warning=True,
         )
 
+    def SetXShear(self, angle=None, offsets=None, pivot=0, rowOffset=0):
+        """
+        Write the horizontal shear table (ALP_X_SHEAR) applied by the device to the sequences for which
+        it is selected (see SelectXShear). Each row of the displayed images is shifted to the right
+        by a number of pixels, so that the patterns can be tilted or steered without uploading them again.
+
+        Usage: SetXShear(angle = None, offsets = None, pivot = 0, rowOffset = 0)
+
+        PARAMETERS
+        ----------
+        angle : float, optional
+                Shear angle in degrees, see shear_offsets.
+        offsets : 1D array, optional
+                  Shift of each row in pixels (0 to 511), used instead of angle.
+        pivot : int, optional
+                Row with no relative shift when angle is used.
+        rowOffset : int, optional
+                    First row of the table to write when offsets is used.
+
+        SEE ALSO
+        --------
+        See ALP_X_SHEAR in the ALP API description.
+        """
+        if offsets is None:
+            if angle is None:
+                raise ValueError("Specify angle or offsets.")
+            offsets = shear_offsets(self.nSizeY, angle, pivot)
+        table = shear_table(offsets, rowOffset)
+        self.ProjControlEx(ALP_X_SHEAR, ct.byref(table))
+
+    def SelectXShear(self, enable=True, SequenceId=None):
+        """
+        Enable or disable the shear table (see SetXShear) for a sequence.
+
+        Usage: SelectXShear(enable = True, SequenceId = None)
+
+        PARAMETERS
+        ----------
+        enable : bool, optional
+                 Apply the shear table to the sequence.
+        SequenceId : ctypes c_long, optional
+                     Identified of the sequence. If not specified, use the last sequence allocated in the DMD board memory
+        """
+        self.SeqControl(
+            ALP_X_SHEAR_SELECT, ALP_ENABLE if enable else ALP_DEFAULT, SequenceId
+        )
+
+    def SetSynchGates(self, out1=None, out2=None, out3=None):
+        """
+        Configure the dynamic gates of the three synch outputs (ALP_DEV_DYN_SYNCH_OUT[1..3]_GATE),
+        e.g. to trigger a camera only on the frames it needs.
+
+        Usage: SetSynchGates(out1 = None, out2 = None, out3 = None)
+
+        PARAMETERS
+        ----------
+        out1, out2, out3 : optional
+                           Gate of each output: a tAlpDynSynchOutGate, an int n to pulse on one frame out of n,
+                           a sequence of frame enables (1 to 16 frames), a dict of synch_gate arguments,
+                           or False to disable the output. None leaves the output unchanged.
+
+        RETURNS
+        -------
+        gates : dict
+                Gates written, by output number (1 to 3).
+
+        SEE ALSO
+        --------
+        See synch_gate and gate_frames.
+        """
+        gates = {}
+        for output, spec in enumerate((out1, out2, out3), 1):
+            if spec is None:
+                continue
+            if isinstance(spec, tAlpDynSynchOutGate):
+                gate = spec
+                if gate.Period > 16 or gate.Polarity not in (0, 1):
+                    raise ValueError("Invalid gate of output {0}.".format(output))
+            elif spec is False:
+                gate = synch_gate()
+            elif isinstance(spec, dict):
+                gate = synch_gate(**spec)
+            elif isinstance(spec, six.integer_types):
+                gate = synch_gate(every=spec)
+            else:
+                gate = synch_gate(mask=spec)
+            gates[output] = gate
+
+        controlTypes = {
+            1: ALP_DEV_DYN_SYNCH_OUT1_GATE,
+            2: ALP_DEV_DYN_SYNCH_OUT2_GATE,
+            3: ALP_DEV_DYN_SYNCH_OUT3_GATE,
+        }
+        for output, gate in gates.items():
+            self.DevControlEx(controlTypes[output], gate)
+        return gates
+
+    def SetDmdMask(self, mask, blockHeight=16, reduce="any", full=False):
+        """
+        Write the DMD block mask (ALP_DMD_MASK_WRITE). The blocks of 16 x blockHeight pixels that are
+        masked stay dark for the sequences for which the mask is selected (see SelectDmdMask),
+        without modifying the sequence data.
+        Only the rows of blocks that changed since the last call are written, unless full is True.
+
+        Usage: SetDmdMask(mask, blockHeight = 16, reduce = 'any', full = False)
+
+        PARAMETERS
+        ----------
+        mask : 2D array
+               Boolean mask (nSizeY, nSizeX), True for the pixels to display.
+        blockHeight : int, optional
+                      16 (ALP_DMD_MASK_16X16) or 8 (ALP_DMD_MASK_16X8, XGA only).
+        reduce : string, optional
+                 How the pixels of a block are combined, see dmd_mask_bitmap.
+        full : bool, optional
+               Write the whole mask.
+
+        RETURNS
+        -------
+        nRows : int
+                Number of rows of blocks written.
+
+        SEE ALSO
+        --------
+        See ALP_DMD_MASK_WRITE in the ALP API description.
+        """
+        bitmap = dmd_mask_bitmap(mask, blockHeight, reduce)
+        if bitmap.size > 2048:
+            raise ValueError("Mask bitmap exceeds 2048 bytes.")
+        previous = self._dmdMask
+        if (
+            full
+            or previous is None
+            or previous[0] != blockHeight
+            or previous[1].shape != bitmap.shape
+        ):
+            runs = [(0, bitmap.shape[0])]
+        else:
+            changed = np.flatnonzero((bitmap != previous[1]).any(axis=1))
+            # Split the changed rows into contiguous runs
+            splits = np.flatnonzero(np.diff(changed) > 1) + 1
+            runs = [
+                (run[0], run[-1] + 1) for run in np.split(changed, splits) if run.size
+            ]
+
+        self._writeDmdMask(bitmap, runs)
+        self._dmdMask = (blockHeight, bitmap)
+        return sum(last - first for first, last in runs)
+
+    def _writeDmdMask(self, bitmap, runs):
+        # Write the rows of blocks [first, last) of each run
+        for first, last in runs:
+            userStruct = tAlpDmdMask()
+            userStruct.nRowOffset = int(first)
+            userStruct.nRowCount = int(last - first)
+            data = bitmap[first:last].ravel()
+            np.ctypeslib.as_array(userStruct.Bitmap)[: data.size] = data
+            self.ProjControlEx(ALP_DMD_MASK_WRITE, ct.byref(userStruct))
+
+    def SelectDmdMask(self, enable=True, blockHeight=16, SequenceId=None):
+        """
+        Enable or disable the DMD block mask (see SetDmdMask) for a sequence.
+
+        Usage: SelectDmdMask(enable = True, blockHeight = 16, SequenceId = None)
+
+        PARAMETERS
+        ----------
+        enable : bool, optional
+                 Apply the mask to the sequence.
+        blockHeight : int, optional
+                      16 (ALP_DMD_MASK_16X16) or 8 (ALP_DMD_MASK_16X8, XGA only), as used in SetDmdMask.
+        SequenceId : ctypes c_long, optional
+                     Identified of the sequence. If not specified, use the last sequence allocated in the DMD board memory
+        """
+        if not enable:
+            value = ALP_DEFAULT
+        elif blockHeight == 16:
+            value = ALP_DMD_MASK_16X16
+        elif blockHeight == 8:
+            value = ALP_DMD_MASK_16X8
+        else:
+            raise ValueError("blockHeight must be 8 or 16.")
+        self.SeqControl(ALP_DMD_MASK_SELECT, value, SequenceId)
+
+    def PlanFrameRate(self, frameRate, grayBits=1, bitDepth=None, minGrayBits=1):
+        """
+        Find a configuration displaying a sequence at a target frame rate,
+        using the timing limits of the device (see TimingLimits).
+
+        The candidates are the numbers of displayed bit planes (ALP_BITNUM) from grayBits down to minGrayBits,
+        and for binary display the normal (with dark phase) and uninterrupted modes (ALP_BIN_MODE).
+        Among the candidates reaching the target frame rate, the one keeping the most bit planes is chosen,
+        and the fastest one for the same number of bit planes. If none reaches it, the fastest candidate is returned.
+        The illumination time is the longest one allowed by the picture time.
+
+        Usage: PlanFrameRate(frameRate, grayBits = 1, bitDepth = None, minGrayBits = 1)
+
+        PARAMETERS
+        ----------
+        frameRate : float
+                    Target frame rate in Hz.
+        grayBits : int, optional
+                   Number of bit planes wanted (1 for binary, 8 for 256 gray levels).
+        bitDepth : int, optional
+                   Bit depth of the sequence, by default grayBits.
+        minGrayBits : int, optional
+                      Fewest bit planes accepted to reach the frame rate.
+
+        RETURNS
+        -------
+        plan : dict
+               'bitDepth', 'bitNum' (ALP_BITNUM), 'binMode' (ALP_BIN_MODE for binary display, None otherwise),
+               'pictureTime' and 'illuminationTime' (None for the default of the uninterrupted mode) in microseconds,
+               'frameRate' expected, 'maxFrameRate' of this configuration
+               and 'feasible' (False if the target frame rate cannot be reached).
+        """
+        if bitDepth is None:
+            bitDepth = grayBits
+        minGrayBits = min(minGrayBits, grayBits)
+        if not 1 <= minGrayBits <= grayBits <= bitDepth <= 8:
+            raise ValueError(
+                "Bit depths must satisfy 1 <= minGrayBits <= grayBits <= bitDepth <= 8."
+            )
+        targetTime = int(1e6 // frameRate)
+
+        candidates = []
+        for bitNum in range(grayBits, minGrayBits - 1, -1):
+            if bitNum == 1:
+                candidates += [(1, ALP_BIN_NORMAL), (1, ALP_BIN_UNINTERRUPTED)]
+            else:
+                candidates.append((bitNum, None))
+        limits = [
+            self.TimingLimits(bitNum, binMode or ALP_BIN_NORMAL)
+            for bitNum, binMode in candidates
+        ]
+        feasible = [
+            minPicture <= targetTime <= maxPicture
+            for minPicture, _, maxPicture in limits
+        ]
+        if any(feasible):
+            # Most bit planes, then shortest minimum picture time
+            choice = min(
+                (i for i in range(len(candidates)) if feasible[i]),
+                key=lambda i: (-candidates[i][0], limits[i][0]),
+            )
+        else:
+            choice = min(range(len(candidates)), key=lambda i: limits[i][0])
+        bitNum, binMode = candidates[choice]
+        minPicture, minIlluminate, maxPicture = limits[choice]
+
+        pictureTime = min(max(targetTime, minPicture), maxPicture)
+        if binMode == ALP_BIN_UNINTERRUPTED:
+            illuminationTime = None
+        else:
+            illuminationTime = pictureTime - (minPicture - minIlluminate)
+        return {
+            "bitDepth": bitDepth,
+            "bitNum": bitNum,
+            "binMode": binMode,
+            "pictureTime": pictureTime,
+            "illuminationTime": illuminationTime,
+            "frameRate": 1e6 / pictureTime,
+            "maxFrameRate": 1e6 / minPicture,
+            "feasible": feasible[choice],
+        }
+
+    def SetFrameRate(self, frameRate, grayBits=None, SequenceId=None, minGrayBits=None):
+        """
+        Configure a sequence to be displayed at a target frame rate (see PlanFrameRate):
+        set ALP_BITNUM, ALP_BIN_MODE and the timing in one call.
+
+        Usage: SetFrameRate(frameRate, grayBits = None, SequenceId = None, minGrayBits = None)
+
+        PARAMETERS
+        ----------
+        frameRate : float
+                    Target frame rate in Hz.
+        grayBits : int, optional
+                   Number of bit planes to display, by default the bit depth of the sequence.
+        SequenceId : ctypes c_long, optional
+                     Identified of the sequence. If not specified, use the last sequence allocated in the DMD board memory
+        minGrayBits : int, optional
+                      Fewest bit planes accepted to reach the frame rate, by default grayBits.
+
+        RETURNS
+        -------
+        plan : dict
+               Configuration applied, see PlanFrameRate.
+        """
+        SequenceId = self._sequence(SequenceId)
+        info = self._seqInfo.get(_seqKey(SequenceId))
+        if info is not None:
+            bitDepth = info.bitDepth
+        else:
+            bitDepth = self.SeqInquire(ALP_BITPLANES, SequenceId)
+        if grayBits is None:
+            grayBits = bitDepth
+        if minGrayBits is None:
+            minGrayBits = grayBits
+
+        plan = self.PlanFrameRate(frameRate, grayBits, bitDepth, minGrayBits)
+        if not plan["feasible"]:
+            raise ValueError(
+                "{0} Hz cannot be reached with {1} bit planes (maximum {2:.1f} Hz).".format(
+                    frameRate, grayBits, plan["maxFrameRate"]
+                )
+            )
+        if plan["bitNum"] < bitDepth or (
+            info is not None and ALP_BITNUM in info.controls
+        ):
+            self.SeqControl(ALP_BITNUM, plan["bitNum"], SequenceId)
+        if plan["binMode"] is not None:
+            self.SeqControl(ALP_BIN_MODE, plan["binMode"], SequenceId)
+        self.SetTiming(
+            SequenceId,
+            illuminationTime=plan["illuminationTime"],
+            pictureTime=plan["pictureTime"],
+        )
+        return plan
+
+    def CompileSchedule(self, items, bitDepth=1, binMode=ALP_BIN_NORMAL):
+        """
+        Compile a list of (pattern, duration in microseconds) into sequences and queue entries,
+        checking the durations against the timing limits of the device (see compile_schedule and TimingLimits).
+
+        Usage: CompileSchedule(items, bitDepth = 1, binMode = ALP_BIN_NORMAL)
+
+        RETURNS
+        -------
+        plan : SchedulePlan
+               To be loaded with LoadSchedule and displayed with PlaySchedule.
+        """
+        minPictureTime, _, maxPictureTime = self.TimingLimits(bitDepth, binMode)
+        plan = compile_schedule(items, bitDepth, minPictureTime, maxPictureTime)
+        plan.binMode = binMode
+        return plan
+
+    def PhaseSteps(self, period, nSteps, angle=0.0, phase=0.0, mode="dither"):
+        """
+        Generate phase-stepped gratings at the resolution of the DMD (see phase_steps),
+        to be loaded with SeqPutAuto (packed modes into binary sequences, gray mode into 8-bit sequences).
+
+        Usage: PhaseSteps(period, nSteps, angle = 0., phase = 0., mode = 'dither')
+        """
+        return phase_steps(
+            self.nSizeX,
+            self.nSizeY,
+            period,
+            nSteps,
+            angle,
+            phase,
+            mode,
+            self.DMDType.value,
+        )
+
+    def SeqPutChunks(
+        self, frames, SequenceId=None, first=0, PicOffset=0, PicLoad=0, chunkSize=256
+    ):
+        """
+        Load packed binary frames produced by chunks (e.g. a RandomPatterns bank or a SparseFrames stack)
+        into a binary sequence, generating and uploading them by chunks so that only one chunk is held in memory.
+        The sequence is switched to ALP_DATA_BINARY_TOPDOWN.
+
+        Usage: SeqPutChunks(frames, SequenceId = None, first = 0, PicOffset = 0, PicLoad = 0, chunkSize = 256)
+
+        PARAMETERS
+        ----------
+        frames : RandomPatterns, SparseFrames
+                 Source of packed frames of the resolution of the DMD, providing Chunks(nbImg, chunkSize, first).
+        SequenceId : ctypes c_long, optional
+                     Identified of the sequence. If not specified, use the last sequence allocated in the DMD board memory
+        first : int, optional
+                Index in the source of the first frame to load.
+        PicOffset : int, optional
+                    Picture number in the sequence of the first frame to load.
+        PicLoad : int, optional
+                  Number of frames to load. By default, up to the end of the sequence (or of the source if it is shorter).
+        chunkSize : int, optional
+                    Number of frames generated and uploaded at once.
+        """
+        if (frames.nSizeX, frames.nSizeY) != (self.nSizeX, self.nSizeY) or (
+            frames.rowBytes != self._packedRowBytes()
+        ):
+            raise ValueError("The frames do not match the resolution of the DMD.")
+        SequenceId = self._sequence(SequenceId)
+        info = self._seqInfo.get(_seqKey(SequenceId))
+        if PicLoad == 0:
+            if info is not None:
+                PicLoad = info.nbImg - PicOffset
+            else:
+                PicLoad = self.SeqInquire(ALP_PICNUM, SequenceId) - PicOffset
+            if hasattr(frames, "__len__"):
+                PicLoad = min(PicLoad, len(frames) - first)
+
+        with self._seqLock(SequenceId):
+            if (
+                info is None
+                or info.controls.get(ALP_DATA_FORMAT) != ALP_DATA_BINARY_TOPDOWN
+            ):
+                self._seqControl(SequenceId, ALP_DATA_FORMAT, ALP_DATA_BINARY_TOPDOWN)
+            for offset, chunk in frames.Chunks(PicLoad, chunkSize, first):
+                self.SeqPut(
+                    chunk,
+                    SequenceId=SequenceId,
+                    PicOffset=PicOffset + offset,
+                    PicLoad=chunk.shape[0],
+                )
+
+    def SeqPutRandom(
+        self, patterns, SequenceId=None, first=0, PicOffset=0, PicLoad=0, chunkSize=256
+    ):
+        """
+        Load frames of a random pattern bank into a binary sequence by chunks (see SeqPutChunks).
+
+        Usage: SeqPutRandom(patterns, SequenceId = None, first = 0, PicOffset = 0, PicLoad = 0, chunkSize = 256)
+
+        PARAMETERS
+        ----------
+        patterns : RandomPatterns
+                   Bank of patterns, of the resolution of the DMD.
+        """
+        self.SeqPutChunks(patterns, SequenceId, first, PicOffset, PicLoad, chunkSize)
+
+    def CreateRemap(
+        self, transform, cameraShape, interpolation="nearest", useCache=True
+    ):
+        """
+        Create the warp of camera images to the mirrors of the initialized DMD (see CameraRemap).
+
+        Usage: CreateRemap(transform, cameraShape, interpolation = 'nearest', useCache = True)
+
+        PARAMETERS
+        ----------
+        transform : array
+                    Affine (2 x 3) or homography (3 x 3) matrix mapping camera coordinates to DMD coordinates.
+        cameraShape : tuple
+                      (nRows, nColumns) of the camera images.
+        interpolation : string, optional
+                        'nearest' or 'bilinear'.
+        useCache : bool, optional
+                   Load the precomputed map from the disk cache (PROFILE_DIR), and store it there when computed.
+
+        RETURNS
+        -------
+        remap : CameraRemap
+        """
+        dmdShape = (self.nSizeY, self.nSizeX)
+        if useCache:
+            return CameraRemap.Cached(transform, cameraShape, dmdShape, interpolation)
+        return CameraRemap(transform, cameraShape, dmdShape, interpolation).Compute()
+
+    def CompileGrayscale(self, imgArray, lsbTime, bitDepth=8, dropBits=0):
+        """
+        Compile gray-scale images into binary frames displayed with durations weighted by 2^k
+        (see weighted_bitplanes and CompileSchedule).
+        The planes of the same weight share a sequence whose picture time is the duration of this weight.
+        The sequences use ALP_BIN_UNINTERRUPTED, so that each plane is illuminated during its whole picture time
+        (in ALP_BIN_NORMAL, the dark phase would shorten the low planes more than the high ones).
+
+        Usage: CompileGrayscale(imgArray, lsbTime, bitDepth = 8, dropBits = 0)
+
+        PARAMETERS
+        ----------
+        imgArray : array
+                   Images of integer values between 0 and 2^bitDepth - 1.
+        lsbTime : int
+                  Display time of the least significant plane kept, in microseconds.
+        bitDepth : int, optional
+                   Number of bits of the pixel values.
+        dropBits : int, optional
+                   Number of low-order bit planes to drop.
+
+        RETURNS
+        -------
+        plan : SchedulePlan
+               To be loaded with LoadSchedule and displayed with PlaySchedule.
+        """
+        planes, weights = weighted_bitplanes(imgArray, bitDepth, dropBits)
+        durations = lsbTime * weights
+        items = (
+            (plane, duration)
+            for image in planes
+            for plane, duration in zip(image, durations)
+        )
+        return self.CompileSchedule(items, bitDepth=1, binMode=ALP_BIN_UNINTERRUPTED)
+
+    def SeqAllocFlexPWM(self, imgArray, bitDepth=8, dropBits=0):
+        """
+        Allocate and load a gray-scale sequence displayed in ALP_FLEX_PWM mode: all bit planes are displayed as fast as
+        possible in binary uninterrupted mode, the duration of each plane being set by the trigger in ALP_SLAVE mode.
+        Low-order bits are dropped from the data and from the sequence bit depth.
+
+        Usage: SeqAllocFlexPWM(imgArray, bitDepth = 8, dropBits = 0)
+
+        PARAMETERS
+        ----------
+        imgArray : array
+                   Images of integer values between 0 and 2^bitDepth - 1.
+        bitDepth : int, optional
+                   Number of bits of the pixel values, at most 8.
+        dropBits : int, optional
+                   Number of low-order bit planes to drop.
+
+        RETURNS
+        -------
+        SequenceId : ctypes c_long
+        """
+        if not 0 <= dropBits < bitDepth <= 8:
+            raise ValueError("Bit depths must satisfy 0 <= dropBits < bitDepth <= 8.")
+        imgArray = np.asarray(imgArray)
+        if imgArray.ndim == 2:
+            imgArray = imgArray[np.newaxis]
+        nbBits = bitDepth - dropBits
+        # MSB aligned data: the planes kept are moved to the upper bits of each byte
+        data = np.left_shift(
+            np.right_shift(imgArray.astype(np.uint8, copy=False), dropBits),
+            8 - nbBits,
+        )
+        SequenceId = self.SeqAlloc(nbImg=imgArray.shape[0], bitDepth=nbBits)
+        self.SeqControl(ALP_PWM_MODE, ALP_FLEX_PWM, SequenceId)
+        self.SeqPut(data, SequenceId=SequenceId)
+        return SequenceId
+
+    def LoadSchedule(self, plan):
+        """
+        Allocate and upload the sequences of a schedule, and set their picture time.
+
+        Usage: LoadSchedule(plan)
+
+        PARAMETERS
+        ----------
+        plan : SchedulePlan
+               Schedule returned by CompileSchedule.
+        """
+        plan.SequenceIds = []
+        for pictureTime, patterns in plan.sequences:
+            SequenceId = self.SeqAlloc(nbImg=len(patterns), bitDepth=plan.bitDepth)
+            plan.SequenceIds.append(SequenceId)
+            self.SeqPut(np.stack(patterns), SequenceId=SequenceId, autoPack=True)
+            if plan.bitDepth == 1 and plan.binMode != ALP_BIN_NORMAL:
+                self.SeqControl(ALP_BIN_MODE, plan.binMode, SequenceId)
+            self.SetTiming(SequenceId, pictureTime=pictureTime)
+
+    def PlaySchedule(self, plan, wait=False):
+        """
+        Display a loaded schedule by enqueuing its entries (ALP_PROJ_SEQUENCE_QUEUE mode).
+        When the queue is full, wait for waiting positions to become available.
+        The ALP has to be idle to switch the queue mode.
+
+        Usage: PlaySchedule(plan, wait = False)
+
+        PARAMETERS
+        ----------
+        plan : SchedulePlan
+               Schedule loaded by LoadSchedule.
+        wait : bool, optional
+               Wait for the end of the display.
+        """
+        if plan.SequenceIds is None:
+            raise ValueError("The schedule is not loaded, see LoadSchedule.")
+        if self._projControls.get(ALP_PROJ_QUEUE_MODE) != ALP_PROJ_SEQUENCE_QUEUE:
+            self.ProjControl(ALP_PROJ_QUEUE_MODE, ALP_PROJ_SEQUENCE_QUEUE)
+
+        available = 0
+        for seq, first, last, repeat in plan.steps:
+            SequenceId = plan.SequenceIds[seq]
+            self._setFrameWindow(SequenceId, first, last, repeat)
+            while available == 0:
+                available = self.ProjInquire(ALP_PROJ_QUEUE_AVAIL)
+                if available == 0:
+                    time.sleep(self.SeqInquire(ALP_PICTURE_TIME, SequenceId) * 1e-6)
+            self.Run(SequenceId, loop=False)
+            available -= 1
+        if wait:
+            self.Wait()
+
     def Run(self, SequenceId=None, loop=True):
         """
         Display a sequence loaded into the DDR memory.
@@ -1180,31 +5242,137 @@ class ALP4(object):
         --------
         See ALPLib.AlpProjStart and ALPLib.AlpProjStartCont in the ALP API description for more information.
         """
-        if (SequenceId is None) and (self._lastDDRseq):
-            SequenceId = self._lastDDRseq
+        SequenceId = self._sequence(SequenceId)
         if SequenceId is None:
-            self._raiseError("No sequence to display.")
-
-        if loop:
-            self._checkError(
-                self._ALPLib.AlpProjStartCont(self.ALP_ID, SequenceId),
-                "Cannot launch sequence.",
-            )
+            raise ValueError("No sequence to display.")
+        with self._projLock:
+            if self._restore:
+                self._restoreSettings()
+            if loop:
+                self._checkError(
+                    self._ALPLib.AlpProjStartCont(self.ALP_ID, SequenceId),
+                    "Cannot launch sequence.",
+                )
+            else:
+                self._checkError(
+                    self._ALPLib.AlpProjStart(self.ALP_ID, SequenceId),
+                    "Cannot launch sequence.",
+                )
+            if self._recovery is not None:
+                self._recordDisplay(SequenceId, loop)
+
+    def _recordDisplay(self, SequenceId, loop):
+        # Keep track of the started displays, to resume them after a recovery
+        info = self._seqInfo.get(_seqKey(SequenceId))
+        if info is None:
+            return
+        entry = [
+            SequenceId,
+            loop,
+            _clock(),
+            info.controls.get(ALP_FIRSTFRAME, 0),
+            info.controls.get(ALP_LASTFRAME, info.nbImg - 1),
+            info.controls.get(ALP_SEQ_REPEAT, 1),
+        ]
+        if self._projControls.get(ALP_PROJ_QUEUE_MODE) == ALP_PROJ_SEQUENCE_QUEUE:
+            self._display.append(entry)
         else:
-            self._checkError(
-                self._ALPLib.AlpProjStart(self.ALP_ID, SequenceId),
-                "Cannot launch sequence.",
-            )
+            # Without queue, a new display replaces the current one
+            self._display = [entry]
 
-    def Wait(self):
+    def Wait(self, timeout=None, poll=None, cancel=None):
         """
         This function is used to wait for the completion of the running sequence display.
 
-        Usage: Wait()
+        Without arguments, it blocks in AlpProjWait until the display is finished.
+        With a timeout, a polling interval or a cancel event, it polls the projection progress instead
+        (ALP_PROJ_PROGRESS), sleeping about half of the expected remaining display time between two inquiries
+        (at least 0.2 ms, at most poll seconds). While the frame and sequence counters do not change
+        (e.g. a display waiting for triggers), the interval is doubled at each inquiry up to poll seconds.
+
+        Usage: Wait(timeout = None, poll = None, cancel = None)
+
+        PARAMETERS
+        ----------
+        timeout : float, optional
+                  Maximum waiting time in seconds.
+        poll : float, optional
+               Maximum time between two inquiries in seconds, 0.05 by default.
+        cancel : threading.Event, optional
+                 Stop waiting when the event is set.
+
+        RETURNS
+        -------
+        status : dict or None
+                 None when blocking in AlpProjWait. When polling:
+                 'finished': True if the display is finished, 'cancelled': True if stopped by cancel,
+                 'framesRemaining': frames left to display in the current sequence (None for a continuous display),
+                 'waitingSequences': number of sequences waiting in the queue, 'time': waiting time in seconds.
         """
-        self._checkError(
-            self._ALPLib.AlpProjWait(self.ALP_ID), "Cannot go in wait mode."
-        )
+        if timeout is None and poll is None and cancel is None:
+            self._checkError(
+                self._ALPLib.AlpProjWait(self.ALP_ID), "Cannot go in wait mode."
+            )
+            self._display = []
+            if self._restore:
+                self._restoreSettings()
+            return None
+
+        maxPoll = 0.05 if poll is None else poll
+        minPoll = min(2e-4, maxPoll)
+        # Interval growing while the display does not progress
+        stalledPoll = minPoll
+        counters = None
+        start = _clock()
+        deadline = None if timeout is None else start + timeout
+        while True:
+            progress = self.ProjInquireEx(ALP_PROJ_PROGRESS)
+            now = _clock()
+            finished = bool(progress.nFlagse & ALP_FLAG_QUEUE_IDLE.value)
+            if finished:
+                self._display = []
+                if self._restore:
+                    self._restoreSettings()
+                framesRemaining = 0
+            elif progress.nFlagse & ALP_FLAG_SEQUENCE_INDEFINITE.value:
+                framesRemaining = None
+            else:
+                framesRemaining = (
+                    progress.nFrameCounter
+                    + progress.nFramesPerSubSequence
+                    * max(progress.nSequenceCounter - 1, 0)
+                )
+            cancelled = cancel is not None and cancel.is_set()
+            if finished or cancelled or (deadline is not None and now >= deadline):
+                return {
+                    "finished": finished,
+                    "cancelled": cancelled and not finished,
+                    "framesRemaining": framesRemaining,
+                    "waitingSequences": progress.nWaitingSequences,
+                    "time": now - start,
+                }
+
+            previous = counters
+            counters = (
+                progress.nSequenceCounter,
+                progress.nFrameCounter,
+                progress.nWaitingSequences,
+            )
+            if counters == previous:
+                stalledPoll = min(stalledPoll * 2, maxPoll)
+            else:
+                stalledPoll = minPoll
+            if framesRemaining is None:
+                delay = maxPoll
+            else:
+                delay = min(framesRemaining * progress.nPictureTime * 0.5e-6, maxPoll)
+            delay = max(delay, stalledPoll)
+            if deadline is not None:
+                delay = min(delay, deadline - now)
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
 
     def Halt(self):
         """
@@ -1214,6 +5382,9 @@ class ALP4(object):
         Usage: Halt()
         """
         self._checkError(self._ALPLib.AlpDevHalt(self.ALP_ID), "Cannot stop device.")
+        self._display = []
+        if self._restore:
+            self._restoreSettings()
 
     def Free(self):
         """
@@ -1223,5 +5394,27 @@ class ALP4(object):
 
         Usage: Free()
         """
+        self.StopHealthMonitor()
         self._checkError(self._ALPLib.AlpDevFree(self.ALP_ID), "Cannot free device.")
+        self.StopRecording()
+        # The sequences are released with the device
+        with self._stateLock:
+            self._seqInfo.clear()
+            self._seqLocks.clear()
+            if self.pool is not None:
+                del self.pool.idle[:]
         del self._ALPLib
+
+
+# The simulator, the server and the pattern generators are in their own modules,
+# which use the definitions above
+from ALP4sim import ALPSimulator  # noqa: E402,F401
+from ALP4server import ALPClient, ALPServer, SharedFrames  # noqa: E402,F401
+from ALP4patterns import (  # noqa: E402,F401
+    GRATING_CACHE,
+    PatternCache,
+    RandomPatterns,
+    SparseFrames,
+    grating,
+    phase_steps,
+)
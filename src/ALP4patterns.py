@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pattern generators: gratings and fringes (grating, phase_steps), seeded random patterns (RandomPatterns)
+and sparse frame stacks (SparseFrames), produced in the packed layout of binary sequences.
+
+This module uses the definitions of ALP4 and is imported at the end of it:
+import ALP4 and use the re-exported names (e.g. ALP4.grating).
+"""
+
+import collections
+import numpy as np
+from ALP4 import ALP_DMDTYPE_SXGA_PLUS, _padPacked, packed_row_bytes
+
+
+class PatternCache(object):
+    """
+    In-memory least recently used cache of generated patterns.
+    The cached arrays are read-only, copy them before modifying them.
+
+    Usage:
+    PatternCache(maxSize = 64)
+
+    PARAMETERS
+    ----------
+    maxSize : int, optional
+              Maximum number of patterns kept.
+    """
+
+    def __init__(self, maxSize=64):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+
+    def Get(self, key, factory):
+        """
+        Return the pattern cached for key, or create it with factory() and cache it.
+
+        Usage: Get(key, factory)
+        """
+        pattern = self._items.pop(key, None)
+        if pattern is None:
+            self.misses += 1
+            pattern = factory()
+            pattern.setflags(write=False)
+        else:
+            self.hits += 1
+        # The most recently used patterns are at the end
+        self._items[key] = pattern
+        while len(self._items) > self.maxSize:
+            self._items.popitem(last=False)
+        return pattern
+
+    def Clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Cache of the patterns generated by grating and phase_steps
+GRATING_CACHE = PatternCache()
+
+
+def _bayer(n):
+    # Ordered dithering matrix of size 2^n, thresholds between 0 and 1
+    matrix = np.zeros((1, 1))
+    for _ in range(n):
+        matrix = np.block(
+            [[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]]
+        )
+    return (matrix + 0.5) / matrix.size
+
+
+_BAYER8 = _bayer(3)
+
+
+def _grating(nSizeX, nSizeY, period, angle, phase, mode, dutyCycle, DMDType):
+    theta = np.deg2rad(angle)
+    # Position along the grating vector in periods, by broadcasting a column of rows and a row of columns
+    u = (
+        np.arange(nSizeY)[:, np.newaxis] * (np.sin(theta) / period)
+        + np.arange(nSizeX)[np.newaxis, :] * (np.cos(theta) / period)
+        + phase / (2 * np.pi)
+    )
+    if mode == "binary":
+        return _padPacked(
+            np.packbits(np.mod(u, 1.0) < dutyCycle, axis=1), nSizeX, DMDType
+        )
+    intensity = 0.5 + 0.5 * np.cos(2 * np.pi * u)
+    if mode == "gray":
+        return np.rint(255 * intensity).astype(np.uint8)
+    threshold = _BAYER8[np.ix_(np.arange(nSizeY) % 8, np.arange(nSizeX) % 8)]
+    return _padPacked(np.packbits(intensity > threshold, axis=1), nSizeX, DMDType)
+
+
+def grating(
+    nSizeX,
+    nSizeY,
+    period,
+    angle=0.0,
+    phase=0.0,
+    mode="binary",
+    dutyCycle=0.5,
+    DMDType=None,
+    cache=True,
+):
+    """
+    Generate a grating or a sinusoidal fringe pattern, cached in GRATING_CACHE.
+
+    Usage: grating(nSizeX, nSizeY, period, angle = 0., phase = 0., mode = 'binary', dutyCycle = 0.5, DMDType = None, cache = True)
+
+    PARAMETERS
+    ----------
+    nSizeX, nSizeY : int
+                     Resolution of the DMD.
+    period : float
+             Period of the pattern in pixels.
+    angle : float, optional
+            Direction of the grating vector in degrees, 0 for vertical fringes.
+    phase : float, optional
+            Phase of the pattern in radians.
+    mode : string, optional
+           'binary': square grating, packed (ALP_DATA_BINARY_TOPDOWN),
+           'dither': sinusoidal fringes with ordered dithering, packed,
+           'gray': sinusoidal fringes of 8-bit values.
+    dutyCycle : float, optional
+                Fraction of the period which is on, for the binary mode.
+    DMDType : int, optional
+              Type of DMD, for the DMDs whose packed rows are padded (see packed_row_bytes).
+    cache : bool, optional
+            Use GRATING_CACHE. The cached patterns are read-only.
+
+    RETURNS
+    -------
+    pattern : 2D ndarray of uint8
+              Shape (nSizeY, row bytes) if packed, (nSizeY, nSizeX) for the gray mode.
+    """
+    if mode not in ("binary", "dither", "gray"):
+        raise ValueError('mode must be one of "binary", "dither" or "gray"')
+    # Equivalent phases share the same cache entry
+    phase = round(float(np.mod(phase, 2 * np.pi)), 9) % round(2 * np.pi, 9)
+    args = (
+        nSizeX,
+        nSizeY,
+        float(period),
+        float(angle),
+        phase,
+        mode,
+        float(dutyCycle),
+        DMDType,
+    )
+    if not cache:
+        return _grating(*args)
+    return GRATING_CACHE.Get(args, lambda: _grating(*args))
+
+
+def phase_steps(
+    nSizeX, nSizeY, period, nSteps, angle=0.0, phase=0.0, mode="dither", DMDType=None
+):
+    """
+    Generate the phase-stepped patterns of a grating, with phases phase + 2 pi k / nSteps (see grating).
+
+    Usage: phase_steps(nSizeX, nSizeY, period, nSteps, angle = 0., phase = 0., mode = 'dither', DMDType = None)
+
+    RETURNS
+    -------
+    patterns : 3D ndarray of uint8
+               Stack of nSteps patterns.
+    """
+    return np.stack(
+        [
+            grating(
+                nSizeX,
+                nSizeY,
+                period,
+                angle,
+                phase + 2 * np.pi * k / nSteps,
+                mode,
+                DMDType=DMDType,
+            )
+            for k in range(nSteps)
+        ]
+    )
+
+
+class RandomPatterns(object):
+    """
+    Bank of seeded random binary patterns generated directly in the packed layout
+    of ALP_DATA_BINARY_TOPDOWN, without storing the bank.
+
+    Each frame is generated from its own random stream seeded with (seed, index),
+    so that any frame can be regenerated on demand, in any order.
+    With a fill fraction of 0.5, the random bytes are used as packed pixels directly.
+
+    Usage:
+    RandomPatterns(nSizeX, nSizeY, seed = 0, blockSize = 1, fill = 0.5, DMDType = None)
+
+    PARAMETERS
+    ----------
+    nSizeX, nSizeY : int
+                     Resolution of the DMD.
+    seed : int, optional
+           Seed of the bank, between 0 and 2^32 - 1.
+    blockSize : int, optional
+                Size in pixels of the square macro-pixels sharing the same random value.
+    fill : float, optional
+           Probability of a macro-pixel to be on.
+    DMDType : int, optional
+              Type of DMD, for the DMDs whose packed rows are padded (see packed_row_bytes).
+    """
+
+    def __init__(self, nSizeX, nSizeY, seed=0, blockSize=1, fill=0.5, DMDType=None):
+        if not 0.0 <= fill <= 1.0:
+            raise ValueError("fill must be between 0 and 1.")
+        if blockSize < 1:
+            raise ValueError("blockSize must be a positive integer.")
+        self.nSizeX = nSizeX
+        self.nSizeY = nSizeY
+        self.seed = seed
+        self.blockSize = int(blockSize)
+        self.fill = fill
+        self.DMDType = DMDType
+        self.rowBytes = packed_row_bytes(nSizeX, DMDType)
+        # Size of the grid of macro-pixels
+        self._gridX = -(-nSizeX // self.blockSize)
+        self._gridY = -(-nSizeY // self.blockSize)
+        # Random values are drawn as 16 bits integers, on if below the threshold
+        self._threshold = int(round(fill * 65536))
+
+    def Frame(self, index):
+        """
+        Generate one frame of the bank.
+
+        Usage: Frame(index)
+
+        RETURNS
+        -------
+        frame : 2D ndarray of uint8
+                Packed frame of shape (nSizeY, rowBytes).
+        """
+        rs = np.random.RandomState([self.seed, index])
+        if self.fill == 0.5:
+            rowBytes = -(-self._gridX // 8)
+            grid = np.frombuffer(rs.bytes(self._gridY * rowBytes), dtype=np.uint8)
+            grid = grid.reshape(self._gridY, rowBytes)
+            if self.blockSize == 1 and rowBytes * 8 == self.nSizeX:
+                return _padPacked(grid, self.nSizeX, self.DMDType)
+            grid = np.unpackbits(grid, axis=1)[:, : self._gridX]
+        else:
+            grid = rs.randint(
+                0, 65536, size=(self._gridY, self._gridX), dtype=np.uint16
+            )
+            grid = grid < self._threshold
+        if self.blockSize > 1:
+            grid = np.repeat(grid, self.blockSize, axis=1)[:, : self.nSizeX]
+        packed = np.packbits(grid, axis=1)
+        if self.blockSize > 1:
+            packed = np.repeat(packed, self.blockSize, axis=0)[: self.nSizeY]
+        return _padPacked(packed, self.nSizeX, self.DMDType)
+
+    def Frames(self, first, count):
+        """
+        Generate consecutive frames of the bank.
+
+        Usage: Frames(first, count)
+
+        RETURNS
+        -------
+        frames : 3D ndarray of uint8
+                 Packed frames of shape (count, nSizeY, rowBytes).
+        """
+        frames = np.empty((count, self.nSizeY, self.rowBytes), dtype=np.uint8)
+        for k in range(count):
+            frames[k] = self.Frame(first + k)
+        return frames
+
+    def Chunks(self, nbImg, chunkSize=256, first=0):
+        """
+        Iterate over the frames first to first + nbImg - 1 by chunks.
+
+        Usage: Chunks(nbImg, chunkSize = 256, first = 0)
+
+        RETURNS
+        -------
+        Iterator of (offset, frames), offset being the position of the chunk from first.
+        """
+        for offset in range(0, nbImg, chunkSize):
+            yield offset, self.Frames(first + offset, min(chunkSize, nbImg - offset))
+
+
+class SparseFrames(object):
+    """
+    Stack of binary frames with few mirrors on (e.g. point scanning, sparse foci),
+    stored as runs of consecutive on pixels (row, column, length) instead of full frames,
+    so that the host memory scales with the number of on pixels.
+
+    The frames are rasterized in the packed layout of ALP_DATA_BINARY_TOPDOWN by chunks
+    when they are loaded (see ALP4.SeqPutChunks).
+
+    Usage:
+    SparseFrames(nSizeX, nSizeY, DMDType = None)
+
+    PARAMETERS
+    ----------
+    nSizeX, nSizeY : int
+                     Resolution of the DMD.
+    DMDType : int, optional
+              Type of DMD, for the DMDs whose packed rows are padded (see packed_row_bytes).
+    """
+
+    def __init__(self, nSizeX, nSizeY, DMDType=None):
+        self.nSizeX = nSizeX
+        self.nSizeY = nSizeY
+        self.DMDType = DMDType
+        self.rowBytes = packed_row_bytes(nSizeX, DMDType)
+        # Runs of all the frames, and index of the first run of each frame
+        self._runs = np.zeros((0, 3), dtype=np.uint16)
+        self._offsets = [0]
+        # Runs appended since the last rasterization
+        self._pending = []
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self):
+        # Host memory used by the runs
+        return self._runs.nbytes + sum(runs.nbytes for runs in self._pending)
+
+    def Append(self, points=None, runs=None):
+        """
+        Add a frame.
+
+        Usage: Append(points = None, runs = None)
+
+        PARAMETERS
+        ----------
+        points : array, optional
+                 (row, column) of the on pixels, of shape (n, 2).
+        runs : array, optional
+               (row, column, length) of horizontal runs of on pixels, of shape (n, 3).
+
+        RETURNS
+        -------
+        index : int
+                Index of the frame in the stack.
+        """
+        frame = [np.zeros((0, 3), dtype=np.int64)]
+        if points is not None:
+            points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+            frame.append(np.column_stack([points, np.ones(len(points), np.int64)]))
+        if runs is not None:
+            frame.append(np.asarray(runs, dtype=np.int64).reshape(-1, 3))
+        frame = np.concatenate(frame)
+        if frame.size and (
+            frame.min() < 0
+            or frame[:, 0].max() >= self.nSizeY
+            or (frame[:, 1] + frame[:, 2]).max() > self.nSizeX
+        ):
+            raise ValueError("The pixels are outside of the DMD.")
+        frame = frame[frame[:, 2] > 0].astype(np.uint16)
+        self._pending.append(frame)
+        self._offsets.append(self._offsets[-1] + len(frame))
+        return len(self) - 1
+
+    @classmethod
+    def FromArray(cls, imgArray, DMDType=None):
+        """
+        Convert binary images (0 for off, any other value for on) to a sparse stack.
+
+        Usage: SparseFrames.FromArray(imgArray, DMDType = None)
+
+        PARAMETERS
+        ----------
+        imgArray : array
+                   Images of shape (nbImg, nSizeY, nSizeX) or (nSizeY, nSizeX).
+        DMDType : int, optional
+                  Type of DMD (see packed_row_bytes).
+        """
+        imgArray = np.asarray(imgArray)
+        if imgArray.ndim == 2:
+            imgArray = imgArray[np.newaxis]
+        nbImg, nSizeY, nSizeX = imgArray.shape
+        frames = cls(nSizeX, nSizeY, DMDType)
+        # Runs start where a pixel is on after an off one, and stop where it is off after an on one
+        edges = np.zeros((nbImg, nSizeY, nSizeX + 2), dtype=np.int8)
+        edges[:, :, 1:-1] = imgArray != 0
+        edges = np.diff(edges, axis=2)
+        starts = np.argwhere(edges == 1)
+        stops = np.argwhere(edges == -1)
+        runs = np.column_stack([starts[:, 1:], stops[:, 2] - starts[:, 2]])
+        frames._runs = runs.astype(np.uint16)
+        frames._offsets = list(np.searchsorted(starts[:, 0], np.arange(nbImg + 1)))
+        return frames
+
+    def _compact(self):
+        if self._pending:
+            self._runs = np.concatenate([self._runs] + self._pending)
+            self._pending = []
+
+    def Frames(self, first, count):
+        """
+        Rasterize consecutive frames.
+
+        Usage: Frames(first, count)
+
+        RETURNS
+        -------
+        frames : 3D ndarray of uint8
+                 Packed frames of shape (count, nSizeY, rowBytes).
+        """
+        if first < 0 or first + count > len(self):
+            raise IndexError(
+                "Frames {0} to {1} out of range.".format(first, first + count - 1)
+            )
+        self._compact()
+        frames = np.zeros((count, self.nSizeY, self.rowBytes), dtype=np.uint8)
+        start, stop = self._offsets[first], self._offsets[first + count]
+        runs = self._runs[start:stop].astype(np.intp)
+        if not runs.size:
+            return frames
+        frame = np.repeat(
+            np.arange(count), np.diff(self._offsets[first : first + count + 1])
+        )
+        # Expand the runs into pixels
+        lengths = runs[:, 2]
+        pixel = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        x = np.repeat(runs[:, 1], lengths) + pixel
+        row = np.repeat(frame * self.nSizeY + runs[:, 0], lengths)
+        # Scatter the bits in the packed rows (see _padPacked for the first byte of the DMD rows)
+        column = x >> 3
+        if self.DMDType == ALP_DMDTYPE_SXGA_PLUS and self.rowBytes != self.nSizeX // 8:
+            column += 1
+        np.bitwise_or.at(
+            frames.reshape(-1),
+            row * self.rowBytes + column,
+            (0x80 >> (x & 7)).astype(np.uint8),
+        )
+        return frames
+
+    def Frame(self, index):
+        """
+        Rasterize one frame.
+
+        Usage: Frame(index)
+
+        RETURNS
+        -------
+        frame : 2D ndarray of uint8
+                Packed frame of shape (nSizeY, rowBytes).
+        """
+        return self.Frames(index, 1)[0]
+
+    def Chunks(self, nbImg, chunkSize=256, first=0):
+        """
+        Iterate over the frames first to first + nbImg - 1 by chunks.
+
+        Usage: Chunks(nbImg, chunkSize = 256, first = 0)
+
+        RETURNS
+        -------
+        Iterator of (offset, frames), offset being the position of the chunk from first.
+        """
+        for offset in range(0, nbImg, chunkSize):
+            yield offset, self.Frames(first + offset, min(chunkSize, nbImg - offset))
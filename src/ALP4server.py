@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local DMD server (ALPServer) and its client (ALPClient), to share a device between processes.
+
+This module uses the definitions of ALP4 and is imported at the end of it:
+import ALP4 and use ALP4.ALPServer, ALP4.ALPClient and ALP4.SharedFrames.
+"""
+
+import contextlib
+import os
+import threading
+import time
+import numpy as np
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python < 3.8: ALPServer is not available
+    shared_memory = None
+
+from ALP4 import _clock, _seqKey
+
+
+def _attachSharedMemory(name):
+    """
+    Attach an existing shared memory block without registering it in the resource tracker
+    (the block belongs to the client process).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedFrames(object):
+    """
+    Image data in a shared memory block, to be filled in place and sent to an ALPServer without copy.
+
+    Usage:
+    frames = SharedFrames((nbImg, nSizeY, nSizeX))
+    frames.array[:] = ...
+    client.SeqPut(frames)
+    frames.Close()
+
+    PARAMETERS
+    ----------
+    shape : tuple
+            Shape of the data.
+    dtype : numpy dtype, optional
+            Type of the data. By default, uint8 (no conversion by the server).
+    """
+
+    def __init__(self, shape, dtype=np.uint8):
+        if shared_memory is None:
+            raise OSError("multiprocessing.shared_memory is not available.")
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    def Close(self):
+        """
+        Release the shared memory block.
+        """
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ALPServer(object):
+    """
+    Serve a device to several local processes.
+
+    The server owns the ALP4 object. Clients (ALPClient) connect through a local socket (Unix domain socket,
+    or named pipe on Windows) and send batches of requests that are executed in order, one batch at a time.
+    A Wait request lets the batches of the other clients run until the display is finished.
+    The image data is passed in shared memory blocks and handed to SeqPut without serialization.
+    Each client can only use the sequences it allocated, they are freed when it disconnects.
+
+    The clients are authenticated with a key before any request is read (requests are unpickled,
+    so that a peer knowing the key can run code in the server process).
+
+    Usage:
+    server = ALPServer(DMD, address = '/tmp/alp.sock')
+    server.Start()  # or server.Serve() to block
+    client = ALPClient(server.address, server.authkey)
+
+    PARAMETERS
+    ----------
+    alp : ALP4
+          Initialized device controller.
+    address : string, optional
+              Socket path (or pipe name on Windows). By default, a temporary address is chosen (see address attribute).
+    authkey : bytes, optional
+              Key required from the clients. By default, a random key is generated (see authkey attribute).
+    """
+
+    def __init__(self, alp, address=None, authkey=None):
+        self.alp = alp
+        if authkey is None:
+            authkey = os.urandom(32)
+        # Key to give to ALPClient
+        self.authkey = authkey
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self._lock = threading.Lock()
+        # Interval between two inquiries of the display state for the Wait requests, in seconds
+        self.waitPoll = 0.01
+        self._thread = None
+        self.counters = {
+            "clients": 0,
+            "batches": 0,
+            "requests": 0,
+            "errors": 0,
+            "bytesUploaded": 0,
+            "uploadTime": 0.0,
+        }
+        self._start = _clock()
+
+    def Start(self):
+        """
+        Accept clients in a background thread.
+        """
+        self._thread = threading.Thread(target=self.Serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Serve(self):
+        """
+        Accept clients until Close is called.
+        """
+        while True:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                # Client without the key
+                continue
+            except (OSError, IOError, EOFError):
+                # Listener closed
+                return
+            thread = threading.Thread(target=self._serveClient, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def Close(self):
+        """
+        Stop accepting clients.
+        """
+        self._listener.close()
+
+    def Stats(self):
+        """
+        Return the throughput counters.
+
+        RETURNS
+        -------
+        stats : dict
+                Number of clients served, batches, requests and errors, bytes uploaded and time spent in SeqPut,
+                upload throughput (bytes/s) and request rate (requests/s) since the server started.
+        """
+        stats = dict(self.counters)
+        elapsed = _clock() - self._start
+        stats["uptime"] = elapsed
+        stats["requestsPerSecond"] = stats["requests"] / elapsed if elapsed else 0.0
+        stats["uploadThroughput"] = (
+            stats["bytesUploaded"] / stats["uploadTime"] if stats["uploadTime"] else 0.0
+        )
+        return stats
+
+    def _serveClient(self, conn):
+        owned = set()
+        with self._lock:
+            self.counters["clients"] += 1
+        try:
+            while True:
+                try:
+                    batch = conn.recv()
+                except (EOFError, OSError, IOError):
+                    break
+                if not isinstance(batch, list) or not all(
+                    isinstance(request, tuple) and request for request in batch
+                ):
+                    with self._lock:
+                        self.counters["errors"] += 1
+                    conn.send(
+                        [("error", ValueError("A batch must be a list of tuples."))]
+                    )
+                    continue
+                results = []
+                with self._lock:
+                    for request in batch:
+                        if request[0] == "Wait":
+                            # The other clients can use the device until the display is finished
+                            self._lock.release()
+                            try:
+                                results.append(self._execute(owned, request))
+                            finally:
+                                self._lock.acquire()
+                        else:
+                            results.append(self._execute(owned, request))
+                    self.counters["batches"] += 1
+                    self.counters["requests"] += len(batch)
+                    self.counters["errors"] += sum(
+                        status == "error" for status, _ in results
+                    )
+                conn.send(results)
+        finally:
+            with self._lock:
+                for key in owned:
+                    # The sequences re-created by a recovery have new keys
+                    info = self.alp._seqInfo.get(key)
+                    if info is not None:
+                        self.alp.FreeSeq(info.SequenceId)
+            conn.close()
+
+    def _execute(self, owned, request):
+        op, args = request[0], request[1:]
+        try:
+            handler = getattr(self, "_do" + op, None)
+            if handler is None:
+                raise ValueError("Unknown request: " + str(op))
+            return ("ok", handler(owned, *args))
+        except Exception as e:
+            return ("error", e)
+
+    def _sequence(self, owned, key):
+        if key not in owned:
+            raise ValueError("Sequence {0} is not owned by this client.".format(key))
+        info = self.alp._seqInfo.get(key)
+        if info is None:
+            raise ValueError("Sequence {0} is no longer allocated.".format(key))
+        return info.SequenceId
+
+    def _doSeqAlloc(self, owned, nbImg, bitDepth):
+        key = _seqKey(self.alp.SeqAlloc(nbImg=nbImg, bitDepth=bitDepth))
+        owned.add(key)
+        return key
+
+    def _doFreeSeq(self, owned, key):
+        SequenceId = self._sequence(owned, key)
+        owned.remove(key)
+        self.alp.FreeSeq(SequenceId)
+
+    def _doSeqPut(self, owned, key, name, shape, dtype, PicOffset, PicLoad):
+        SequenceId = self._sequence(owned, key)
+        shm = _attachSharedMemory(name)
+        try:
+            imgArray = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            start = _clock()
+            self.alp.SeqPut(
+                imgArray, SequenceId=SequenceId, PicOffset=PicOffset, PicLoad=PicLoad
+            )
+            self.counters["uploadTime"] += _clock() - start
+            self.counters["bytesUploaded"] += imgArray.nbytes
+            del imgArray
+        finally:
+            shm.close()
+
+    def _doSetTiming(self, owned, key, timing):
+        self.alp.SetTiming(self._sequence(owned, key), **timing)
+
+    def _doSeqControl(self, owned, key, controlType, value):
+        self.alp.SeqControl(controlType, value, self._sequence(owned, key))
+
+    def _doSeqInquire(self, owned, key, inquireType):
+        return self.alp.SeqInquire(inquireType, self._sequence(owned, key))
+
+    def _doDevInquire(self, owned, inquireType):
+        return self.alp.DevInquire(inquireType)
+
+    def _doProjInquire(self, owned, inquireType):
+        return self.alp.ProjInquire(inquireType)
+
+    def _doRun(self, owned, key, loop):
+        self.alp.Run(self._sequence(owned, key), loop=loop)
+
+    def _doWait(self, owned, timeout=None):
+        # Called without the server lock: poll the display, holding the lock only during each inquiry
+        start = _clock()
+        while True:
+            with self._lock:
+                status = self.alp.Wait(timeout=0)
+            elapsed = _clock() - start
+            status["time"] = elapsed
+            if status["finished"] or (timeout is not None and elapsed >= timeout):
+                return status
+            delay = self.waitPoll
+            if timeout is not None:
+                delay = min(delay, timeout - elapsed)
+            time.sleep(max(delay, 1e-3))
+
+    def _doHalt(self, owned):
+        self.alp.Halt()
+
+    def _doStats(self, owned):
+        return self.Stats()
+
+    def _doResolution(self, owned):
+        return self.alp.nSizeX, self.alp.nSizeY
+
+
+class ALPClient(object):
+    """
+    Use a device served by an ALPServer from another process.
+
+    The methods mirror those of ALP4, sequences being identified by integers.
+    Inside a Batch block, requests are sent together when the block exits and return None,
+    their results are available in the batch list.
+
+    Usage:
+    client = ALPClient('/tmp/alp.sock')
+    seq = client.SeqAlloc(nbImg = 2, bitDepth = 1)
+    client.SeqPut(imgData)
+    with client.Batch() as results:
+        client.SetTiming(pictureTime = 20000)
+        client.Run()
+
+    PARAMETERS
+    ----------
+    address : string
+              Address of the server.
+    authkey : bytes
+              Key of the server (ALPServer.authkey).
+    """
+
+    def __init__(self, address, authkey=None):
+        self._conn = Client(address, authkey=authkey)
+        self._batch = None
+        self._temporary = []
+        self._lastSeq = None
+        self.nSizeX, self.nSizeY = self._request("Resolution")
+
+    def _request(self, *request):
+        if self._batch is not None:
+            self._batch.append(request)
+            return None
+        return self._send([request])[0]
+
+    def _send(self, batch):
+        try:
+            self._conn.send(batch)
+            results = self._conn.recv()
+        finally:
+            for frames in self._temporary:
+                frames.Close()
+            del self._temporary[:]
+        values = []
+        for status, value in results:
+            if status == "error":
+                raise value
+            values.append(value)
+        return values
+
+    @contextlib.contextmanager
+    def Batch(self):
+        """
+        Send the requests made inside the block in one message.
+        The returned list is filled with their results when the block exits.
+        """
+        self._batch = []
+        results = []
+        try:
+            yield results
+            batch = self._batch
+        finally:
+            self._batch = None
+        results.extend(self._send(batch))
+
+    def _seq(self, SequenceId):
+        if SequenceId is None:
+            SequenceId = self._lastSeq
+        if SequenceId is None:
+            raise ValueError("No sequence allocated.")
+        return SequenceId
+
+    def SeqAlloc(self, nbImg=1, bitDepth=1):
+        if self._batch is not None:
+            raise ValueError("SeqAlloc cannot be used in a batch.")
+        self._lastSeq = self._request("SeqAlloc", nbImg, bitDepth)
+        return self._lastSeq
+
+    def FreeSeq(self, SequenceId=None):
+        return self._request("FreeSeq", self._seq(SequenceId))
+
+    def SeqPut(self, imgData, SequenceId=None, PicOffset=0, PicLoad=0):
+        """
+        Load image data into a sequence. imgData is either a SharedFrames object (no copy)
+        or an array, copied into a temporary shared memory block.
+        """
+        if not isinstance(imgData, SharedFrames):
+            imgArray = np.asarray(imgData)
+            frames = SharedFrames(imgArray.shape, imgArray.dtype)
+            frames.array[...] = imgArray
+            self._temporary.append(frames)
+            imgData = frames
+        return self._request(
+            "SeqPut",
+            self._seq(SequenceId),
+            imgData.shm.name,
+            imgData.array.shape,
+            imgData.array.dtype.str,
+            PicOffset,
+            PicLoad,
+        )
+
+    def SetTiming(self, SequenceId=None, **timing):
+        return self._request("SetTiming", self._seq(SequenceId), timing)
+
+    def SeqControl(self, controlType, value, SequenceId=None):
+        return self._request("SeqControl", self._seq(SequenceId), controlType, value)
+
+    def SeqInquire(self, inquireType, SequenceId=None):
+        return self._request("SeqInquire", self._seq(SequenceId), inquireType)
+
+    def DevInquire(self, inquireType):
+        return self._request("DevInquire", inquireType)
+
+    def ProjInquire(self, inquireType):
+        return self._request("ProjInquire", inquireType)
+
+    def Run(self, SequenceId=None, loop=True):
+        return self._request("Run", self._seq(SequenceId), loop)
+
+    def Wait(self, timeout=None):
+        """
+        Wait for the end of the display, at most timeout seconds.
+        Return the status of ALP4.Wait ('finished', 'framesRemaining'...).
+        """
+        return self._request("Wait", timeout)
+
+    def Halt(self):
+        return self._request("Halt")
+
+    def Stats(self):
+        return self._request("Stats")
+
+    def Close(self):
+        """
+        Disconnect from the server, which frees the sequences of this client.
+        """
+        self._conn.close()
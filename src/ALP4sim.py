@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Simulated ALP dll (ALPSimulator), to run code using ALP4 without a device.
+
+This module uses the definitions of ALP4 and is imported at the end of it:
+import ALP4 and use ALP4.ALPSimulator.
+"""
+
+import ctypes as ct
+import threading
+import time
+from ALP4 import (
+    ALP_APPS_FPGA_TEMPERATURE,
+    ALP_AVAIL_MEMORY,
+    ALP_BIN_MODE,
+    ALP_BIN_NORMAL,
+    ALP_BITNUM,
+    ALP_BITPLANES,
+    ALP_DATA_BINARY_BOTTOMUP,
+    ALP_DATA_BINARY_TOPDOWN,
+    ALP_DATA_FORMAT,
+    ALP_DATA_MSB_ALIGN,
+    ALP_DDC_FPGA_TEMPERATURE,
+    ALP_DEFAULT,
+    ALP_DEVICE_NUMBER,
+    ALP_DEVICE_REMOVED,
+    ALP_DEV_DISPLAY_HEIGHT,
+    ALP_DEV_DISPLAY_WIDTH,
+    ALP_DEV_DMDTYPE,
+    ALP_DMDTYPE_XGA_07A,
+    ALP_ERROR_COMM,
+    ALP_FIRSTFRAME,
+    ALP_FLAG_QUEUE_IDLE,
+    ALP_FLAG_SEQUENCE_INDEFINITE,
+    ALP_ILLUMINATE_TIME,
+    ALP_LASTFRAME,
+    ALP_MASTER,
+    ALP_MAX_PICTURE_TIME,
+    ALP_MEMORY_FULL,
+    ALP_MIN_ILLUMINATE_TIME,
+    ALP_MIN_PICTURE_TIME,
+    ALP_NOT_AVAILABLE,
+    ALP_NOT_IDLE,
+    ALP_NOT_READY,
+    ALP_OFF_TIME,
+    ALP_OK,
+    ALP_ON_TIME,
+    ALP_PARM_INVALID,
+    ALP_PCB_TEMPERATURE,
+    ALP_PICNUM,
+    ALP_PICTURE_TIME,
+    ALP_PROJ_ACTIVE,
+    ALP_PROJ_IDLE,
+    ALP_PROJ_LEGACY,
+    ALP_PROJ_MODE,
+    ALP_PROJ_PROGRESS,
+    ALP_PROJ_QUEUE_AVAIL,
+    ALP_PROJ_QUEUE_MAX_AVAIL,
+    ALP_PROJ_QUEUE_MODE,
+    ALP_PROJ_STATE,
+    ALP_SEQ_IN_USE,
+    ALP_SEQ_PUT_LOCK,
+    ALP_SEQ_REPEAT,
+    ALP_USB_CONNECTION,
+    ALP_VERSION,
+    _argValue,
+    _clock,
+    _structCopy,
+    packed_row_bytes,
+)
+
+
+class ALPSimulator(object):
+    """
+    Stand-in for the ALP dll, to run code using ALP4 without a device (tests, benchmarks, other platforms).
+
+    It implements the dll functions used by ALP4 with the same arguments and return codes,
+    keeps track of the sequences and of their settings, and models the duration of the data transfers
+    (USB bandwidth) and of the sequence display (picture time).
+    Image data is not stored.
+
+    Usage:
+    DMD = ALP4(library = ALPSimulator(bandwidth = 300e6))
+    DMD.Initialize()
+
+    PARAMETERS
+    ----------
+    nSizeX, nSizeY : int, optional
+                     Resolution of the simulated DMD. By default, 1024 x 768.
+    DMDType : int, optional
+              Value returned for ALP_DEV_DMDTYPE. By default, ALP_DMDTYPE_XGA_07A.
+    serial : int, optional
+             Value returned for ALP_DEVICE_NUMBER.
+    memory : int, optional
+             Sequence memory in binary pictures. By default, 43690 (16 Gbit for an XGA DMD).
+    bandwidth : float, optional
+                Modeled USB transfer rate in bytes per second. By default, transfers are instantaneous.
+    latency : float, optional
+              Modeled duration of each transfer call in seconds, added to the transfer time.
+    binaryTime : int, optional
+                 Minimum picture time of a binary picture in microseconds (uninterrupted mode).
+    darkTime : int, optional
+               Dark phase added to binary pictures in normal mode, in microseconds.
+    """
+
+    def __init__(
+        self,
+        nSizeX=1024,
+        nSizeY=768,
+        DMDType=ALP_DMDTYPE_XGA_07A,
+        serial=1,
+        memory=43690,
+        bandwidth=None,
+        latency=0.0,
+        binaryTime=44,
+        darkTime=14,
+    ):
+        self.nSizeX = nSizeX
+        self.nSizeY = nSizeY
+        self.DMDType = DMDType
+        self.serial = serial
+        self.memory = memory
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.binaryTime = binaryTime
+        self.darkTime = darkTime
+        self.allocated = False
+        self.seqs = {}
+        self._nextId = 1
+        self.devControls = {}
+        self.projControls = {ALP_PROJ_MODE: ALP_MASTER}
+        # Displayed and waiting sequences: [SequenceId, start time, end time]
+        self._queue = []
+        # Waiting positions in ALP_PROJ_SEQUENCE_QUEUE mode
+        self.queueSize = 32
+        # Total number of bytes received by AlpSeqPut and AlpSeqPutEx
+        self.bytesTransferred = 0
+        self.temperature = 35.0
+        # None when connected, else whether the device was reset, see Disconnect
+        self._disconnected = None
+        # Serializes the calls like the dll, released during the modeled transfers and waits
+        self._lock = threading.RLock()
+
+    def Disconnect(self, reset=False):
+        """
+        Simulate a USB interruption: all the functions fail with ALP_ERROR_COMM until the connection is restored.
+
+        Usage: Disconnect(reset = False)
+
+        PARAMETERS
+        ----------
+        reset : bool, optional
+                If False, the device keeps its state and ALP_USB_CONNECTION (AlpDevControl) reconnects it.
+                If True, the device was power-cycled: ALP_USB_CONNECTION fails with ALP_DEVICE_REMOVED,
+                AlpDevFree releases the old connection and the sequences are lost.
+        """
+        self._disconnected = bool(reset)
+
+    def _offline(self, name, args):
+        # Result of the dll functions while disconnected
+        reset = self._disconnected
+        if name == "AlpDevControl" and _argValue(args[1]) == ALP_USB_CONNECTION:
+            if reset:
+                return ALP_DEVICE_REMOVED
+            self._disconnected = None
+            return ALP_OK
+        if name == "AlpDevFree" and reset:
+            self._disconnected = None
+            self.allocated = False
+            self.seqs.clear()
+            del self._queue[:]
+            self.devControls = {}
+            self.projControls = {ALP_PROJ_MODE: ALP_MASTER}
+            return ALP_OK
+        return ALP_ERROR_COMM
+
+    @staticmethod
+    def _set(pointer, value):
+        pointer._obj.value = value
+
+    def _seq(self, SequenceId):
+        return self.seqs.get(_argValue(SequenceId))
+
+    def _transfer(self, nbytes):
+        self.bytesTransferred += nbytes
+        duration = self.latency
+        if self.bandwidth:
+            duration += nbytes / float(self.bandwidth)
+        if duration > 0:
+            self._sleep(duration)
+
+    def _sleep(self, duration):
+        # Let the other threads call the simulator meanwhile
+        self._lock.release()
+        try:
+            time.sleep(duration)
+        finally:
+            self._lock.acquire()
+
+    def _rowBytes(self, seq):
+        if seq["controls"].get(ALP_DATA_FORMAT, ALP_DATA_MSB_ALIGN) in (
+            ALP_DATA_BINARY_TOPDOWN,
+            ALP_DATA_BINARY_BOTTOMUP,
+        ):
+            return packed_row_bytes(self.nSizeX, self.DMDType)
+        return self.nSizeX
+
+    def _minPictureTime(self, seq):
+        bitnum = seq["controls"].get(ALP_BITNUM, seq["bitDepth"])
+        if bitnum == 1:
+            if seq["controls"].get(ALP_BIN_MODE, ALP_BIN_NORMAL) == ALP_BIN_NORMAL:
+                return self.binaryTime + self.darkTime
+            return self.binaryTime
+        return self.binaryTime * (2**bitnum - 1) // 3
+
+    def _minIlluminateTime(self, seq):
+        bitnum = seq["controls"].get(ALP_BITNUM, seq["bitDepth"])
+        if bitnum == 1:
+            return self.binaryTime
+        return self._minPictureTime(seq)
+
+    def _frames(self, seq):
+        first = seq["controls"].get(ALP_FIRSTFRAME, 0)
+        last = seq["controls"].get(ALP_LASTFRAME, seq["nbImg"] - 1)
+        return last - first + 1
+
+    def _update(self):
+        # Remove the sequences whose display is finished
+        now = _clock()
+        while self._queue and self._queue[0][2] <= now:
+            self._queue.pop(0)
+
+    def _start(self, SequenceId, continuous):
+        if not self.allocated:
+            return ALP_NOT_AVAILABLE
+        seq = self._seq(SequenceId)
+        if seq is None:
+            return ALP_PARM_INVALID
+        self._update()
+        if continuous:
+            duration = float("inf")
+        else:
+            duration = (
+                self._frames(seq)
+                * seq["pictureTime"]
+                * seq["controls"].get(ALP_SEQ_REPEAT, 1)
+                * 1e-6
+            )
+        if self.projControls.get(ALP_PROJ_QUEUE_MODE, ALP_PROJ_LEGACY) == (
+            ALP_PROJ_LEGACY
+        ):
+            # Legacy mode: the new sequence replaces the waiting one
+            del self._queue[1:]
+        elif len(self._queue) > self.queueSize:
+            return ALP_NOT_READY
+        now = _clock()
+        if self._queue and self._queue[-1][2] == float("inf"):
+            # A continuous sequence is stopped at the end of its current iteration
+            last = self._queue[-1]
+            previous = self.seqs[last[0]]
+            iteration = self._frames(previous) * previous["pictureTime"] * 1e-6
+            iterations = int(max(now - last[1], 0.0) // iteration) + 1
+            last[2] = last[1] + iterations * iteration
+        start = self._queue[-1][2] if self._queue else now
+        self._queue.append([_argValue(SequenceId), start, start + duration])
+        return ALP_OK
+
+    def AlpDevAlloc(self, DeviceNum, InitFlag, DeviceIdPtr):
+        if self.allocated:
+            return ALP_NOT_READY
+        self.allocated = True
+        self._set(DeviceIdPtr, 1)
+        return ALP_OK
+
+    def AlpDevFree(self, DeviceId):
+        if self._running():
+            return ALP_NOT_IDLE
+        self.allocated = False
+        self.seqs.clear()
+        return ALP_OK
+
+    def AlpDevHalt(self, DeviceId):
+        del self._queue[:]
+        return ALP_OK
+
+    def AlpDevInquire(self, DeviceId, InquireType, UserVarPtr):
+        values = {
+            ALP_DEVICE_NUMBER: self.serial,
+            ALP_VERSION: 1,
+            ALP_DEV_DMDTYPE: self.DMDType,
+            ALP_DEV_DISPLAY_WIDTH: self.nSizeX,
+            ALP_DEV_DISPLAY_HEIGHT: self.nSizeY,
+            ALP_AVAIL_MEMORY: self.memory
+            - sum(seq["nbImg"] * seq["bitDepth"] for seq in self.seqs.values()),
+            ALP_DDC_FPGA_TEMPERATURE: int(self.temperature * 256),
+            ALP_APPS_FPGA_TEMPERATURE: int(self.temperature * 256),
+            ALP_PCB_TEMPERATURE: int(self.temperature * 256),
+        }
+        InquireType = _argValue(InquireType)
+        if InquireType in values:
+            value = values[InquireType]
+        elif InquireType in self.devControls:
+            value = self.devControls[InquireType]
+        else:
+            return ALP_PARM_INVALID
+        self._set(UserVarPtr, value)
+        return ALP_OK
+
+    def AlpDevControl(self, DeviceId, ControlType, ControlValue):
+        self.devControls[_argValue(ControlType)] = _argValue(ControlValue)
+        return ALP_OK
+
+    def AlpDevControlEx(self, DeviceId, ControlType, UserStructPtr):
+        self.devControls[_argValue(ControlType)] = _structCopy(UserStructPtr)
+        return ALP_OK
+
+    def AlpSeqAlloc(self, DeviceId, BitPlanes, PicNum, SequenceIdPtr):
+        bitDepth = _argValue(BitPlanes)
+        nbImg = _argValue(PicNum)
+        if not (1 <= bitDepth <= 8) or nbImg < 1:
+            return ALP_PARM_INVALID
+        used = sum(seq["nbImg"] * seq["bitDepth"] for seq in self.seqs.values())
+        if used + nbImg * bitDepth > self.memory:
+            return ALP_MEMORY_FULL
+        SequenceId = self._nextId
+        self._nextId += 1
+        self.seqs[SequenceId] = {
+            "bitDepth": bitDepth,
+            "nbImg": nbImg,
+            "controls": {},
+            "pictureTime": 33334,
+            "illuminateTime": 33334 - self.darkTime,
+            "timing": (0, 0, 0, 0, 0),
+        }
+        self._set(SequenceIdPtr, SequenceId)
+        return ALP_OK
+
+    def AlpSeqFree(self, DeviceId, SequenceId):
+        if self._seq(SequenceId) is None:
+            return ALP_PARM_INVALID
+        if _argValue(SequenceId) in self._running():
+            return ALP_SEQ_IN_USE
+        del self.seqs[_argValue(SequenceId)]
+        return ALP_OK
+
+    def AlpSeqControl(self, DeviceId, SequenceId, ControlType, ControlValue):
+        seq = self._seq(SequenceId)
+        if seq is None:
+            return ALP_PARM_INVALID
+        ControlType = _argValue(ControlType)
+        ControlValue = _argValue(ControlValue)
+        # Like the dll, reject a frame range where the first frame would be after the last one
+        first = seq["controls"].get(ALP_FIRSTFRAME, 0)
+        last = seq["controls"].get(ALP_LASTFRAME, seq["nbImg"] - 1)
+        if ControlType == ALP_FIRSTFRAME and not 0 <= ControlValue <= last:
+            return ALP_PARM_INVALID
+        if ControlType == ALP_LASTFRAME and not first <= ControlValue < seq["nbImg"]:
+            return ALP_PARM_INVALID
+        seq["controls"][ControlType] = ControlValue
+        return ALP_OK
+
+    def AlpSeqTiming(
+        self,
+        DeviceId,
+        SequenceId,
+        IlluminateTime,
+        PictureTime,
+        SynchDelay,
+        SynchPulseWidth,
+        TriggerInDelay,
+    ):
+        seq = self._seq(SequenceId)
+        if seq is None:
+            return ALP_PARM_INVALID
+        illuminateTime = _argValue(IlluminateTime)
+        pictureTime = _argValue(PictureTime)
+        minPicture = self._minPictureTime(seq)
+        dark = minPicture - self._minIlluminateTime(seq)
+        if pictureTime == ALP_DEFAULT:
+            if illuminateTime == ALP_DEFAULT:
+                pictureTime = 33334
+            else:
+                pictureTime = max(illuminateTime + dark, minPicture)
+        if illuminateTime == ALP_DEFAULT:
+            illuminateTime = pictureTime - dark
+        if (
+            pictureTime < minPicture
+            or pictureTime > 10000000
+            or illuminateTime < self._minIlluminateTime(seq)
+            or illuminateTime + dark > pictureTime
+        ):
+            return ALP_PARM_INVALID
+        seq["pictureTime"] = pictureTime
+        seq["illuminateTime"] = illuminateTime
+        seq["timing"] = tuple(
+            _argValue(arg)
+            for arg in (
+                IlluminateTime,
+                PictureTime,
+                SynchDelay,
+                SynchPulseWidth,
+                TriggerInDelay,
+            )
+        )
+        return ALP_OK
+
+    def AlpSeqInquire(self, DeviceId, SequenceId, InquireType, UserVarPtr):
+        seq = self._seq(SequenceId)
+        if seq is None:
+            return ALP_PARM_INVALID
+        InquireType = _argValue(InquireType)
+        values = {
+            ALP_BITPLANES: seq["bitDepth"],
+            ALP_BITNUM: seq["controls"].get(ALP_BITNUM, seq["bitDepth"]),
+            ALP_PICNUM: seq["nbImg"],
+            ALP_PICTURE_TIME: seq["pictureTime"],
+            ALP_ILLUMINATE_TIME: seq["illuminateTime"],
+            ALP_MIN_PICTURE_TIME: self._minPictureTime(seq),
+            ALP_MIN_ILLUMINATE_TIME: self._minIlluminateTime(seq),
+            ALP_MAX_PICTURE_TIME: 10000000,
+            ALP_ON_TIME: seq["illuminateTime"] * self._frames(seq),
+            ALP_OFF_TIME: (seq["pictureTime"] - seq["illuminateTime"])
+            * self._frames(seq),
+        }
+        if InquireType in values:
+            value = values[InquireType]
+        elif InquireType in seq["controls"]:
+            value = seq["controls"][InquireType]
+        else:
+            value = ALP_DEFAULT
+        self._set(UserVarPtr, value)
+        return ALP_OK
+
+    def AlpSeqPut(self, DeviceId, SequenceId, PicOffset, PicLoad, UserArrayPtr):
+        seq = self._seq(SequenceId)
+        if seq is None:
+            return ALP_PARM_INVALID
+        PicOffset = _argValue(PicOffset)
+        PicLoad = _argValue(PicLoad)
+        if PicLoad == 0:
+            PicLoad = seq["nbImg"] - PicOffset
+        if PicOffset < 0 or PicLoad < 0 or PicOffset + PicLoad > seq["nbImg"]:
+            return ALP_PARM_INVALID
+        if _argValue(SequenceId) in self._running() and (
+            seq["controls"].get(ALP_SEQ_PUT_LOCK, ALP_DEFAULT) == ALP_DEFAULT
+        ):
+            return ALP_SEQ_IN_USE
+        self._transfer(PicLoad * self.nSizeY * self._rowBytes(seq))
+        return ALP_OK
+
+    def AlpSeqPutEx(self, DeviceId, SequenceId, UserStructPtr, UserArrayPtr):
+        seq = self._seq(SequenceId)
+        if seq is None:
+            return ALP_PARM_INVALID
+        param = getattr(UserStructPtr, "_obj", UserStructPtr)
+        PicLoad = param.PicLoad or seq["nbImg"] - param.PicOffset
+        LineLoad = param.LineLoad or self.nSizeY - param.LineOffset
+        if param.LineOffset < 0 or param.LineOffset + LineLoad > self.nSizeY:
+            return ALP_PARM_INVALID
+        self._transfer(PicLoad * LineLoad * self._rowBytes(seq))
+        return ALP_OK
+
+    def _running(self):
+        self._update()
+        return [entry[0] for entry in self._queue]
+
+    def AlpProjStart(self, DeviceId, SequenceId):
+        return self._start(SequenceId, False)
+
+    def AlpProjStartCont(self, DeviceId, SequenceId):
+        return self._start(SequenceId, True)
+
+    def AlpProjHalt(self, DeviceId):
+        del self._queue[:]
+        return ALP_OK
+
+    def AlpProjWait(self, DeviceId):
+        self._update()
+        if not self._queue:
+            return ALP_OK
+        end = self._queue[-1][2]
+        if end == float("inf"):
+            # The dll would block indefinitely for a continuous display
+            return ALP_NOT_IDLE
+        delay = end - _clock()
+        if delay > 0:
+            self._sleep(delay)
+        self._update()
+        return ALP_OK
+
+    def AlpProjControl(self, DeviceId, ControlType, ControlValue):
+        self.projControls[_argValue(ControlType)] = _argValue(ControlValue)
+        return ALP_OK
+
+    def AlpProjControlEx(self, DeviceId, ControlType, UserStructPtr):
+        self.projControls[_argValue(ControlType)] = _structCopy(UserStructPtr)
+        return ALP_OK
+
+    def AlpProjInquire(self, DeviceId, InquireType, UserVarPtr):
+        InquireType = _argValue(InquireType)
+        if InquireType == ALP_PROJ_STATE:
+            value = ALP_PROJ_ACTIVE if self._running() else ALP_PROJ_IDLE
+        elif InquireType == ALP_PROJ_QUEUE_MAX_AVAIL:
+            value = self.queueSize
+        elif InquireType == ALP_PROJ_QUEUE_AVAIL:
+            value = self.queueSize - max(len(self._running()) - 1, 0)
+        else:
+            value = self.projControls.get(InquireType, ALP_DEFAULT)
+        self._set(UserVarPtr, value)
+        return ALP_OK
+
+    def AlpProjInquireEx(self, DeviceId, InquireType, UserStructPtr):
+        if _argValue(InquireType) != ALP_PROJ_PROGRESS:
+            return ALP_PARM_INVALID
+        progress = UserStructPtr._obj
+        running = self._running()
+        ct.memset(ct.addressof(progress), 0, ct.sizeof(progress))
+        if not running:
+            progress.nFlagse = ALP_FLAG_QUEUE_IDLE.value
+            return ALP_OK
+        SequenceId, start, end = self._queue[0]
+        seq = self.seqs[SequenceId]
+        frames = self._frames(seq)
+        elapsed = int(max(_clock() - start, 0) * 1e6 // seq["pictureTime"])
+        progress.CurrentQueueId = SequenceId
+        progress.SequenceId = SequenceId
+        progress.nWaitingSequences = len(running) - 1
+        progress.nFrameCounter = frames - elapsed % frames
+        progress.nPictureTime = seq["pictureTime"]
+        progress.nFramesPerSubSequence = frames
+        if end == float("inf"):
+            progress.nFlagse = ALP_FLAG_SEQUENCE_INDEFINITE.value
+            progress.nSequenceCounter = 0
+        else:
+            repeat = seq["controls"].get(ALP_SEQ_REPEAT, 1)
+            progress.nSequenceCounter = max(repeat - elapsed // frames, 0)
+        return ALP_OK
+
+
+def _simulatedConnection(func):
+    # Make a function of ALPSimulator thread-safe, and fail while the simulated device is disconnected
+    name = func.__name__
+
+    def call(self, *args):
+        with self._lock:
+            if self._disconnected is not None:
+                return self._offline(name, args)
+            return func(self, *args)
+
+    call.__name__ = name
+    call.__doc__ = func.__doc__
+    return call
+
+
+for _name in dir(ALPSimulator):
+    if _name.startswith("Alp"):
+        setattr(
+            ALPSimulator,
+            _name,
+            _simulatedConnection(getattr(ALPSimulator, _name)),
+        )
+del _name
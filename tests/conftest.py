@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import ALP4  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def profileDir(tmp_path, monkeypatch):
+    # Keep the cached timing limits and upload profiles out of the home directory
+    monkeypatch.setattr(ALP4, "PROFILE_DIR", str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def simulator():
+    return ALP4.ALPSimulator(nSizeX=256, nSizeY=32)
+
+
+@pytest.fixture
+def dmd(simulator):
+    device = ALP4.ALP4(library=simulator)
+    device.Initialize(verbose=False)
+    yield device
+    device.Halt()
+    device.Free()
@@ -0,0 +1,43 @@
+import os
+
+import ALP4
+
+
+def initialize(simulator, **kwargs):
+    dmd = ALP4.ALP4(library=simulator)
+    dmd.Initialize(DeviceNum=simulator.serial, verbose=False, **kwargs)
+    return dmd
+
+
+def test_cache_not_written_by_default(profileDir, simulator):
+    dmd = initialize(simulator)
+    dmd.TimingLimits(8)
+    dmd.Free()
+    assert os.listdir(profileDir) == []
+
+
+def test_cache_written_with_save_cache(profileDir, simulator):
+    dmd = initialize(simulator, saveCache=True)
+    limits = dmd.TimingLimits(8)
+    dmd.Free()
+
+    dmd = initialize(simulator)
+    assert dmd.capabilities["timing"]["8"] == list(limits)
+    dmd.Free()
+
+
+def test_stale_cache_checked_by_timing_limits(simulator):
+    dmd = initialize(simulator, saveCache=True)
+    dmd.TimingLimits(8)
+    dmd.Free()
+
+    # Another DMD with the same serial number and stale cached limits
+    other = ALP4.ALPSimulator(nSizeX=512, nSizeY=64, serial=simulator.serial)
+    dmd = initialize(other)
+    dmd.capabilities["timing"]["8"] = [1, 1, 1]
+    assert dmd.nSizeX == simulator.nSizeX
+
+    limits = dmd.TimingLimits(8)
+    assert limits != (1, 1, 1)
+    assert (dmd.nSizeX, dmd.nSizeY) == (512, 64)
+    dmd.Free()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import ALP4
+
+
+@pytest.fixture
+def threaded(simulator):
+    device = ALP4.ALP4(library=simulator, threadSafe=True)
+    device.Initialize(verbose=False)
+    yield device
+    device.Free()
+
+
+def test_requires_thread_safe_device(dmd):
+    with pytest.raises(ValueError):
+        dmd.StartHealthMonitor()
+    assert dmd.health is None
+
+
+def test_thresholds(threaded, simulator):
+    sampler = ALP4.HealthSampler(threaded)
+    events = []
+    sampler.AddThreshold(
+        50.0, lambda sensor, temperature, sample: events.append(temperature)
+    )
+    for temperature in (40.0, 55.0, 56.0, 47.0, 52.0):
+        simulator.temperature = temperature
+        sampler.Sample()
+    # Re-armed once 2 degrees below the limit
+    assert events == [55.0, 52.0]
+    assert sampler.Samples()["pcb"].tolist() == [40.0, 55.0, 56.0, 47.0, 52.0]
+
+
+def test_throttling(threaded, simulator):
+    sampler = threaded.StartHealthMonitor(interval=60.0, throttleTemperature=50.0)
+    try:
+        simulator.temperature = 60.0
+        sampler.Sample()
+        assert sampler.pictureTimeScale == pytest.approx(1.1)
+        SequenceId = threaded.SeqAlloc(nbImg=2, bitDepth=1)
+        threaded.SetTiming(SequenceId, pictureTime=10000)
+        assert threaded.SeqInquire(ALP4.ALP_PICTURE_TIME, SequenceId) == 11000
+    finally:
+        threaded.StopHealthMonitor()
+
+
+def test_inquiries_hold_state_lock(threaded):
+    sampler = ALP4.HealthSampler(threaded)
+    done = threading.Event()
+    with threaded._stateLock:
+        thread = threading.Thread(target=lambda: (sampler.Sample(), done.set()))
+        thread.start()
+        assert not done.wait(0.05)
+    thread.join()
+    assert done.is_set()
+
+
+def test_samples_while_sampling(threaded, simulator):
+    sampler = threaded.StartHealthMonitor(interval=0.0005, capacity=16)
+    try:
+        deadline = time.time() + 0.2
+        while time.time() < deadline:
+            samples = sampler.Samples()
+            assert len(samples) <= 16
+            assert np.all(np.diff(samples["time"]) >= 0)
+    finally:
+        threaded.StopHealthMonitor()
+    assert sampler.error is None
+    assert sampler.count > 16
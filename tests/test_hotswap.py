@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pytest
+
+import ALP4
+
+
+def load(dmd, nbImg, pictureTime):
+    SequenceId = dmd.SeqAlloc(nbImg=nbImg, bitDepth=8)
+    imgData = np.zeros((nbImg, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8)
+    dmd.SeqPut(imgData, SequenceId=SequenceId)
+    dmd.SetTiming(SequenceId, pictureTime=pictureTime)
+    return SequenceId, imgData
+
+
+def displayed(dmd):
+    return dmd.ProjInquireEx(ALP4.ALP_PROJ_PROGRESS).SequenceId
+
+
+def frame(dmd, value):
+    return np.full((dmd.nSizeY, dmd.nSizeX), value, dtype=np.uint8)
+
+
+def test_single_slot(dmd):
+    SequenceId, _ = load(dmd, 8, 10000)
+    swap = ALP4.HotSwap(dmd, SequenceId)
+    assert dmd.SeqInfo(SequenceId).controls[ALP4.ALP_SEQ_PUT_LOCK] == ALP4.ALP_ENABLE
+    swap.Run()
+    for offset in range(8):
+        report = swap.Swap(offset, frame(dmd, offset))
+        assert report["SequenceId"] is SequenceId
+        assert displayed(dmd) == SequenceId.value
+    with pytest.raises(ALP4.ALPError):
+        swap.Free()
+    dmd.Halt()
+    swap.Free()
+    assert dmd.SeqInfo(SequenceId).controls[ALP4.ALP_SEQ_PUT_LOCK] == ALP4.ALP_DEFAULT
+
+
+def test_single_slot_too_short(dmd):
+    SequenceId, _ = load(dmd, 2, 10000)
+    swap = ALP4.HotSwap(dmd, SequenceId, margin=1)
+    swap.Run()
+    with pytest.raises(ValueError):
+        swap.Swap(0, frame(dmd, 1))
+    dmd.Halt()
+
+
+def test_double_slot_during_display(dmd):
+    pool = dmd.EnablePool()
+    tracer = dmd.EnableTrace()
+    # One iteration of the sequence lasts 80 ms
+    SequenceId, imgData = load(dmd, 4, 20000)
+    swap = ALP4.HotSwap(dmd, SequenceId, doubleSlot=True, imgData=imgData)
+    first, second = swap.slots
+    swap.Run()
+    time.sleep(0.01)
+
+    report = swap.Swap(0, frame(dmd, 1))
+    assert report["SequenceId"] is second
+    # The outgoing slot is displayed until the end of its iteration, and cannot be released meanwhile
+    assert displayed(dmd) == first.value
+    with pytest.raises(ALP4.ALPError) as error:
+        dmd.FreeSeq(first)
+    assert error.value.code == ALP4.ALP_SEQ_IN_USE
+    assert pool.idle == []
+
+    tracer.Clear()
+    report = swap.Swap(1, frame(dmd, 2))
+    # Written to the first slot once the swap took place, with the update it missed
+    assert report["SequenceId"] is first
+    assert report["waited"] > 0.03
+    calls = tracer.Calls()
+    puts = calls[calls["func"] == tracer.functions.index("AlpSeqPut")]
+    assert puts["SequenceId"].tolist() == [first.value, first.value]
+    assert puts["PicLoad"].tolist() == [1, 1]
+    assert displayed(dmd) == second.value
+
+    with pytest.raises(ALP4.ALPError):
+        swap.Free()
+    assert dmd.SeqInfo(second) is not None
+    dmd.Halt()
+    swap.Free()
+    assert [info.SequenceId.value for info in pool.idle] == [second.value]
+    assert swap.slots == [first]
+
+
+def test_double_slot_idle(dmd):
+    SequenceId, imgData = load(dmd, 4, 20000)
+    swap = ALP4.HotSwap(dmd, SequenceId, doubleSlot=True, imgData=imgData)
+    # Nothing displayed: the current slot is updated
+    report = swap.Swap(0, frame(dmd, 1))
+    assert report["SequenceId"] is SequenceId
+    assert report["waited"] < 0.01
+    swap.Free()
@@ -0,0 +1,23 @@
+import numpy as np
+
+import ALP4
+
+
+def test_grating_cached():
+    ALP4.GRATING_CACHE.Clear()
+    first = ALP4.grating(64, 32, 8, mode="gray")
+    assert first.shape == (32, 64)
+    assert ALP4.grating(64, 32, 8, mode="gray") is first
+    assert len(ALP4.GRATING_CACHE) == 1
+
+
+def test_phase_steps(dmd):
+    steps = dmd.PhaseSteps(16, 4)
+    assert steps.shape == (4, dmd.nSizeY, dmd.nSizeX // 8)
+    assert not np.array_equal(steps[0], steps[1])
+
+
+def test_random_patterns_regenerable():
+    patterns = ALP4.RandomPatterns(64, 32, seed=3)
+    frames = patterns.Frames(0, 4)
+    assert np.array_equal(patterns.Frame(2), frames[2])
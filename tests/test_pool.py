@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import ALP4
+
+
+def load(dmd, nbImg, bitDepth=8):
+    SequenceId = dmd.SeqAlloc(nbImg=nbImg, bitDepth=bitDepth)
+    dmd.SeqPut(np.zeros((nbImg, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8))
+    return SequenceId
+
+
+def test_reuse(dmd, simulator):
+    pool = dmd.EnablePool()
+    first = dmd.SeqAlloc(nbImg=4, bitDepth=1)
+    dmd.SeqControl(ALP4.ALP_BIN_MODE, ALP4.ALP_BIN_UNINTERRUPTED, first)
+    dmd.FreeSeq(first)
+    assert first.value in simulator.seqs
+
+    second = dmd.SeqAlloc(nbImg=3, bitDepth=1)
+    assert second.value == first.value
+    assert (pool.hits, pool.misses) == (1, 1)
+    controls = simulator.seqs[second.value]["controls"]
+    assert controls[ALP4.ALP_BIN_MODE] == ALP4.ALP_BIN_NORMAL
+    assert (controls[ALP4.ALP_FIRSTFRAME], controls[ALP4.ALP_LASTFRAME]) == (0, 2)
+    assert dmd.SeqInfo(second).nbImg == 3
+
+
+def test_best_fit(dmd):
+    dmd.EnablePool()
+    large = dmd.SeqAlloc(nbImg=8, bitDepth=1)
+    small = dmd.SeqAlloc(nbImg=4, bitDepth=1)
+    gray = dmd.SeqAlloc(nbImg=4, bitDepth=8)
+    for SequenceId in (large, small, gray):
+        dmd.FreeSeq(SequenceId)
+    assert dmd.SeqAlloc(nbImg=2, bitDepth=1).value == small.value
+    assert dmd.SeqAlloc(nbImg=2, bitDepth=1).value == large.value
+
+
+def test_max_memory(dmd, simulator):
+    pool = dmd.EnablePool(maxMemory=16)
+    first = dmd.SeqAlloc(nbImg=8, bitDepth=1)
+    dmd.FreeSeq(first)
+    dmd.SeqAlloc(nbImg=2, bitDepth=8)
+    assert pool.evictions == 1
+    assert first.value not in simulator.seqs
+
+
+def test_displayed_sequence_is_not_released(dmd, simulator):
+    pool = dmd.EnablePool()
+    SequenceId = load(dmd, 2)
+    dmd.Run(SequenceId)
+    with pytest.raises(ALP4.ALPError) as error:
+        dmd.FreeSeq(SequenceId)
+    assert error.value.code == ALP4.ALP_SEQ_IN_USE
+    assert pool.idle == []
+    assert dmd.SeqInfo(SequenceId) is not None
+
+    dmd.Halt()
+    dmd.FreeSeq(SequenceId)
+    assert [info.SequenceId.value for info in pool.idle] == [SequenceId.value]
+
+
+def test_queued_sequence_is_not_released(dmd, simulator):
+    pool = dmd.EnablePool()
+    dmd.ProjControl(ALP4.ALP_PROJ_QUEUE_MODE, ALP4.ALP_PROJ_SEQUENCE_QUEUE)
+    displayed = load(dmd, 2)
+    queued = load(dmd, 2)
+    other = load(dmd, 2)
+    dmd.Run(displayed, loop=False)
+    dmd.Run(queued, loop=False)
+    with pytest.raises(ALP4.ALPError) as error:
+        dmd.FreeSeq(queued)
+    assert error.value.code == ALP4.ALP_SEQ_IN_USE
+    assert dmd.SeqInfo(queued) is not None
+
+    # Not queued, but not reused while the queue is not empty: freed by the dll
+    dmd.FreeSeq(other)
+    assert other.value not in simulator.seqs
+    assert pool.idle == []
+    dmd.Halt()
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+import ALP4
+
+
+def record(path, simulator, payloads=False):
+    dmd = ALP4.ALP4(library=simulator)
+    dmd.StartRecording(path, payloads=payloads)
+    dmd.Initialize(verbose=False)
+    SequenceId = dmd.SeqAlloc(nbImg=4, bitDepth=1)
+    dmd.SeqPut(np.full((4, dmd.nSizeY, dmd.nSizeX), 255, dtype=np.uint8), autoPack=True)
+    dmd.SetTiming(SequenceId, pictureTime=1000)
+    dmd.SeqControl(ALP4.ALP_SEQ_REPEAT, 2, SequenceId)
+    dmd.Run(SequenceId, loop=False)
+    dmd.Wait()
+    dmd.FreeSeq(SequenceId)
+    dmd.Free()
+    return dmd
+
+
+def test_round_trip(tmp_path, simulator):
+    path = str(tmp_path / "calls.alp")
+    dmd = record(path, simulator)
+    assert dmd.recorder is None
+
+    replayer = ALP4.CallReplayer(path)
+    names = [call[0] for call in replayer.calls]
+    assert names[0] == "AlpDevAlloc"
+    assert names[-1] == "AlpDevFree"
+    for name in ("AlpSeqAlloc", "AlpSeqPut", "AlpSeqTiming", "AlpProjStart"):
+        assert name in names
+    assert all(call[3] == ALP4.ALP_OK for call in replayer.calls)
+
+    recorded = replayer.Recorded().Summary()
+    assert recorded["AlpSeqPut"]["bytes"] == simulator.bytesTransferred
+
+    target = ALP4.ALPSimulator(nSizeX=simulator.nSizeX, nSizeY=simulator.nSizeY)
+    report = replayer.Replay(target)
+    assert report["mismatches"] == 0
+    assert report["replayed"]["bytes"] == report["recorded"]["bytes"]
+    assert target.bytesTransferred == simulator.bytesTransferred
+    assert not target.allocated
+    assert set(report["functions"]) == set(names)
+    assert report["functions"]["AlpSeqPut"]["calls"] == names.count("AlpSeqPut")
+
+
+def test_payloads(tmp_path, simulator):
+    small = str(tmp_path / "small.alp")
+    full = str(tmp_path / "full.alp")
+    record(small, simulator)
+    record(full, ALP4.ALPSimulator(nSizeX=256, nSizeY=32), payloads=True)
+    packedBytes = 4 * simulator.nSizeY * simulator.nSizeX // 8
+    assert os.path.getsize(full) - os.path.getsize(small) == packedBytes
+
+    replayer = ALP4.CallReplayer(full)
+    data = [
+        arg
+        for name, _, _, _, args in replayer.calls
+        if name == "AlpSeqPut"
+        for arg in args
+        if arg[0] == ALP4._ARG_DATA
+    ]
+    assert len(data) == 1
+    assert data[0][3] == b"\xff" * packedBytes
+    assert replayer.Replay(ALP4.ALPSimulator(nSizeX=256, nSizeY=32))["mismatches"] == 0
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a recording")
+    with pytest.raises(ValueError):
+        ALP4.CallReplayer(str(path))
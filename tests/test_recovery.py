@@ -0,0 +1,113 @@
+import ctypes
+
+import numpy as np
+
+import ALP4
+
+
+def frames(dmd, nbImg, value):
+    return np.full((nbImg, dmd.nSizeY, dmd.nSizeX), value, dtype=np.uint8)
+
+
+def test_recover_reinitialize(dmd, simulator):
+    dmd.EnableRecovery(retryDelay=0.0)
+    SequenceId = dmd.SeqAlloc(nbImg=4, bitDepth=8)
+    dmd.SeqPut(frames(dmd, 4, 7))
+    dmd.SeqControl(ALP4.ALP_SEQ_REPEAT, 3)
+    simulator.Disconnect(reset=True)
+    report = dmd.Recover()
+    assert report["method"] == "reinitialize"
+    assert report["recreated"] == 1
+    assert report["restored"] == 1
+    assert simulator.seqs[SequenceId.value]["controls"][ALP4.ALP_SEQ_REPEAT] == 3
+    assert dmd.recoveries == [report]
+
+
+def test_retried_upload_size(dmd, simulator, tmp_path):
+    tracer = dmd.EnableTrace()
+    dmd.StartRecording(str(tmp_path / "calls.alp"))
+    dmd.EnableRecovery(retryDelay=0.0)
+    dmd.SeqAlloc(nbImg=2, bitDepth=8)
+    simulator.Disconnect(reset=True)
+    imgData = frames(dmd, 2, 1)
+    dmd.SeqPut(imgData)
+    dmd.StopRecording()
+
+    # Upload of the retained data by the recovery, then the retried call
+    calls = tracer.Calls()
+    put = calls[calls["func"] == tracer.functions.index("AlpSeqPut")]
+    assert put["ret"].tolist() == [ALP4.ALP_OK, ALP4.ALP_OK]
+    assert put["nbytes"].tolist() == [imgData.nbytes, imgData.nbytes]
+
+    # The recording also holds the failed attempt
+    recorded = [
+        (ret, [arg[1] for arg in args if arg[0] == ALP4._ARG_DATA])
+        for name, _, _, ret, args in ALP4.CallReplayer(
+            str(tmp_path / "calls.alp")
+        ).calls
+        if name == "AlpSeqPut"
+    ]
+    assert recorded == [
+        (ALP4.ALP_ERROR_COMM, [imgData.nbytes]),
+        (ALP4.ALP_OK, [imgData.nbytes]),
+        (ALP4.ALP_OK, [imgData.nbytes]),
+    ]
+
+
+def test_device_controls_restored(dmd, simulator):
+    dmd.EnableRecovery(retryDelay=0.0)
+    dmd.DevControl(ALP4.ALP_TRIGGER_EDGE, ALP4.ALP_EDGE_RISING)
+    dmd.SetSynchGates(out1=4)
+    dmd.ProjControl(ALP4.ALP_PROJ_MODE, ALP4.ALP_SLAVE)
+    mask = np.ones((dmd.nSizeY, dmd.nSizeX), dtype=bool)
+    mask[:16] = False
+    dmd.SetDmdMask(mask)
+    mask[16:] = False
+    dmd.SetDmdMask(mask)
+    simulator.Disconnect(reset=True)
+    report = dmd.Recover()
+    assert report["method"] == "reinitialize"
+    assert report["notRestored"] == []
+    assert simulator.devControls[ALP4.ALP_TRIGGER_EDGE] == ALP4.ALP_EDGE_RISING
+    gate = simulator.devControls[ALP4.ALP_DEV_DYN_SYNCH_OUT1_GATE]
+    assert gate.Period == 4
+    assert list(gate.Gate[:4]) == [1, 0, 0, 0]
+    assert simulator.projControls[ALP4.ALP_PROJ_MODE] == ALP4.ALP_SLAVE
+    written = simulator.projControls[ALP4.ALP_DMD_MASK_WRITE]
+    # The whole mask is written again, not only the rows of the last write
+    assert written.nRowOffset == 0
+    assert written.nRowCount == dmd._dmdMask[1].shape[0]
+
+
+def test_unreadable_structure_reported(dmd, simulator):
+    dmd.EnableRecovery(retryDelay=0.0)
+    flut = ALP4.tFlutWrite()
+    # Structure given by its address only
+    dmd.ProjControlEx(ALP4.ALP_FLUT_WRITE_9BIT, ctypes.c_void_p(ctypes.addressof(flut)))
+    simulator.Disconnect(reset=True)
+    assert dmd.Recover()["notRestored"] == [ALP4.ALP_FLUT_WRITE_9BIT]
+
+
+def test_pool_reuse_drops_recovery_content(dmd, simulator):
+    dmd.EnablePool()
+    dmd.EnableRecovery(retryDelay=0.0)
+    sources = []
+    first = dmd.SeqAlloc(nbImg=4, bitDepth=8)
+    dmd.SetSequenceSource(lambda: sources.append(1) or frames(dmd, 4, 1), first)
+    dmd.SeqPut(frames(dmd, 4, 1), SequenceId=first)
+    dmd.FreeSeq(first)
+
+    second = dmd.SeqAlloc(nbImg=4, bitDepth=8)
+    assert second.value == first.value
+    info = dmd.SeqInfo(second)
+    assert info.source is None
+    assert info.uploads == []
+    imgData = frames(dmd, 4, 2)
+    dmd.SeqPut(imgData, SequenceId=second)
+    assert [(offset, nbImg) for offset, nbImg, _ in info.uploads] == [(0, 4)]
+    assert np.array_equal(info.uploads[0][2], imgData)
+
+    simulator.Disconnect(reset=True)
+    report = dmd.Recover()
+    assert report["restored"] == 1
+    assert sources == []
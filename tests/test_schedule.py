@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+import pytest
+
+import ALP4
+
+
+def patterns(dmd, n):
+    rng = np.random.RandomState(0)
+    return list((rng.rand(n, dmd.nSizeY, dmd.nSizeX) > 0.5).astype(np.uint8) * 255)
+
+
+def test_compile(dmd):
+    A, B, C = patterns(dmd, 3)
+    plan = dmd.CompileSchedule([(A, 1000), (B, 1000), (A, 1000), (A, 1000), (C, 2000)])
+    assert [pictureTime for pictureTime, _ in plan.sequences] == [1000, 2000]
+    assert plan.nbFrames == 3
+    assert plan.steps == [[0, 0, 1, 1], [0, 0, 0, 2], [1, 0, 0, 1]]
+    assert plan.duration == 6000
+
+
+def test_duration_limits(dmd):
+    (A,) = patterns(dmd, 1)
+    with pytest.raises(ValueError):
+        dmd.CompileSchedule([(A, 1)])
+
+
+def test_play_interleaved_windows(dmd, simulator):
+    A, B, C = patterns(dmd, 3)
+    # Sequence 0 plays frame 0 then frame 1: ALP_LASTFRAME has to be set before ALP_FIRSTFRAME
+    plan = dmd.CompileSchedule([(A, 1000), (C, 2000), (B, 1000), (A, 1000)])
+    assert plan.steps == [[0, 0, 0, 1], [1, 0, 0, 1], [0, 1, 1, 1], [0, 0, 0, 1]]
+    dmd.LoadSchedule(plan)
+    assert simulator.bytesTransferred == 3 * dmd.nSizeY * dmd.nSizeX // 8
+
+    start = time.time()
+    dmd.PlaySchedule(plan, wait=True)
+    assert time.time() - start >= plan.duration * 1e-6
+    assert dmd.ProjInquire(ALP4.ALP_PROJ_STATE) == ALP4.ALP_PROJ_IDLE
+    SequenceId = plan.SequenceIds[0]
+    assert dmd.SeqInquire(ALP4.ALP_FIRSTFRAME, SequenceId) == 0
+    assert dmd.SeqInquire(ALP4.ALP_LASTFRAME, SequenceId) == 0
+
+
+def test_play_twice(dmd):
+    A, B = patterns(dmd, 2)
+    plan = dmd.CompileSchedule([(B, 1000), (A, 1000), (B, 1000)])
+    dmd.LoadSchedule(plan)
+    dmd.PlaySchedule(plan, wait=True)
+    dmd.PlaySchedule(plan, wait=True)
+    SequenceId = plan.SequenceIds[0]
+    assert dmd.SeqInquire(ALP4.ALP_FIRSTFRAME, SequenceId) == 0
+    assert dmd.SeqInquire(ALP4.ALP_LASTFRAME, SequenceId) == 0
+
+
+def test_simulator_rejects_inverted_window(dmd):
+    dmd.SeqAlloc(nbImg=4, bitDepth=1)
+    dmd.SeqControl(ALP4.ALP_LASTFRAME, 1)
+    with pytest.raises(ALP4.ALPError) as error:
+        dmd.SeqControl(ALP4.ALP_FIRSTFRAME, 2)
+    assert error.value.code == ALP4.ALP_PARM_INVALID
+    with pytest.raises(ALP4.ALPError):
+        dmd.SeqControl(ALP4.ALP_LASTFRAME, 4)
+    dmd.SeqControl(ALP4.ALP_FIRSTFRAME, 1)
+    with pytest.raises(ALP4.ALPError):
+        dmd.SeqControl(ALP4.ALP_LASTFRAME, 0)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import ALP4
+
+
+def frames(dmd, nbImg, seed=0):
+    rng = np.random.RandomState(seed)
+    return (rng.rand(nbImg, dmd.nSizeY, dmd.nSizeX) > 0.5).astype(np.uint8) * 255
+
+
+def test_unpacked_by_default(dmd, simulator):
+    dmd.SeqAlloc(nbImg=4, bitDepth=1)
+    dmd.SeqPut(frames(dmd, 4))
+    assert simulator.bytesTransferred == 4 * dmd.nSizeY * dmd.nSizeX
+    assert dmd.SeqInquire(ALP4.ALP_DATA_FORMAT) == ALP4.ALP_DATA_MSB_ALIGN
+
+
+def test_auto_pack(dmd, simulator):
+    SequenceId = dmd.SeqAlloc(nbImg=4, bitDepth=1)
+    dmd.SeqPut(frames(dmd, 4), autoPack=True)
+    assert simulator.bytesTransferred == 4 * dmd.nSizeY * dmd.nSizeX // 8
+    assert dmd.SeqInquire(ALP4.ALP_DATA_FORMAT) == ALP4.ALP_DATA_BINARY_TOPDOWN
+    assert dmd.SeqInfo(SequenceId).controls[ALP4.ALP_DATA_FORMAT] == (
+        ALP4.ALP_DATA_BINARY_TOPDOWN
+    )
+
+
+def test_auto_pack_ignores_gray_sequences(dmd, simulator):
+    dmd.SeqAlloc(nbImg=2, bitDepth=8)
+    dmd.SeqPut(frames(dmd, 2), autoPack=True)
+    assert simulator.bytesTransferred == 2 * dmd.nSizeY * dmd.nSizeX
+    assert dmd.SeqInquire(ALP4.ALP_DATA_FORMAT) == ALP4.ALP_DATA_MSB_ALIGN
+
+
+@pytest.mark.parametrize(
+    "dataFormat", [ALP4.ALP_DATA_BINARY_TOPDOWN, ALP4.ALP_DATA_BINARY_BOTTOMUP]
+)
+def test_packed_format_is_honoured(dmd, simulator, dataFormat):
+    dmd.SeqAlloc(nbImg=3, bitDepth=1)
+    dmd.SeqControl(ALP4.ALP_DATA_FORMAT, dataFormat)
+    dmd.SeqPut(frames(dmd, 3))
+    assert simulator.bytesTransferred == 3 * dmd.nSizeY * dmd.nSizeX // 8
+    assert dmd.SeqInquire(ALP4.ALP_DATA_FORMAT) == dataFormat
+
+
+def test_packed_data_is_not_packed_again(dmd, simulator):
+    dmd.SeqAlloc(nbImg=2, bitDepth=1)
+    dmd.SeqControl(ALP4.ALP_DATA_FORMAT, ALP4.ALP_DATA_BINARY_TOPDOWN)
+    packed = ALP4.pack_binary(frames(dmd, 2), dmd.nSizeX)
+    dmd.SeqPut(packed)
+    assert simulator.bytesTransferred == packed.nbytes
+
+
+def test_seq_put_ex_packs_lines(dmd):
+    tracer = dmd.EnableTrace()
+    dmd.SeqAlloc(nbImg=2, bitDepth=1)
+    dmd.SeqControl(ALP4.ALP_DATA_FORMAT, ALP4.ALP_DATA_BINARY_TOPDOWN)
+    lines = frames(dmd, 2)[:, 4:12]
+    dmd.SeqPutEx(lines, LineOffset=4, LineLoad=8)
+    calls = tracer.Calls()
+    put = calls[calls["func"] == tracer.functions.index("AlpSeqPutEx")]
+    assert put["nbytes"].tolist() == [2 * 8 * dmd.nSizeX // 8]
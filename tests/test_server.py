@@ -0,0 +1,102 @@
+import threading
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+import pytest
+
+import ALP4
+import ALP4server
+
+pytestmark = pytest.mark.skipif(
+    ALP4server.shared_memory is None,
+    reason="multiprocessing.shared_memory is not available",
+)
+
+
+@pytest.fixture
+def server(dmd, tmp_path):
+    server = ALP4.ALPServer(dmd, address=str(tmp_path / "alp.sock"))
+    server.Start()
+    yield server
+    server.Close()
+
+
+def connect(server):
+    return ALP4.ALPClient(server.address, server.authkey)
+
+
+def test_authkey(server):
+    assert len(server.authkey) == 32
+    with pytest.raises(Exception):
+        ALP4.ALPClient(server.address, b"wrong key")
+    client = connect(server)
+    assert client.nSizeX == server.alp.nSizeX
+    client.Close()
+
+
+def test_upload_and_free(server, simulator):
+    client = connect(server)
+    SequenceId = client.SeqAlloc(nbImg=2, bitDepth=8)
+    imgData = np.zeros((2, client.nSizeY, client.nSizeX), dtype=np.uint8)
+    client.SeqPut(imgData)
+    assert client.SeqInquire(ALP4.ALP_PICNUM) == 2
+    assert server.Stats()["bytesUploaded"] == imgData.nbytes
+    assert SequenceId in simulator.seqs
+    client.Close()
+    # The sequences of a client are freed when it disconnects
+    for _ in range(100):
+        if SequenceId not in simulator.seqs:
+            break
+        time.sleep(0.01)
+    assert SequenceId not in simulator.seqs
+
+
+def test_invalid_batch(server):
+    conn = Client(server.address, authkey=server.authkey)
+    for batch in (None, 3, [("Stats",), "Stats"], [()]):
+        conn.send(batch)
+        ((status, error),) = conn.recv()
+        assert status == "error"
+        assert isinstance(error, ValueError)
+    # The connection is still served
+    conn.send([("Resolution",)])
+    assert conn.recv() == [("ok", (server.alp.nSizeX, server.alp.nSizeY))]
+    conn.close()
+    assert server.Stats()["errors"] == 4
+
+
+def test_wait_does_not_block_other_clients(server):
+    waiting = connect(server)
+    waiting.SeqAlloc(nbImg=2, bitDepth=8)
+    waiting.SeqPut(np.zeros((2, waiting.nSizeY, waiting.nSizeX), dtype=np.uint8))
+    waiting.Run(loop=True)
+    status = {}
+    thread = threading.Thread(target=lambda: status.update(waiting.Wait(timeout=0.5)))
+    thread.start()
+    time.sleep(0.05)
+
+    other = connect(server)
+    start = time.time()
+    other.SeqAlloc(nbImg=1, bitDepth=1)
+    other.Stats()
+    assert time.time() - start < 0.25
+    other.Close()
+
+    thread.join()
+    assert not status["finished"]
+    assert status["framesRemaining"] is None
+    assert status["time"] >= 0.5
+    waiting.Halt()
+    waiting.Close()
+
+
+def test_wait_finished(server):
+    client = connect(server)
+    SequenceId = client.SeqAlloc(nbImg=2, bitDepth=8)
+    client.SeqPut(np.zeros((2, client.nSizeY, client.nSizeX), dtype=np.uint8))
+    client.SetTiming(SequenceId, pictureTime=5000)
+    client.Run(loop=False)
+    status = client.Wait()
+    assert status["finished"]
+    client.Close()
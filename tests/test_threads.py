@@ -0,0 +1,115 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import ALP4
+
+
+@pytest.fixture
+def threaded(simulator):
+    device = ALP4.ALP4(library=simulator, threadSafe=True)
+    device.Initialize(verbose=False)
+    yield device
+    device.Halt()
+    device.Free()
+
+
+def runThreads(target, nThreads):
+    errors = []
+
+    def run(index):
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(nThreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@pytest.mark.parametrize("pool", [False, True])
+def test_concurrent_alloc_put_free(threaded, simulator, pool):
+    if pool:
+        threaded.EnablePool()
+
+    def work(index):
+        imgData = np.full((4, threaded.nSizeY, threaded.nSizeX), index, dtype=np.uint8)
+        for _ in range(20):
+            SequenceId = threaded.SeqAlloc(nbImg=4, bitDepth=8)
+            threaded.SeqPut(imgData, SequenceId=SequenceId, chunkSize=1)
+            threaded.SeqControl(ALP4.ALP_SEQ_REPEAT, index + 1, SequenceId)
+            assert threaded.SeqInquire(ALP4.ALP_SEQ_REPEAT, SequenceId) == index + 1
+            threaded.FreeSeq(SequenceId)
+
+    assert runThreads(work, 8) == []
+    assert threaded.Seqs == []
+    idle = set(info.SequenceId.value for info in threaded.pool.idle) if pool else set()
+    assert set(simulator.seqs) == idle
+    assert simulator.bytesTransferred == 8 * 20 * 4 * threaded.nSizeY * threaded.nSizeX
+
+
+def test_free_waits_for_upload(threaded, simulator):
+    simulator.latency = 0.1
+    SequenceId = threaded.SeqAlloc(nbImg=2, bitDepth=8)
+    imgData = np.zeros((2, threaded.nSizeY, threaded.nSizeX), dtype=np.uint8)
+    times = {}
+
+    def upload():
+        threaded.SeqPut(imgData, SequenceId=SequenceId)
+        times["put"] = time.time()
+
+    thread = threading.Thread(target=upload)
+    thread.start()
+    time.sleep(0.02)
+    threaded.FreeSeq(SequenceId)
+    times["free"] = time.time()
+    thread.join()
+    assert times["free"] >= times["put"]
+    assert SequenceId.value not in simulator.seqs
+
+
+def test_inquiries_during_upload(threaded, simulator):
+    simulator.latency = 0.2
+    SequenceId = threaded.SeqAlloc(nbImg=2, bitDepth=8)
+    imgData = np.zeros((2, threaded.nSizeY, threaded.nSizeX), dtype=np.uint8)
+    thread = threading.Thread(
+        target=threaded.SeqPut, args=(imgData,), kwargs={"SequenceId": SequenceId}
+    )
+    thread.start()
+    time.sleep(0.02)
+    start = time.time()
+    assert threaded.SeqInquire(ALP4.ALP_PICNUM, SequenceId) == 2
+    assert threaded.DevInquire(ALP4.ALP_AVAIL_MEMORY) > 0
+    assert threaded.ProjInquire(ALP4.ALP_PROJ_STATE) == ALP4.ALP_PROJ_IDLE
+    assert time.time() - start < 0.1
+    thread.join()
+
+
+def test_display_while_uploading(threaded, simulator):
+    simulator.latency = 0.01
+    displayed = threaded.SeqAlloc(nbImg=2, bitDepth=8)
+    threaded.SeqPut(np.zeros((2, threaded.nSizeY, threaded.nSizeX), dtype=np.uint8))
+    uploads = [threaded.SeqAlloc(nbImg=2, bitDepth=8) for _ in range(4)]
+
+    def work(index):
+        if index == len(uploads):
+            for _ in range(10):
+                threaded.Run(displayed)
+                threaded.Halt()
+            return
+        imgData = np.zeros((2, threaded.nSizeY, threaded.nSizeX), dtype=np.uint8)
+        for _ in range(5):
+            threaded.SeqPut(imgData, SequenceId=uploads[index])
+
+    assert runThreads(work, len(uploads) + 1) == []
+
+
+def test_not_thread_safe_by_default(dmd):
+    assert not dmd.threadSafe
+    assert dmd._seqLock(dmd.SeqAlloc()) is ALP4._NO_LOCK
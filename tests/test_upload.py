@@ -0,0 +1,82 @@
+import numpy as np
+
+import ALP4
+
+
+def putCalls(tracer):
+    calls = tracer.Calls()
+    return calls[calls["func"] == tracer.functions.index("AlpSeqPut")]
+
+
+def test_chunks(dmd, simulator):
+    tracer = dmd.EnableTrace()
+    dmd.SeqAlloc(nbImg=8, bitDepth=8)
+    imgData = np.zeros((8, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8)
+    dmd.SeqPut(imgData, chunkSize=3)
+    calls = putCalls(tracer)
+    frameBytes = dmd.nSizeY * dmd.nSizeX
+    assert calls["PicLoad"].tolist() == [3, 3, 2]
+    assert calls["nbytes"].tolist() == [3 * frameBytes, 3 * frameBytes, 2 * frameBytes]
+    assert simulator.bytesTransferred == imgData.nbytes
+
+
+def test_packed_chunks(dmd):
+    tracer = dmd.EnableTrace()
+    dmd.SeqAlloc(nbImg=5, bitDepth=1)
+    imgData = np.ones((5, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8)
+    dmd.SeqPut(imgData, autoPack=True, chunkSize=2)
+    calls = putCalls(tracer)
+    frameBytes = dmd.nSizeY * dmd.nSizeX // 8
+    assert calls["PicLoad"].tolist() == [2, 2, 1]
+    assert calls["nbytes"].tolist() == [2 * frameBytes, 2 * frameBytes, frameBytes]
+
+
+def test_chunks_with_offset(dmd):
+    tracer = dmd.EnableTrace()
+    dmd.SeqAlloc(nbImg=8, bitDepth=8)
+    # The buffer holds more pictures than loaded: chunk offsets follow the sequence geometry
+    imgData = np.zeros((8, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8)
+    dmd.SeqPut(imgData, PicOffset=2, PicLoad=4, chunkSize=3)
+    calls = putCalls(tracer)
+    assert calls["PicLoad"].tolist() == [3, 1]
+    assert calls["nbytes"].tolist() == [
+        3 * dmd.nSizeY * dmd.nSizeX,
+        dmd.nSizeY * dmd.nSizeX,
+    ]
+
+
+def test_small_buffer_is_sent_at_once(dmd):
+    tracer = dmd.EnableTrace()
+    dmd.SeqAlloc(nbImg=4, bitDepth=8)
+    # Less data than the pictures loaded (e.g. a packed buffer): no chunking
+    imgData = np.zeros(4 * dmd.nSizeY * dmd.nSizeX // 2, dtype=np.uint8)
+    dmd.SeqPut(imgData, chunkSize=1)
+    calls = putCalls(tracer)
+    assert calls["PicLoad"].tolist() == [0]
+    assert calls["nbytes"].tolist() == [imgData.nbytes]
+
+
+def test_tuned_chunk_size(dmd):
+    dmd.TuneUpload(bitDepths=(8,), chunkSizes=(2,), nbImg=4, repeat=1)
+    tracer = dmd.EnableTrace()
+    dmd.SeqAlloc(nbImg=4, bitDepth=8)
+    dmd.SeqPut(np.zeros((4, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8))
+    assert putCalls(tracer)["PicLoad"].tolist() == [2, 2]
+    assert dmd.SeqInquire(ALP4.ALP_BITPLANES) == 8
+
+
+def test_put_chunks_sparse_frames(dmd, simulator):
+    sparse = ALP4.SparseFrames(dmd.nSizeX, dmd.nSizeY, dmd.DMDType.value)
+    for k in range(3):
+        sparse.Append(points=[(k, k)])
+    dmd.SeqAlloc(nbImg=8, bitDepth=1)
+    dmd.SeqPutChunks(sparse, chunkSize=2)
+    assert simulator.bytesTransferred == 3 * dmd.nSizeY * dmd.nSizeX // 8
+    assert dmd.SeqInquire(ALP4.ALP_DATA_FORMAT) == ALP4.ALP_DATA_BINARY_TOPDOWN
+
+
+def test_put_random(dmd, simulator):
+    patterns = ALP4.RandomPatterns(dmd.nSizeX, dmd.nSizeY, DMDType=dmd.DMDType.value)
+    dmd.SeqAlloc(nbImg=5, bitDepth=1)
+    dmd.SeqPutRandom(patterns, chunkSize=2)
+    assert simulator.bytesTransferred == 5 * dmd.nSizeY * dmd.nSizeX // 8
@@ -0,0 +1,110 @@
+import threading
+
+import numpy as np
+
+import ALP4
+
+
+def load(dmd, nbImg, pictureTime):
+    SequenceId = dmd.SeqAlloc(nbImg=nbImg, bitDepth=8)
+    dmd.SeqPut(np.zeros((nbImg, dmd.nSizeY, dmd.nSizeX), dtype=np.uint8))
+    dmd.SetTiming(SequenceId, pictureTime=pictureTime)
+    return SequenceId
+
+
+def test_blocking(dmd):
+    load(dmd, 5, 5000)
+    dmd.Run(loop=False)
+    assert dmd.Wait() is None
+    assert dmd.ProjInquire(ALP4.ALP_PROJ_STATE) == ALP4.ALP_PROJ_IDLE
+
+
+def test_finished(dmd):
+    load(dmd, 5, 5000)
+    dmd.Run(loop=False)
+    status = dmd.Wait(timeout=5.0)
+    assert status["finished"]
+    assert not status["cancelled"]
+    assert status["framesRemaining"] == 0
+    assert status["time"] < 5.0
+
+
+def test_timeout(dmd):
+    load(dmd, 100, 10000)
+    dmd.Run(loop=False)
+    status = dmd.Wait(timeout=0.05)
+    assert not status["finished"]
+    assert not status["cancelled"]
+    assert 0 < status["framesRemaining"] <= 100
+    assert status["time"] >= 0.05
+
+
+def test_timeout_continuous(dmd):
+    load(dmd, 2, 5000)
+    dmd.Run(loop=True)
+    status = dmd.Wait(timeout=0.02, poll=0.005)
+    assert not status["finished"]
+    assert status["framesRemaining"] is None
+
+
+def test_cancel(dmd):
+    load(dmd, 100, 10000)
+    dmd.Run(loop=False)
+    cancel = threading.Event()
+    timer = threading.Timer(0.05, cancel.set)
+    timer.start()
+    try:
+        status = dmd.Wait(timeout=5.0, cancel=cancel)
+    finally:
+        timer.cancel()
+    assert status["cancelled"]
+    assert not status["finished"]
+    assert status["framesRemaining"] > 0
+    assert status["time"] < 1.0
+
+
+def test_cancel_after_end(dmd):
+    load(dmd, 2, 5000)
+    dmd.Run(loop=False)
+    cancel = threading.Event()
+    cancel.set()
+    dmd.Wait()
+    # A finished display is not reported as cancelled
+    status = dmd.Wait(cancel=cancel)
+    assert status["finished"]
+    assert not status["cancelled"]
+
+
+class StalledSimulator(ALP4.ALPSimulator):
+    # Display waiting for a trigger on its last frame
+    inquiries = 0
+
+    def AlpProjInquireEx(self, DeviceId, InquireType, UserStructPtr):
+        self.inquiries += 1
+        progress = UserStructPtr._obj
+        progress.nFlagse = 0
+        progress.nSequenceCounter = 1
+        progress.nFrameCounter = 1
+        progress.nFramesPerSubSequence = 2
+        progress.nPictureTime = 1000
+        return ALP4.ALP_OK
+
+
+def test_stalled_display():
+    simulator = StalledSimulator(nSizeX=256, nSizeY=32)
+    dmd = ALP4.ALP4(library=simulator)
+    dmd.Initialize(verbose=False)
+    status = dmd.Wait(timeout=0.5)
+    assert not status["finished"]
+    assert status["framesRemaining"] == 1
+    # The interval doubles up to 50 ms instead of polling continuously
+    assert simulator.inquiries < 30
+    dmd.Free()
+
+
+def test_progressing_display_is_not_slowed(dmd):
+    load(dmd, 20, 5000)
+    dmd.Run(loop=False)
+    status = dmd.Wait(timeout=5.0)
+    assert status["finished"]
+    assert status["time"] < 0.15